@@ -0,0 +1,291 @@
+"""
+offline benchmarks for frechet, run against a local stand-in for the census api and tiger servers
+
+    python -m benchmarks.run --repeat 20 --output results.json
+    python -m benchmarks.run --tracts 500 --vertices 200 --only load_shp
+    python -m benchmarks.run --fixtures recorded/  # serve recorded metadata instead of synthetic metadata
+    python -m benchmarks.run record recorded/ --dataset acs/acs5 --year 2020  # record metadata (needs network)
+
+The stand-in server (`tests.conftest.StandInServer`) serves synthetic metadata (or documents recorded from the live
+api), synthetic query responses, and synthetic tiger zips for one state, with `--counties` x `--tracts` units of
+about `--vertices` vertices each. Each benchmark reports latency percentiles, throughput, and the peak python memory
+allocated in one run (tracemalloc), as JSON.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from pathlib import Path
+from typing import *
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from frechet import cache, metadata, reference, settings, tiger, transport  # noqa: E402
+from frechet.census import Dataset  # noqa: E402
+from frechet.fips import County, State  # noqa: E402
+from frechet.url import CENSUS_API_BASE, TIGER_BASE  # noqa: E402
+from tests.conftest import DOCS_BASE, StandInServer, _clear_fips_caches, synthetic_tiger, tiger_zip  # noqa: E402
+
+YEAR = 2020
+TIGER_YEAR = 2021
+DATASET = "dec/pl"
+ST_FIPS, ST_ABBR = "24", "MD"
+
+
+class Benchmark(NamedTuple):
+    name: str
+    run: Callable[[], Any]
+    setup: Optional[Callable[[], None]] = None  # called before every run, not timed
+    nbytes: int = 0  # bytes processed per run, for throughput
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10, help="timed runs per benchmark")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs per benchmark, at least 1 primes caches")
+    parser.add_argument("--counties", type=int, default=4, help="counties in the synthetic state")
+    parser.add_argument("--tracts", type=int, default=50, help="tracts per county")
+    parser.add_argument("--vertices", type=int, default=100, help="approximate vertices per tract")
+    parser.add_argument("--vars", type=int, default=20, help="variables per query")
+    parser.add_argument("--fixtures", help="directory of recorded metadata documents, laid out as the api")
+    parser.add_argument("--only", nargs="+", help="only run benchmarks whose names start with these prefixes")
+    parser.add_argument("--output", help="write results to this file instead of stdout")
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ["record"]:
+        return record(argv[1:])
+    args = parser.parse_args(argv)
+    results = run(args)
+    out = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(out)
+    else:
+        print(out)
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    server = StandInServer()
+    tmp = tempfile.mkdtemp(prefix="frechet-bench-")
+    previous = transport.configure(
+        base_urls={
+            CENSUS_API_BASE: f"{server.url}/api/",
+            TIGER_BASE: f"{server.url}/tiger/",
+            DOCS_BASE: f"{server.url}/docs/",
+        }
+    )
+    patched = _isolate(cache_dir=tmp)
+    try:
+        fixture = _serve(server, args)
+        benchmarks = [
+            b
+            for b in _benchmarks(args, cache_dir=tmp, fixture=fixture)
+            if not args.only or any(b.name.startswith(x) for x in args.only)
+        ]
+        results = [_measure(b, repeat=args.repeat, warmup=args.warmup) for b in benchmarks]
+    finally:
+        _restore(patched)
+        transport.restore(previous)
+        server.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "parameters": {k: v for k, v in vars(args).items() if k != "output"},
+        "fixture": {k: v for k, v in fixture.items() if k != "vars"},
+        "results": results,
+    }
+
+
+def record(argv: List[str]):
+    """save the live metadata documents of datasets to a fixtures directory (see --fixtures)"""
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run record")
+    parser.add_argument("directory")
+    parser.add_argument("--dataset", nargs="+", default=[DATASET])
+    parser.add_argument("--year", type=int, default=YEAR)
+    args = parser.parse_args(argv)
+    paths = ["data.json"]
+    for dataset in args.dataset:
+        paths += [f"data/{args.year}/{dataset}/geography.json", f"data/{args.year}/{dataset}/variables.json"]
+    for path in paths:
+        dest = Path(args.directory) / path
+        os.makedirs(dest.parent, exist_ok=True)
+        dest.write_text(transport.get_text(CENSUS_API_BASE + path))
+        print(f"Recorded {path}")
+
+
+def _isolate(cache_dir: str) -> Dict[Tuple[Any, str], Any]:
+    """point module level settings at the temporary cache, as the test fixtures do"""
+    patches = {
+        (settings, "FRECHET_CACHE_DIR"): cache_dir,
+        (metadata, "METADATA_CACHE"): metadata.MetadataCache(cache_dir=None),
+        (reference, "SNAPSHOT_PATH"): Path(cache_dir) / "no-snapshot.pkl.gz",
+    }
+    previous = {}
+    for (module, name), value in patches.items():
+        previous[(module, name)] = getattr(module, name)
+        setattr(module, name, value)
+    _clear_fips_caches()
+    return previous
+
+
+def _restore(previous: Dict[Tuple[Any, str], Any]):
+    for (module, name), value in previous.items():
+        setattr(module, name, value)
+    _clear_fips_caches()
+
+
+def _serve(server: StandInServer, args: argparse.Namespace) -> Dict[str, Any]:
+    counties = [f"{2 * i + 1:03d}" for i in range(args.counties)]
+    variables = {
+        f"P1_{i:03d}N": {"label": f"!!Total:!!{i}", "concept": "RACE", "predicateType": "int"}
+        for i in range(1, args.vars + 1)
+    }
+    documents = {
+        "data.json": {"dataset": [{"c_dataset": DATASET.split("/"), "c_vintage": YEAR}]},
+        f"data/{YEAR}/{DATASET}/geography.json": {
+            "fips": [{"name": "tract", "requires": ["state", "county"], "wildcard": ["county"]}]
+        },
+        f"data/{YEAR}/{DATASET}/variables.json": {"variables": variables},
+    }
+    if args.fixtures:
+        for path in documents:
+            recorded = Path(args.fixtures) / path
+            if recorded.is_file():
+                documents[path] = json.loads(recorded.read_text())
+    for path, payload in documents.items():
+        server.add_json(f"/api/{path}", payload)
+
+    n_rows = len(counties) * args.tracts
+    tracts = [f"{j + 1:04d}00" for j in range(args.tracts)]
+
+    def query(path: str, query: Dict[str, List[str]]):
+        vars = query["get"][0].split(",")
+        rows = [vars + ["state", "county", "tract"]]
+        for county in counties:
+            for t, tract in enumerate(tracts):
+                rows.append([f"Tract {tract}" if v == "NAME" else str(t) for v in vars] + [ST_FIPS, county, tract])
+        return 200, json.dumps(rows).encode(), {"Content-Type": "application/json"}
+
+    server.add_handler(f"/api/data/{YEAR}/{DATASET}", query)
+    server.add("/docs/reference/state.txt", f"STATE|STUSAB|STATE_NAME|STATENS\n{ST_FIPS}|{ST_ABBR}|Maryland|01714934\n")
+    server.add(
+        f"/docs/reference/codes/files/st{ST_FIPS}_{ST_ABBR.lower()}_cou.txt",
+        "".join(f"{ST_ABBR},{ST_FIPS},{c},County {c},H1\n" for c in counties),
+    )
+
+    import shapely
+
+    gdf = synthetic_tiger(st_fips=ST_FIPS, counties=counties, n=args.tracts)
+    # squares are densified to about `vertices` vertices each, like real (wiggly) tract boundaries
+    gdf.geometry = shapely.segmentize(gdf.geometry.to_numpy(), max_segment_length=0.4 / args.vertices)
+    zips = {
+        f"TIGER{TIGER_YEAR}/TRACT/tl_{TIGER_YEAR}_{ST_FIPS}_tract": tiger_zip(gdf, f"tl_{TIGER_YEAR}_{ST_FIPS}_tract"),
+        f"GENZ{TIGER_YEAR}/shp/cb_{TIGER_YEAR}_{ST_FIPS}_tract_500k": tiger_zip(
+            gdf.assign(geometry=gdf.geometry.simplify(0.01)), f"cb_{TIGER_YEAR}_{ST_FIPS}_tract_500k"
+        ),
+    }
+    for subpath, body in zips.items():
+        server.add(f"/tiger/{subpath}.zip", body)
+    return {
+        "counties": counties,
+        "vars": list(variables)[: args.vars],
+        "query_rows": n_rows,
+        "tiger_units": len(gdf),
+        "tiger_zip_bytes": len(zips[f"TIGER{TIGER_YEAR}/TRACT/tl_{TIGER_YEAR}_{ST_FIPS}_tract"]),
+        "cb_zip_bytes": len(zips[f"GENZ{TIGER_YEAR}/shp/cb_{TIGER_YEAR}_{ST_FIPS}_tract_500k"]),
+    }
+
+
+def _benchmarks(args: argparse.Namespace, cache_dir: str, fixture: Dict[str, Any]) -> List[Benchmark]:
+    vars = fixture["vars"]
+    fips_map = {"state": ST_FIPS}
+    county_name = f"County {fixture['counties'][0]}"
+
+    def load_shp(**kwargs):
+        return tiger.load_shp(year=TIGER_YEAR, st_fips=ST_FIPS, geom="tracts", **kwargs)
+
+    def cold_metadata():
+        metadata.METADATA_CACHE = metadata.MetadataCache(cache_dir=None)
+
+    def clear_cache():
+        cache.manager(cache_dir).clear()
+
+    def query(**kwargs):
+        ds = Dataset(DATASET)
+        return ds.query(year=YEAR, geography="tract", vars=vars, fips_map=fips_map, census_api_key="bench", **kwargs)
+
+    def county():
+        return County.from_state_abbr_name(state_abbr=ST_ABBR, name=county_name)
+
+    def county_shp():
+        return county().shp(geom="tracts", year=TIGER_YEAR, cache=True)
+
+    tiger_bytes, cb_bytes = fixture["tiger_zip_bytes"], fixture["cb_zip_bytes"]
+
+    return [
+        Benchmark("query.cold", run=query, setup=cold_metadata),
+        Benchmark("query.warm", run=query),
+        Benchmark("query.cached", run=lambda: query(cache=True)),
+        Benchmark("query.typed", run=lambda: query(typed=True)),
+        Benchmark("query.arrow", run=lambda: query(arrow=True)),
+        Benchmark("load_shp.miss.tiger", run=lambda: load_shp(cache=True), setup=clear_cache, nbytes=tiger_bytes),
+        Benchmark("load_shp.miss.cb", run=lambda: load_shp(cache=True, cb=True), setup=clear_cache, nbytes=cb_bytes),
+        Benchmark("load_shp.nocache.tiger", run=lambda: load_shp(), nbytes=tiger_bytes),
+        # hits are primed by the warmup run
+        Benchmark("load_shp.hit.shp", run=lambda: load_shp(cache=True, cache_format="shp")),
+        Benchmark("load_shp.hit.parquet", run=lambda: load_shp(cache=True, cache_format="parquet")),
+        Benchmark("load_shp.hit.cb", run=lambda: load_shp(cache=True, cb=True)),
+        Benchmark("fips.state.cold", run=lambda: State.from_abbr(abbr=ST_ABBR), setup=_clear_fips_caches),
+        Benchmark("fips.state.warm", run=lambda: State.from_abbr(abbr=ST_ABBR)),
+        Benchmark("fips.county.cold", run=county, setup=_clear_fips_caches),
+        Benchmark("fips.county.warm", run=county),
+        Benchmark("county.shp", run=county_shp),
+    ]
+
+
+def _measure(benchmark: Benchmark, repeat: int, warmup: int) -> Dict[str, Any]:
+    for _ in range(warmup):
+        _call(benchmark)
+    seconds = np.array([_call(benchmark) for _ in range(repeat)])
+    # peak memory is measured in a separate run, tracemalloc slows down allocation heavy code
+    if benchmark.setup is not None:
+        benchmark.setup()
+    tracemalloc.start()
+    try:
+        benchmark.run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    p50, p90, p99 = np.percentile(seconds, [50, 90, 99])
+    result = {
+        "name": benchmark.name,
+        "runs": repeat,
+        "mean_ms": seconds.mean() * 1e3,
+        "p50_ms": p50 * 1e3,
+        "p90_ms": p90 * 1e3,
+        "p99_ms": p99 * 1e3,
+        "min_ms": seconds.min() * 1e3,
+        "throughput_per_s": 1 / seconds.mean(),
+        "peak_memory_mb": peak / 2 ** 20,
+    }
+    if benchmark.nbytes:
+        result["throughput_mb_per_s"] = benchmark.nbytes / 2 ** 20 / seconds.mean()
+    return result
+
+
+def _call(benchmark: Benchmark) -> float:
+    if benchmark.setup is not None:
+        benchmark.setup()
+    start = time.perf_counter()
+    benchmark.run()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main()
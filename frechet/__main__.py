@@ -0,0 +1,5 @@
+import sys
+
+from frechet.cli import main
+
+sys.exit(main())
@@ -0,0 +1,579 @@
+"""
+asyncio counterparts of the census query and boundary file apis, on aiohttp
+
+    from frechet import aio
+
+    async with aio.AsyncClient(max_concurrency=16) as client:
+        ds = await aio.AsyncDataset.create("dec/pl", client=client)
+        df, gdf = await asyncio.gather(
+            ds.query(year=2020, geography="tract", vars=["P1_001N"], fips_map={"state": "24"}),
+            aio.load_shp(year=2020, st_fips="24", geom="tracts", cache=True, client=client),
+        )
+
+Requests share the client's aiohttp session, at most `max_concurrency` at a time, with the retry policy, base urls,
+and scheduler (rate limits, adaptive concurrency, and priorities, see `frechet.scheduler`) of `frechet.transport`.
+Boundary zips are streamed to disk chunk by chunk. Blocking work (parsing responses and shapefiles, reading and writing
+the cache) runs in the client's executor, the event loop's default thread pool unless one is given, so the event loop
+never waits on it. Cancelling a task cancels its requests and removes its partial downloads. Functions called without a
+client open (and close) one of their own.
+
+Metadata is shared with the synchronous api through `frechet.metadata.METADATA_CACHE`, and boundary files and query
+results through FRECHET_CACHE_DIR.
+
+Requires aiohttp. Install frechet[async].
+"""
+import os
+import json
+import shutil
+import asyncio
+import logging
+import tempfile
+import zipfile
+import functools
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import *
+
+import pandas as pd
+
+from frechet import census, instrument, metadata, scheduler, settings, tiger, transport
+from frechet.cache import manager as cache_manager
+from frechet.census import QueryBatch, QueryFailure
+from frechet.geom import GEOGRAPHY
+from frechet.simplify import simplify_topology
+from frechet.util import CHUNK_SIZE, extract_zip, file_lock
+
+try:
+    import aiohttp
+except ImportError:
+    raise ImportError("The async api requires aiohttp. Install frechet[async].")
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+
+T = TypeVar("T")
+
+
+class AsyncResponse:
+    """
+    A response read in full, with the parts of the `requests.Response` interface used by frechet.
+
+    Args:
+        status_code (int): the http status
+        headers (Mapping): the response headers
+        content (bytes): the response body
+    """
+
+    def __init__(self, status_code: int, headers: Mapping[str, str], content: bytes, rsp: aiohttp.ClientResponse):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self._rsp = rsp
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size: int = 1) -> Iterator[bytes]:
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i : i + chunk_size]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise aiohttp.ClientResponseError(
+                self._rsp.request_info,
+                self._rsp.history,
+                status=self.status_code,
+                message=self._rsp.reason or "",
+                headers=self._rsp.headers,
+            )
+
+
+class AsyncClient:
+    """
+    An aiohttp session, bounded to `max_concurrency` requests in flight, and an executor for blocking work. Use as an
+    async context manager.
+
+    Args:
+        max_concurrency (int): maximum number of requests in flight
+        executor (Executor): runs blocking work (parsing, cache i/o), defaults to the event loop's default executor
+    """
+
+    def __init__(self, max_concurrency: int = 8, executor: Optional[Executor] = None):
+        self.max_concurrency = max_concurrency
+        self.executor = executor
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._waiting: Optional[ThreadPoolExecutor] = None
+        self._inflight: Dict[str, "asyncio.Future[Any]"] = {}
+
+    async def __aenter__(self) -> "AsyncClient":
+        config = transport.get_config()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=config.pool_maxsize),
+            timeout=aiohttp.ClientTimeout(sock_connect=config.timeout, sock_read=config.timeout),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._waiting is not None:
+            self._waiting.shutdown(wait=False)
+            self._waiting = None
+
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> AsyncResponse:
+        """
+        GET `url`, retrying transient failures as `frechet.transport.get` does.
+
+        Returns:
+            AsyncResponse: the final response, read in full. Error statuses are returned, not raised.
+        """
+        async with self._request(url, headers=headers) as rsp:
+            return AsyncResponse(rsp.status, rsp.headers, await rsp.read(), rsp)
+
+    async def download_zip(self, url: str, stem: Optional[str] = None) -> Optional[Tuple[str, int]]:
+        """
+        As `frechet.util.download_zip`, streaming the zipfile to disk and extracting it in the executor.
+
+        Returns:
+            tuple: the temporary directory holding the extracted files and the number of bytes downloaded, None if no
+                zipfile was found at `url`
+        """
+        tmp_dir = tempfile.mkdtemp(prefix="frechet-")
+        zip_path = os.path.join(tmp_dir, "download.zip")
+        nbytes = 0
+        try:
+            async with self._request(url) as rsp:
+                if rsp.status == 404:
+                    shutil.rmtree(tmp_dir)
+                    return None
+                rsp.raise_for_status()
+                with instrument.stage("zip.download"), open(zip_path, "wb") as f:
+                    async for chunk in rsp.content.iter_chunked(CHUNK_SIZE):
+                        await self.run(f.write, chunk)
+                        nbytes += len(chunk)
+            instrument.count("bytes", nbytes, source="zip")
+            await self.run(extract_zip, zip_path, stem=stem)
+        except zipfile.BadZipFile:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return None
+        except BaseException:  # including cancellation
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return tmp_dir, nbytes
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Returns:
+            the result of `func(*args, **kwargs)`, run in the executor
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, scheduler.bind(functools.partial(func, *args, **kwargs)))
+
+    async def _run_waiting(self, func: Callable[..., T], *args, **kwargs) -> T:
+        # for blocking work that waits on coroutines scheduled back onto the loop (which may need the executor),
+        # run on threads of its own so it cannot starve the executor
+        if self._waiting is None:
+            self._waiting = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="frechet-aio")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._waiting, scheduler.bind(functools.partial(func, *args, **kwargs)))
+
+    async def _once(self, key: str, factory: Callable[[], Awaitable[T]]) -> T:
+        # concurrent callers with the same key share one task, which is not cancelled with any one caller
+        if key not in self._inflight:
+            task = asyncio.ensure_future(factory())
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            self._inflight[key] = task
+        return await asyncio.shield(self._inflight[key])
+
+    @asynccontextmanager
+    async def _request(
+        self, url: str, headers: Optional[Dict[str, str]] = None
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        if self._session is None:
+            raise RuntimeError("AsyncClient is not open. Use it as `async with AsyncClient() as client:`.")
+        config = transport.get_config()
+        url = transport.resolve(url)
+        async with self._semaphore:
+            for attempt in range(config.retries + 1):
+                last_attempt = attempt == config.retries
+                permit = await transport.scheduler().acquire_async(url)
+                try:
+                    rsp = await self._session.get(url, headers=headers)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    permit.release(None)
+                    instrument.count("http.requests", status="error")
+                    if last_attempt:
+                        raise
+                    logging.warning(f"Request to {url} failed ({e!r}), retrying")
+                    await asyncio.sleep(transport._backoff(config, attempt))
+                    continue
+                except BaseException:  # including cancellation
+                    permit.discard()
+                    raise
+                delay = transport._retry_after(rsp)
+                instrument.count("http.requests", status=str(rsp.status))
+                if rsp.status not in transport.RETRY_STATUSES or last_attempt:
+                    break
+                permit.release(rsp.status, retry_after=delay)
+                logging.warning(f"Request to {url} returned {rsp.status}, retrying")
+                rsp.release()
+                await asyncio.sleep(delay if delay is not None else transport._backoff(config, attempt))
+            # the slot is held while the body is read, with the latency of the response headers
+            latency = permit.elapsed()
+            try:
+                yield rsp
+            finally:
+                rsp.release()
+                permit.release(rsp.status, retry_after=delay, latency=latency, empty=transport._empty(rsp))
+
+
+@asynccontextmanager
+async def _client(client: Optional[AsyncClient]) -> AsyncIterator[AsyncClient]:
+    if client is not None:
+        yield client
+    else:
+        async with AsyncClient() as client:
+            yield client
+
+
+async def _gather(aws: Iterable[Awaitable[T]]) -> List[T]:
+    """as `asyncio.gather`, cancelling the other awaitables when one fails"""
+    tasks = [asyncio.ensure_future(x) for x in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+async def get_metadata(path: str, client: Optional[AsyncClient] = None) -> Dict[str, Any]:
+    """
+    As `frechet.metadata.get_metadata`.
+    """
+    async with _client(client) as client:
+        return await metadata._metadata_cache().get_async(path, client)
+
+
+async def available_datasets(client: Optional[AsyncClient] = None) -> pd.DataFrame:
+    """
+    As `frechet.census.available_datasets`.
+    """
+    async with _client(client) as client:
+        await get_metadata("data.json", client)
+        return await client.run(census.available_datasets)
+
+
+class AsyncDataset:
+    """
+    Async counterpart of `frechet.census.Dataset`, create with `await AsyncDataset.create(name)`. Metadata is fetched
+    asynchronously and the synchronous dataset's validation and request building are reused.
+
+    Args:
+        dataset (Dataset): the synchronous dataset
+        client (AsyncClient): client for requests, if None each call opens its own
+    """
+
+    def __init__(self, dataset: census.Dataset, client: Optional[AsyncClient] = None):
+        self.dataset = dataset
+        self.client = client
+
+    @classmethod
+    async def create(cls, name: str, client: Optional[AsyncClient] = None) -> "AsyncDataset":
+        """
+        Args:
+            name: dataset name, e.g. "acs/acs5"
+            client: client for requests, if None each call opens its own
+
+        Returns:
+            AsyncDataset: the validated dataset
+        """
+        async with _client(client) as c:
+            await get_metadata("data.json", c)
+            return cls(await c.run(census.Dataset, name), client=client)
+
+    @property
+    def name(self) -> str:
+        return self.dataset.name
+
+    async def available_years(self) -> List[int]:
+        async with _client(self.client) as client:
+            await get_metadata("data.json", client)
+            return await client.run(lambda: self.dataset.available_years)
+
+    async def available_geographies(self, year: int) -> List[str]:
+        async with _client(self.client) as client:
+            await self._prime(year, client, variables=False)
+            return await client.run(self.dataset.available_geographies, year=year)
+
+    async def variables(self, year: int) -> pd.DataFrame:
+        async with _client(self.client) as client:
+            await self._prime(year, client, geographies=False)
+            return await client.run(self.dataset.variables, year=year)
+
+    async def query(
+        self,
+        year: int,
+        geography: str,
+        vars: List[str],
+        fips_map: Dict[str, str],
+        census_api_key: Optional[str] = None,
+        cache: bool = False,
+        refresh: bool = False,
+        typed: bool = False,
+        arrow: bool = False,
+    ) -> pd.DataFrame:
+        """
+        As `frechet.census.Dataset.query`. Chunks of more than MAX_QUERY_VARS variables are requested concurrently,
+        within the client's concurrency limit.
+        """
+        async with _client(self.client) as client:
+            await self._prime(year, client)
+            request = dict(year=year, geography=geography, fips_map=fips_map, census_api_key=census_api_key)
+            if not cache:
+                urls = await client.run(self.dataset._request_url, vars=vars, **request)
+                df = await self._fetch_chunks(urls, client, arrow=arrow)
+            else:
+                df = await self._query_cached(vars, request, refresh=refresh, client=client, arrow=arrow)
+            if typed:
+                df = await client.run(self.dataset._coerce_types, df, year=year, vars=vars)
+            return df
+
+    async def query_many(
+        self,
+        year: int,
+        geography: str,
+        vars: List[str],
+        fips_maps: Union[Iterable[Dict[str, str]], Literal["states"]],
+        census_api_key: Optional[str] = None,
+        cache: bool = False,
+        refresh: bool = False,
+        typed: bool = False,
+        arrow: bool = False,
+        priority: scheduler.PRIORITY = "bulk",
+    ) -> QueryBatch:
+        """
+        As `frechet.census.Dataset.query_many`, with requests in flight bounded by the client's concurrency limit.
+        """
+        async with _client(self.client) as client:
+            if isinstance(fips_maps, str):
+                if fips_maps != "states":
+                    raise ValueError(f"Unrecognized fips_maps {fips_maps}. Pass a list of fips_maps or 'states'.")
+                from frechet.fips import _load_states
+
+                fips_maps = [{"state": x} for x in (await client.run(_load_states))["STATE"]]
+            fips_maps = list(fips_maps)
+            await self._prime(year, client)
+            # validate every request once, before any is sent
+            await client.run(
+                self.dataset._request_urls,
+                year=year,
+                geography=geography,
+                vars=vars,
+                fips_maps=fips_maps,
+                census_api_key=census_api_key,
+            )
+            dataset = AsyncDataset(self.dataset, client=client)
+            kwargs = dict(year=year, geography=geography, vars=vars, census_api_key=census_api_key, arrow=arrow)
+            with scheduler.priority(priority):
+                results = await asyncio.gather(
+                    *(dataset.query(fips_map=x, cache=cache, refresh=refresh, **kwargs) for x in fips_maps),
+                    return_exceptions=True,
+                )
+            frames, failures = [], []
+            for fips_map, result in zip(fips_maps, results):
+                if isinstance(result, asyncio.CancelledError):
+                    raise result
+                if isinstance(result, Exception):
+                    logging.warning(f"Query for {self.name}-{year} {geography} {fips_map} failed: {result}")
+                    failures.append(QueryFailure(fips_map=fips_map, error=result))
+                else:
+                    frames.append(result)
+            data = pd.concat(frames, ignore_index=True) if len(frames) > 0 else pd.DataFrame()
+            if typed and len(frames) > 0:
+                data = await client.run(self.dataset._coerce_types, data, year=year, vars=vars)
+            return QueryBatch(data=data, failures=failures)
+
+    async def _prime(self, year: int, client: AsyncClient, geographies: bool = True, variables: bool = True):
+        # fetch the metadata the synchronous dataset reads into the shared cache, so it never reaches the network
+        paths = ["data.json"]
+        if geographies:
+            paths.append(f"data/{year}/{self.name}/geography.json")
+        if variables:
+            paths.append(f"data/{year}/{self.name}/variables.json")
+        await _gather(get_metadata(path, client) for path in paths)
+
+    async def _fetch_chunks(self, urls: List[str], client: AsyncClient, arrow: bool = False) -> pd.DataFrame:
+        loop = asyncio.get_running_loop()
+
+        async def fetch(i: int, url: str) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+            start = loop.time()
+            with instrument.stage("census.request"):
+                rsp = await client.get(url)
+            df = await client.run(census.Dataset._frame, rsp, arrow=arrow)
+            return df, {"chunk": i, "columns": df.shape[1], "rows": len(df), "seconds": loop.time() - start}
+
+        results = await _gather(fetch(i, url) for i, url in enumerate(urls))
+        df = await client.run(census._join_chunks, [x[0] for x in results])
+        df.attrs["chunk_timings"] = [x[1] for x in results]
+        return df
+
+    async def _query_cached(
+        self, vars: List[str], request: Dict[str, Any], refresh: bool, client: AsyncClient, arrow: bool = False
+    ) -> pd.DataFrame:
+        from frechet.query_cache import query_cache
+
+        loop = asyncio.get_running_loop()
+
+        def fetch(missing: List[str]) -> pd.DataFrame:
+            # called by the query cache, holding the entry's lock, on a waiting thread
+            urls = self.dataset._request_url(vars=missing, **request)
+            return asyncio.run_coroutine_threadsafe(self._fetch_chunks(urls, client, arrow=arrow), loop).result()
+
+        def cached_query() -> pd.DataFrame:
+            self.dataset._validate_vars(year=request["year"], vars=vars)
+            results = query_cache()
+            key = results.request_key(
+                dataset=self.name, year=request["year"], geography=request["geography"], fips_map=request["fips_map"]
+            )
+            df = results.query(key=key, vars=vars, fetch=fetch, refresh=refresh)
+            return census._arrow_backed(df) if arrow else df
+
+        return await client._run_waiting(cached_query)
+
+
+async def load_shp(
+    year: int,
+    st_fips: str,
+    geom: GEOGRAPHY,
+    cache: bool = False,
+    cb: bool = False,
+    cache_format: Optional[tiger.CACHE_FORMAT] = None,
+    columns: Optional[List[str]] = None,
+    county_fips: Optional[str] = None,
+    tolerance: Optional[float] = None,
+    zoom: Optional[int] = None,
+    client: Optional[AsyncClient] = None,
+) -> Union["gpd.GeoDataFrame", pd.DataFrame]:
+    """
+    As `frechet.tiger.load_shp`. The boundary file is downloaded asynchronously, then read (and, with cache=True,
+    cached) in the client's executor.
+
+    Args:
+        client: client for requests, if None one is opened for the call
+    """
+    subpath, fname, cache_format = tiger._resolve(
+        year=year, st_fips=st_fips, geom=geom, cb=cb, cache_format=cache_format
+    )
+    tolerance = tiger._resolve_tolerance(tolerance=tolerance, zoom=zoom)
+    tiger._validate_county_fips(county_fips=county_fips)
+    load = functools.partial(
+        tiger.load_shp,
+        year=year,
+        st_fips=st_fips,
+        geom=geom,
+        cache=cache,
+        cb=cb,
+        cache_format=cache_format,
+        columns=columns,
+        county_fips=county_fips,
+        tolerance=tolerance,
+    )
+    async with _client(client) as client:
+        if settings.FRECHET_CACHE_DIR is not None and await client.run(_available, subpath, cache_format, tolerance):
+            return await client.run(load)
+        if cache:
+            await prefetch_shp(year=year, st_fips=st_fips, geom=geom, cb=cb, cache_format=cache_format, client=client)
+            return await client.run(load)
+        url = tiger.TIGER_BASE + subpath + ".zip"
+        result = await client.download_zip(url, stem=Path(fname).stem)
+        if result is None:
+            raise tiger.ShpNotFound(f"No boundary files found at {url}")
+        try:
+            return await client.run(_parse, Path(result[0]) / fname, columns, county_fips, tolerance)
+        finally:
+            await client.run(shutil.rmtree, result[0], ignore_errors=True)
+
+
+async def prefetch_shp(
+    year: int,
+    st_fips: str,
+    geom: GEOGRAPHY,
+    cb: bool = False,
+    cache_format: Optional[tiger.CACHE_FORMAT] = None,
+    client: Optional[AsyncClient] = None,
+) -> int:
+    """
+    As `frechet.tiger.prefetch_shp`. Concurrent prefetches of the same file through one client download it once.
+
+    Returns:
+        int: number of bytes downloaded, 0 if the file was already cached
+    """
+    if settings.FRECHET_CACHE_DIR is None:
+        raise ValueError("Attempting to cache download without setting FRECHET_CACHE_DIR. Please add to .env.")
+    subpath, fname, cache_format = tiger._resolve(
+        year=year, st_fips=st_fips, geom=geom, cb=cb, cache_format=cache_format
+    )
+
+    async def prefetch(client: AsyncClient) -> int:
+        if await client.run(tiger._is_cached, subpath, cache_format=cache_format, migrate=False):
+            return 0
+        if await client.run(_locked, subpath, tiger._is_cached, subpath, cache_format=cache_format, fname=fname):
+            return 0
+        url = tiger.TIGER_BASE + subpath + ".zip"
+        result = await client.download_zip(url, stem=Path(fname).stem)
+        if result is None:
+            raise tiger.ShpNotFound(f"No boundary files found at {url}")
+        result_dir, nbytes = result
+        try:
+            await client.run(
+                _locked, subpath, _install, result_dir, subpath=subpath, fname=fname, cache_format=cache_format
+            )
+        finally:
+            await client.run(shutil.rmtree, result_dir, ignore_errors=True)
+        return nbytes
+
+    async with _client(client) as client:
+        return await client._once(f"shp:{subpath}.{cache_format}", functools.partial(prefetch, client))
+
+
+def _locked(entry: str, func: Callable[..., T], *args, **kwargs) -> T:
+    """`func(*args, **kwargs)`, holding the lock on the cache entry `entry`"""
+    with file_lock(tiger._cache_path(entry) + ".lock"):
+        return func(*args, **kwargs)
+
+
+def _install(result_dir: str, subpath: str, fname: str, cache_format: tiger.CACHE_FORMAT):
+    # another process may have cached the file while this one was downloading it
+    if not tiger._is_cached(subpath, cache_format=cache_format, fname=fname):
+        tiger._install(result_dir, subpath=subpath, fname=fname, cache_format=cache_format)
+
+
+def _available(subpath: str, cache_format: tiger.CACHE_FORMAT, tolerance: Optional[float]) -> bool:
+    """whether `tiger.load_shp` can be served from the cache (possibly after migrating or simplifying an entry)"""
+    manager = cache_manager(settings.FRECHET_CACHE_DIR)
+    keys = [subpath] if cache_format == "shp" else [f"{subpath}.{cache_format}", subpath]
+    if tolerance is not None:
+        level = tiger._level(subpath, tolerance)
+        keys = ([level] if cache_format == "shp" else [f"{level}.{cache_format}"]) + keys
+    return any(manager.lookup(key) for key in keys)
+
+
+def _parse(
+    path: Path, columns: Optional[List[str]], county_fips: Optional[str], tolerance: Optional[float]
+) -> Union["gpd.GeoDataFrame", pd.DataFrame]:
+    if tolerance is None:
+        return tiger._project(tiger._load_tiger(path, county_fips=county_fips), columns=columns)
+    gdf = simplify_topology(tiger._load_tiger(path), tolerance)
+    return tiger._project(tiger._filter(gdf, county_fips=county_fips), columns=columns)
@@ -0,0 +1,204 @@
+"""
+arrow parsing of census api responses
+
+The api answers a query with a JSON array of arrays: a header row, then one row of strings (or nulls) per unit.
+`iter_batches` decodes the rows incrementally as the body arrives and collects them, `batch_size` rows at a time, into
+arrow record batches of string columns. Only one batch of rows is ever held as Python objects, so a large response
+(e.g. 200k+ blocks) never materializes as a list of lists. `read_table` collects the batches into a `pyarrow.Table`,
+`to_pandas` wraps a table as an arrow backed DataFrame without copying it, and `write_parquet` writes the batches
+straight to a parquet file.
+
+    with transport.get(url, stream=True) as rsp:
+        table = read_table(rsp.iter_content(CHUNK_SIZE))
+
+Requires pyarrow (and pandas>=1.5 for `to_pandas`).
+"""
+import os
+import re
+import json
+import codecs
+import itertools
+from typing import *
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    raise ImportError("Arrow parsing of census api responses requires pyarrow. Install frechet[parquet].")
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+BATCH_SIZE = 1 << 16  # rows
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def iter_batches(chunks: Iterable[bytes], batch_size: int = BATCH_SIZE) -> Iterator[pa.RecordBatch]:
+    """
+    Args:
+        chunks: the response body, in chunks of any size (e.g. `requests.Response.iter_content`)
+        batch_size: maximum number of rows per batch
+
+    Returns:
+        iterator: record batches of string columns named by the header row. At least one (possibly empty) batch is
+            yielded, so the columns of a response without rows are known.
+
+    Raises:
+        ValueError: if the body is not an array of equally long arrays
+    """
+    rows = _iter_rows(chunks)
+    header = next(rows, None)
+    if header is None:
+        raise ValueError("Malformed census api response: no header row.")
+    schema = pa.schema([(str(name), pa.string()) for name in header])
+    emitted = False
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if len(batch) == 0 and emitted:
+            return
+        yield _record_batch(batch, schema)
+        emitted = True
+        if len(batch) < batch_size:
+            return
+
+
+def read_table(chunks: Iterable[bytes], batch_size: int = BATCH_SIZE) -> pa.Table:
+    """
+    Returns:
+        pyarrow.Table: the response body `chunks` as a table of string columns (see `iter_batches`)
+    """
+    batches = list(iter_batches(chunks, batch_size=batch_size))
+    return pa.Table.from_batches(batches, schema=batches[0].schema)
+
+
+def to_pandas(table: pa.Table) -> "pd.DataFrame":
+    """
+    Returns:
+        pd.DataFrame: `table` with arrow backed (`pd.ArrowDtype`) columns, sharing the table's buffers
+    """
+    import pandas as pd
+
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def write_parquet(batches: Iterable[pa.RecordBatch], path: Union[str, os.PathLike], compression: str = "zstd") -> int:
+    """
+    Write record batches (e.g. from `iter_batches`) to a parquet file as they arrive, without collecting the table.
+    The file is written to a temporary path and moved into place once complete.
+
+    Args:
+        batches: at least one batch, all with the same schema
+        path: the parquet file to write
+        compression: parquet compression codec
+
+    Returns:
+        int: the number of rows written
+    """
+    import pyarrow.parquet as pq
+
+    path = os.fspath(path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    nrows = 0
+    try:
+        writer = None
+        try:
+            for batch in batches:
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, batch.schema, compression=compression)
+                writer.write_batch(batch)
+                nrows += batch.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            raise ValueError("No record batches to write.")
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return nrows
+
+
+def _record_batch(rows: List[list], schema: pa.Schema) -> pa.RecordBatch:
+    # the rows are converted to arrow in one call, as a list array whose values are the cells in row-major order, and
+    # each column is then gathered from the values with a strided take, rather than transposing the rows in Python
+    width = len(schema)
+    try:
+        lists = pa.array(rows, type=pa.list_(pa.string()))
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        # some endpoints report numbers unquoted, kept as strings like the rest of the response
+        lists = pa.array([[None if x is None else str(x) for x in row] for row in rows], type=pa.list_(pa.string()))
+    if lists.null_count > 0 or pc.any(pc.not_equal(pc.list_value_length(lists), width)).as_py():
+        raise ValueError(f"Malformed census api response: rows do not all have {width} values.")
+    values = lists.flatten()
+    columns = [values.take(pa.array(np.arange(i, len(values), width))) for i in range(width)]
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def _iter_rows(chunks: Iterable[bytes]) -> Iterator[list]:
+    """
+    the rows of a JSON array of arrays, decoded from the text buffered so far. A row cut off at the end of a chunk
+    does not decode (arrays only close at their last bracket), and is retried once more text arrives.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    text, pos = "", 0
+    # what may follow: "open" the outer "[", "first" a row or "]", "row" a row, "next" "," or "]", "end" nothing
+    expect = "open"
+    for chunk in itertools.chain(chunks, [None]):
+        final = chunk is None
+        text = text[pos:] + utf8.decode(b"" if final else chunk, final=final)
+        pos = 0
+        while True:
+            pos = _WHITESPACE.match(text, pos).end()
+            if pos == len(text):
+                break
+            char = text[pos]
+            if expect == "open" and char == "[":
+                expect, pos = "first", pos + 1
+            elif expect in ("first", "next") and char == "]":
+                expect, pos = "end", pos + 1
+            elif expect == "next" and char == ",":
+                expect, pos = "row", pos + 1
+            elif expect in ("first", "row") and char == "[":
+                slab, end = _decode_slab(text, pos)
+                if slab is not None:
+                    yield from slab
+                    expect, pos = "next", end
+                    continue
+                try:
+                    row, end = decoder.raw_decode(text, pos)
+                except json.JSONDecodeError as e:
+                    if final:
+                        raise ValueError(f"Malformed census api response: {e}")
+                    break  # wait for the rest of the row
+                yield row
+                expect, pos = "next", end
+            else:
+                raise ValueError(f"Malformed census api response: unexpected {text[pos:pos + 20]!r}.")
+    if expect != "end":
+        raise ValueError("Malformed census api response: truncated.")
+
+
+def _decode_slab(text: str, pos: int) -> Tuple[Optional[List[list]], int]:
+    """
+    every complete row from `pos` on, decoded with one call to the json parser rather than a call per row. Rows end
+    at one of the last two closing brackets of `text` (the last may close the outer array), unless the text ends in
+    the middle of a string holding brackets, in which case None is returned and rows are decoded one at a time.
+    """
+    end = len(text)
+    for _ in range(2):
+        end = text.rfind("]", pos, end)
+        if end < 0:
+            break
+        try:
+            slab = json.loads(f"[{text[pos:end + 1]}]")
+        except json.JSONDecodeError:
+            continue
+        if all(isinstance(row, list) for row in slab):
+            return slab, end + 1
+        break
+    return None, pos
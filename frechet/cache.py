@@ -0,0 +1,261 @@
+"""
+size-bounded management of FRECHET_CACHE_DIR
+
+Cached boundary files (and other cache entries) are tracked in a sqlite manifest at FRECHET_CACHE_DIR/manifest.sqlite
+recording each entry's size, last access time, and checksum. An entry is a file, or a directory such as an extracted
+shapefile, identified by its path relative to the cache directory. When FRECHET_CACHE_MAX_BYTES is set, the least
+recently used entries are evicted as new entries are added. Files that existed before the manifest are adopted when
+it is first created. Entries under `metadata/` and `search/` are managed by `frechet.metadata` and `frechet.search`
+and are not tracked.
+"""
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import *
+
+import pandas as pd
+
+from frechet import settings
+
+MANIFEST = "manifest.sqlite"
+UNMANAGED = ["metadata", "search"]
+SHP_PARTS = [".shp", ".shx", ".dbf"]  # files without which a shapefile cannot be read
+
+
+class CacheManager:
+    """
+    Args:
+        cache_dir (str): the cache directory
+        max_bytes (int): maximum total size of cached entries, defaults to FRECHET_CACHE_MAX_BYTES (unbounded if that is
+            not set)
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: Optional[int] = None):
+        self.cache_dir = Path(os.path.expanduser(cache_dir))
+        self.max_bytes = settings.FRECHET_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._local = threading.local()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        new = not (self.cache_dir / MANIFEST).exists()
+        with self._db() as db:
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    checksum TEXT NOT NULL
+                )
+                """
+            )
+        if new:
+            self.adopt()
+
+    def lookup(self, key: str) -> bool:
+        """
+        Check the manifest for `key`, recording the access if present.
+
+        Args:
+            key: path of the entry relative to the cache directory
+
+        Returns:
+            bool: True if the entry is cached
+        """
+        with self._db() as db:
+            cur = db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            return cur.rowcount > 0
+
+    def register(self, key: str):
+        """
+        Record the (already written) entry at `key`, then evict least recently used entries if the cache is over size.
+
+        Args:
+            key: path of the entry relative to the cache directory
+        """
+        path = self.cache_dir / key
+        size, checksum = _size(path), _checksum(path)
+        now = time.time()
+        with self._db() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, size, created, last_access, checksum) VALUES (?, ?, ?, ?, ?)",
+                (key, size, now, now, checksum),
+            )
+        if self.max_bytes is not None:
+            self.prune(max_bytes=self.max_bytes, keep=[key])
+
+    def remove(self, key: str):
+        """delete the entry at `key` from disk and the manifest"""
+        _delete(self.cache_dir / key)
+        with self._db() as db:
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def entries(self) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame: one row per entry with its key, size (bytes), created and last_access (unix times), and
+                checksum, most recently used first
+        """
+        with self._db() as db:
+            rows = db.execute(
+                "SELECT key, size, created, last_access, checksum FROM entries ORDER BY last_access DESC"
+            ).fetchall()
+        return pd.DataFrame(rows, columns=["key", "size", "created", "last_access", "checksum"])
+
+    def size(self) -> int:
+        """
+        Returns:
+            int: total size (bytes) of cached entries
+        """
+        with self._db() as db:
+            return db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def prune(self, max_bytes: Optional[int] = None, keep: Sequence[str] = ()) -> List[str]:
+        """
+        Evict least recently used entries until the cache fits in `max_bytes`.
+
+        Args:
+            max_bytes: target size, defaults to the manager's max_bytes
+            keep: keys that are never evicted
+
+        Returns:
+            list: evicted keys
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        if max_bytes is None:
+            return []
+        total = self.size()
+        evicted = []
+        for key, size in self.entries()[["key", "size"]].iloc[::-1].itertuples(index=False):
+            if total <= max_bytes:
+                break
+            if key in keep:
+                continue
+            logging.info(f"Evicting {key} ({size} bytes) from cache")
+            self.remove(key)
+            total -= size
+            evicted.append(key)
+        return evicted
+
+    def verify(self, repair: bool = False) -> List[str]:
+        """
+        Check that every entry exists, is complete, and matches its recorded checksum.
+
+        Args:
+            repair: if True, remove entries that fail verification
+
+        Returns:
+            list: keys of entries that failed verification
+        """
+        failed = []
+        for key, checksum in self.entries()[["key", "checksum"]].itertuples(index=False):
+            path = self.cache_dir / key
+            if not path.exists() or not _complete(path) or _checksum(path) != checksum:
+                logging.warning(f"Cache entry {key} failed verification")
+                failed.append(key)
+                if repair:
+                    self.remove(key)
+        return failed
+
+    def clear(self):
+        """remove every tracked entry"""
+        for key in self.entries()["key"]:
+            self.remove(key)
+
+    def adopt(self) -> List[str]:
+        """
+        Register complete entries found on disk but missing from the manifest.
+
+        Returns:
+            list: adopted keys
+        """
+        known = set(self.entries()["key"])
+        adopted = []
+        for path in _find_entries(self.cache_dir):
+            key = path.relative_to(self.cache_dir).as_posix()
+            if key not in known and _complete(path):
+                self.register(key)
+                adopted.append(key)
+        return adopted
+
+    def _db(self) -> sqlite3.Connection:
+        # one connection per thread (and process), sqlite connections cannot be shared between either
+        conn, pid = getattr(self._local, "conn", (None, None))
+        if conn is None or pid != os.getpid():
+            conn = sqlite3.connect(self.cache_dir / MANIFEST, timeout=60, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = (conn, os.getpid())
+        return conn
+
+
+_managers: Dict[str, CacheManager] = {}
+_managers_lock = threading.Lock()
+
+
+def manager(cache_dir: Optional[str] = None) -> CacheManager:
+    """
+    Args:
+        cache_dir: the cache directory, defaults to FRECHET_CACHE_DIR
+
+    Returns:
+        CacheManager: the shared manager for `cache_dir`
+    """
+    cache_dir = settings.FRECHET_CACHE_DIR if cache_dir is None else cache_dir
+    if cache_dir is None:
+        raise ValueError("FRECHET_CACHE_DIR is not set. Please add to .env.")
+    with _managers_lock:
+        if cache_dir not in _managers:
+            _managers[cache_dir] = CacheManager(cache_dir)
+        return _managers[cache_dir]
+
+
+def _find_entries(root: Path) -> Iterator[Path]:
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel = Path(dirpath).relative_to(root)
+        if rel.parts and rel.parts[0] in UNMANAGED:
+            dirnames[:] = []
+            continue
+        if any(f.endswith(".shp") for f in filenames):
+            dirnames[:] = []
+            yield Path(dirpath)
+            continue
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for f in filenames:
+            if not (f == MANIFEST or f.startswith(MANIFEST) or f.endswith((".lock", ".tmp")) or f.startswith(".")):
+                yield Path(dirpath) / f
+
+
+def _files(path: Path) -> List[Path]:
+    return sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+
+
+def _size(path: Path) -> int:
+    return sum(p.stat().st_size for p in _files(path))
+
+
+def _checksum(path: Path) -> str:
+    h = hashlib.sha256()
+    for p in _files(path):
+        h.update(p.relative_to(path).as_posix().encode() if path.is_dir() else b"")
+        with open(p, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def _complete(path: Path) -> bool:
+    if not path.is_dir():
+        return path.is_file()
+    stems = {p.name.split(".")[0] for p in path.iterdir() if p.suffix == ".shp"}
+    return all((path / f"{stem}{ext}").is_file() for stem in stems for ext in SHP_PARTS)
+
+
+def _delete(path: Path):
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    elif path.exists():
+        path.unlink()
@@ -1,16 +1,25 @@
-from multiprocessing.sharedctypes import Value
-import requests
-import json
-from functools import cached_property, lru_cache
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from functools import cached_property
 
+import numpy as np
 import pandas as pd
 
+from frechet import instrument, scheduler, settings, transport
 from frechet.url import CENSUS_API_BASE
+from frechet.metadata import get_metadata
 from frechet.geom import GEOGRAPHY, PARENT
-from frechet.settings import CENSUS_API_KEY
+from frechet.scheduler import PRIORITY
 
 from typing import *
 
+if TYPE_CHECKING:
+    import geopandas as gpd
+    import requests
+
 GEOM_NAME_MAP: Dict[GEOGRAPHY, str] = {
     "tracts": "tract",
     "block_groups": "block group",
@@ -19,10 +28,47 @@ GEOM_NAME_MAP: Dict[GEOGRAPHY, str] = {
 }
 
 
-@lru_cache
+NON_VARIABLES = ["for", "in", "ucgid"]
+MAX_QUERY_VARS = 50  # census api limit on variables per request, including NAME
+# values reported in place of estimates that are missing, suppressed, or not applicable
+CENSUS_SENTINELS = [-999999999, -888888888, -666666666, -555555555, -333333333, -222222222]
+NUMERIC_TYPES = {"int": "Int64", "long": "Int64", "float": "float64"}  # predicateType to dtype
+
+
+class QueryError(Exception):
+    ...
+
+
+@dataclass
+class QueryFailure:
+    """
+    A request from `Dataset.query_many` that did not succeed.
+
+    Args:
+        fips_map (dict): the fips_map of the failed request
+        error (Exception): the exception raised by the request
+    """
+
+    fips_map: Dict[str, str]
+    error: Exception
+
+
+@dataclass
+class QueryBatch:
+    """
+    Results of `Dataset.query_many`.
+
+    Args:
+        data (pd.DataFrame): concatenated results of the successful requests
+        failures (list): the requests that failed
+    """
+
+    data: pd.DataFrame
+    failures: List[QueryFailure]
+
+
 def available_datasets() -> pd.DataFrame:
-    rsp = requests.get(f"{CENSUS_API_BASE}data.json")
-    df = pd.DataFrame.from_dict(json.loads(rsp.content)["dataset"])
+    df = pd.DataFrame.from_dict(get_metadata("data.json")["dataset"])
     df["name"] = df["c_dataset"].apply(lambda x: "/".join(x))
     df = df.loc[df["c_vintage"].notna()].copy()
     df["year"] = df["c_vintage"].astype(int)
@@ -50,22 +96,324 @@ class Dataset:
         vars: List[str],
         fips_map: Dict[str, str],
         census_api_key: Optional[str] = None,
+        max_workers: int = 4,
+        cache: bool = False,
+        refresh: bool = False,
+        typed: bool = False,
+        arrow: bool = False,
     ) -> pd.DataFrame:
-        rsp = requests.get(
-            self._request_url(
+        """
+        Query the dataset for all `geography` units within `fips_map`. Requests for more than MAX_QUERY_VARS variables
+        are split into chunks that are fetched concurrently and joined on the geography columns. Per-chunk timings are
+        reported in `df.attrs["chunk_timings"]`.
+
+        With cache=True, results are cached in FRECHET_CACHE_DIR (see `frechet.query_cache`) and later queries for
+        the same dataset, year, geography, and fips_map only fetch variables that are not cached yet (or have
+        expired). The variables served from the cache and fetched are reported in `df.attrs["cache"]`.
+
+        With typed=True, numeric variables are coerced to Int64/float64 according to their `predicateType`, with
+        CENSUS_SENTINELS mapped to NA, and geography columns are stored as categoricals. Otherwise all columns are
+        strings, as returned by the api.
+
+        With arrow=True, responses are streamed into arrow buffers (see `frechet.arrow`) rather than parsed into
+        Python lists, and columns are arrow backed (`pd.ArrowDtype`) strings. Numeric variables are still coerced
+        with typed=True.
+
+        Args:
+            year: dataset year
+            geography: census geography name, e.g. "tract"
+            vars: variables to request
+            fips_map: parent geographies, e.g. {"state": "01"}
+            census_api_key: api key, defaults to CENSUS_API_KEY
+            max_workers: maximum number of chunk requests in flight
+            cache: if True, serve and save results from the query cache
+            refresh: if True, fetch all `vars` even if they are cached (and update the cache)
+            typed: if True, coerce columns to native dtypes
+            arrow: if True, parse responses into arrow backed columns
+
+        Returns:
+            pd.DataFrame: one row per geography unit, with NAME, `vars`, and geography columns
+        """
+
+        def fetch(vars: List[str]) -> pd.DataFrame:
+            return self._fetch_chunks(
+                self._request_url(
+                    year=year,
+                    geography=geography,
+                    vars=vars,
+                    fips_map=fips_map,
+                    census_api_key=census_api_key,
+                ),
+                max_workers=max_workers,
+                arrow=arrow,
+            )
+
+        if not cache:
+            df = fetch(vars)
+        else:
+            from frechet.query_cache import query_cache
+
+            self._validate_vars(year=year, vars=vars)
+            results = query_cache()
+            key = results.request_key(dataset=self.name, year=year, geography=geography, fips_map=fips_map)
+            df = results.query(key=key, vars=vars, fetch=fetch, refresh=refresh)
+            if arrow:
+                df = _arrow_backed(df)  # cached variables are read back as numpy columns
+        return self._coerce_types(df, year=year, vars=vars) if typed else df
+
+    def query_many(
+        self,
+        year: int,
+        geography: str,
+        vars: List[str],
+        fips_maps: Union[Iterable[Dict[str, str]], Literal["states"]],
+        census_api_key: Optional[str] = None,
+        max_workers: int = 8,
+        cache: bool = False,
+        refresh: bool = False,
+        typed: bool = False,
+        arrow: bool = False,
+        priority: PRIORITY = "bulk",
+    ) -> "QueryBatch":
+        """
+        Run `query` for many fips_maps concurrently. The request is validated once and failed requests are collected
+        rather than raised.
+
+        Args:
+            year: dataset year
+            geography: census geography name, e.g. "tract"
+            vars: variables to request
+            fips_maps: one fips_map per request, or "states" to request every state
+            census_api_key: api key, defaults to CENSUS_API_KEY
+            max_workers: maximum number of requests in flight
+            cache: if True, serve and save results from the query cache (see `query`)
+            refresh: if True, fetch all `vars` even if they are cached
+            typed: if True, coerce columns to native dtypes (see `query`)
+            arrow: if True, parse responses into arrow backed columns (see `query`)
+            priority: scheduling priority of the requests, by default behind interactive and normal queries (see
+                `frechet.scheduler`)
+
+        Returns:
+            QueryBatch: concatenated results (in fips_maps order) and any failed requests
+        """
+        if isinstance(fips_maps, str):
+            if fips_maps != "states":
+                raise ValueError(f"Unrecognized fips_maps {fips_maps}. Pass a list of fips_maps or 'states'.")
+            from frechet.fips import _load_states
+
+            fips_maps = [{"state": x} for x in _load_states()["STATE"]]
+        fips_maps = list(fips_maps)
+        urls = self._request_urls(
+            year=year, geography=geography, vars=vars, fips_maps=fips_maps, census_api_key=census_api_key
+        )
+
+        def fetch(i: int) -> pd.DataFrame:
+            if not cache:
+                return self._fetch_chunks(urls[i], arrow=arrow)
+            return self.query(
                 year=year,
                 geography=geography,
                 vars=vars,
+                fips_map=fips_maps[i],
+                census_api_key=census_api_key,
+                max_workers=1,
+                cache=True,
+                refresh=refresh,
+                arrow=arrow,
+            )
+
+        results: Dict[int, pd.DataFrame] = {}
+        failures: List[QueryFailure] = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor, scheduler.priority(priority):
+            futures = {executor.submit(scheduler.bind(fetch), i): i for i in range(len(urls))}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    logging.warning(f"Query for {self.name}-{year} {geography} {fips_maps[i]} failed: {e}")
+                    failures.append(QueryFailure(fips_map=fips_maps[i], error=e))
+        frames = [results[i] for i in sorted(results)]
+        data = pd.concat(frames, ignore_index=True) if len(frames) > 0 else pd.DataFrame()
+        if typed and len(frames) > 0:
+            # coerced once after concatenating, so geography categoricals span every request
+            data = self._coerce_types(data, year=year, vars=vars)
+        return QueryBatch(data=data, failures=failures)
+
+    def query_shp(
+        self,
+        year: int,
+        geom: GEOGRAPHY,
+        vars: List[str],
+        st_fips: str,
+        county_fips: Optional[str] = None,
+        census_api_key: Optional[str] = None,
+        cache: bool = False,
+        typed: bool = False,
+        how: Literal["left", "inner"] = "left",
+        shp_year: Optional[int] = None,
+        cb: bool = False,
+        tolerance: Optional[float] = None,
+        zoom: Optional[int] = None,
+    ) -> "gpd.GeoDataFrame":
+        """
+        Query the dataset for all `geom` units in a state (or county) and join the results to their boundaries. The
+        query and the boundary load run concurrently, and rows are matched on GEOID (see `frechet.join`).
+
+        Args:
+            year: dataset year
+            geom: geography to query and load boundaries for
+            vars: variables to request
+            st_fips: state fips code
+            county_fips: if given, only query (and load boundaries for) this county
+            census_api_key: api key, defaults to CENSUS_API_KEY
+            cache: if True, serve and save both the query results and the boundary files from FRECHET_CACHE_DIR
+            typed: if True, coerce columns to native dtypes (see `query`)
+            how: "left" keeps every boundary, with missing data as NA, "inner" only boundaries with data
+            shp_year: year of the boundary files, defaults to `year`
+            cb: if True, join to cartographic boundary files
+            tolerance: if given, simplify boundaries (see `frechet.tiger.load_shp`)
+            zoom: alternatively to `tolerance`, the web map zoom level to simplify for
+
+        Returns:
+            geopandas.GeoDataFrame: boundary columns followed by NAME and `vars`, one row per boundary. Data rows
+                without a boundary are counted in `gdf.attrs["unmatched"]`.
+        """
+        from frechet.join import join_geoid
+        from frechet.tiger import load_shp
+
+        fips_map = {"state": st_fips} if county_fips is None else {"state": st_fips, "county": county_fips}
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            shp = executor.submit(
+                scheduler.bind(load_shp),
+                year=year if shp_year is None else shp_year,
+                st_fips=st_fips,
+                geom=geom,
+                cache=cache,
+                cb=cb,
+                county_fips=county_fips,
+                tolerance=tolerance,
+                zoom=zoom,
+            )
+            data = self.query(
+                year=year,
+                geography=GEOM_NAME_MAP[geom],
+                vars=vars,
                 fips_map=fips_map,
                 census_api_key=census_api_key,
+                cache=cache,
+                typed=typed,
             )
-        )
-        # TODO error handling
-        blob_json = rsp.json()
-        df = pd.DataFrame.from_dict(blob_json[1:])
-        df.columns = blob_json[0]
+            gdf = shp.result()
+        return join_geoid(data, gdf, geom=geom, how=how)
+
+    @classmethod
+    def _fetch_chunks(cls, urls: List[str], max_workers: int = 1, arrow: bool = False) -> pd.DataFrame:
+        def _timed_fetch(i: int, url: str) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+            start = time.perf_counter()
+            df = cls._fetch(url, arrow=arrow)
+            timing = {"chunk": i, "columns": df.shape[1], "rows": len(df), "seconds": time.perf_counter() - start}
+            return df, timing
+
+        if max_workers == 1 or len(urls) == 1:
+            results = [_timed_fetch(i, url) for i, url in enumerate(urls)]
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+                results = list(executor.map(scheduler.bind(_timed_fetch), range(len(urls)), urls))
+        df = _join_chunks([x[0] for x in results])
+        df.attrs["chunk_timings"] = [x[1] for x in results]
+        return df
+
+    @staticmethod
+    def _fetch(url: str, arrow: bool = False) -> pd.DataFrame:
+        with instrument.stage("census.request"):
+            rsp = transport.get(url, stream=arrow)
+        try:
+            return Dataset._frame(rsp, arrow=arrow)
+        finally:
+            rsp.close()
+
+    @staticmethod
+    def _frame(rsp: "requests.Response", arrow: bool = False) -> pd.DataFrame:
+        """
+        the api response `rsp` (or an async response with the same interface, see `frechet.aio`) as a DataFrame. With
+        arrow=True, the body is parsed as it is read (see `frechet.arrow`).
+        """
+        _raise_for_status(rsp)
+        if arrow:
+            from frechet.arrow import read_table, to_pandas
+            from frechet.util import CHUNK_SIZE
+
+            body = _counted(rsp.iter_content(CHUNK_SIZE), source="census")
+            with instrument.stage("census.parse"):
+                return to_pandas(read_table(body))
+        instrument.count("bytes", len(rsp.content), source="census")
+        with instrument.stage("census.parse"):
+            blob_json = rsp.json()
+            df = pd.DataFrame.from_dict(blob_json[1:])
+            df.columns = blob_json[0]
         return df
 
+    def query_parquet(
+        self,
+        path: Union[str, os.PathLike],
+        year: int,
+        geography: str,
+        vars: List[str],
+        fips_map: Dict[str, str],
+        census_api_key: Optional[str] = None,
+    ) -> int:
+        """
+        Query the dataset as `query` and write the results to a parquet file of string columns. Responses are parsed
+        into arrow buffers as they are read and written to the file a batch at a time (see `frechet.arrow`), so large
+        pulls (e.g. every block of a state) are never held in memory. Requests for more than MAX_QUERY_VARS
+        variables are joined before writing.
+
+        Args:
+            path: the parquet file to write
+            year: dataset year
+            geography: census geography name, e.g. "tract"
+            vars: variables to request
+            fips_map: parent geographies, e.g. {"state": "01"}
+            census_api_key: api key, defaults to CENSUS_API_KEY
+
+        Returns:
+            int: the number of rows written
+        """
+        from frechet.arrow import iter_batches, write_parquet
+        from frechet.util import CHUNK_SIZE
+
+        urls = self._request_url(
+            year=year, geography=geography, vars=vars, fips_map=fips_map, census_api_key=census_api_key
+        )
+        if len(urls) > 1:
+            import pyarrow as pa
+
+            df = self._fetch_chunks(urls, arrow=True)
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            return write_parquet(table.to_batches(), path)
+        with instrument.stage("census.request"):
+            rsp = transport.get(urls[0], stream=True)
+        try:
+            _raise_for_status(rsp)
+            with instrument.stage("census.parse"):
+                return write_parquet(iter_batches(_counted(rsp.iter_content(CHUNK_SIZE), source="census")), path)
+        finally:
+            rsp.close()
+
+    @instrument.timed("census.coerce")
+    def _coerce_types(self, df: pd.DataFrame, year: int, vars: List[str]) -> pd.DataFrame:
+        var_meta = self._load_variables(year=year)
+        columns = {}
+        for c in df.columns:
+            if c != "NAME" and c not in vars:
+                columns[c] = df[c].astype("category")
+            else:
+                columns[c] = _coerce_column(df[c], predicate_type=(var_meta.get(c) or {}).get("predicateType"))
+        out = pd.DataFrame(columns, copy=False)
+        out.attrs = df.attrs
+        return out
+
     def _request_url(
         self,
         year: int,
@@ -73,27 +421,48 @@ class Dataset:
         vars: List[str],
         fips_map: Dict[str, str],
         census_api_key: Optional[str] = None,
-    ) -> str:
-        if census_api_key is None and CENSUS_API_KEY is None:
+    ) -> List[str]:
+        return self._request_urls(
+            year=year, geography=geography, vars=vars, fips_maps=[fips_map], census_api_key=census_api_key
+        )[0]
+
+    def _request_urls(
+        self,
+        year: int,
+        geography: str,
+        vars: List[str],
+        fips_maps: List[Dict[str, str]],
+        census_api_key: Optional[str] = None,
+    ) -> List[List[str]]:
+        """returns, for each fips_map, one url per chunk of at most MAX_QUERY_VARS variables"""
+        if census_api_key is None and settings.CENSUS_API_KEY is None:
             raise LookupError(
                 "No census api key found. Please add to your .env or pass directly via `census_api_key`."
             )
         elif census_api_key is None:
-            census_api_key = CENSUS_API_KEY
+            census_api_key = settings.CENSUS_API_KEY
         self._validate_vars(year=year, vars=vars)
         address_base = f"{CENSUS_API_BASE}data/{year}/{self.name}?"
-        vars_str = f"NAME,{','.join(vars)}"
+        get_vars = list(dict.fromkeys(["NAME"] + list(vars)))
+        vars_strs = [
+            ",".join(get_vars[i : i + MAX_QUERY_VARS]) for i in range(0, len(get_vars), MAX_QUERY_VARS)
+        ]
         requires, wildcards = self.geography_requires(year=year, geography=geography)
         reqs = list(set(requires) - set(wildcards))
-        if any(x not in fips_map.keys() for x in reqs):
-            raise ValueError(f"Invalid fips_map. Geography requires {' ,'.join(reqs)}")
-        wcs = [x for x in wildcards if x not in fips_map.keys()]
-        geo_str = "&".join(
-            [f"in={k}:{v}" for k, v in fips_map.items()]
-            + [f"in={geo}:*" for geo in wcs]
-        )
         key_str = f"key={census_api_key}"
-        return f"{address_base}get={vars_str}&for={geography}:*&{geo_str}&{key_str}"
+        urls = []
+        for fips_map in fips_maps:
+            if any(x not in fips_map.keys() for x in reqs):
+                raise ValueError(f"Invalid fips_map. Geography requires {' ,'.join(reqs)}")
+            wcs = [x for x in wildcards if x not in fips_map.keys()]
+            geo_str = "&".join(
+                [f"in={k}:{v}" for k, v in fips_map.items()]
+                + [f"in={geo}:*" for geo in wcs]
+            )
+            urls.append(
+                [f"{address_base}get={vars_str}&for={geography}:*&{geo_str}&{key_str}" for vars_str in vars_strs]
+            )
+        return urls
 
     def geography_requires(
         self, year: int, geography: str
@@ -119,27 +488,53 @@ class Dataset:
 
     def _load_geographies(self, year: int) -> pd.DataFrame:
         self._validate_year(year=year)
-        rsp = requests.get(f"{CENSUS_API_BASE}data/{year}/{self.name}/geography.json")
-        df = pd.DataFrame.from_dict(json.loads(rsp.content)["fips"])
+        df = pd.DataFrame.from_dict(get_metadata(f"data/{year}/{self.name}/geography.json")["fips"])
         return df.loc[
             df["name"].isin(GEOM_NAME_MAP.values())
         ]  # TODO expand geographies with Tiger expansion
 
+    def search_variables(
+        self,
+        text: str,
+        concept: Optional[str] = None,
+        years: Optional[Iterable[int]] = None,
+        limit: Optional[int] = 20,
+    ) -> pd.DataFrame:
+        """
+        Search the codes, labels, and concepts of the dataset's variables in every available year. The index is built
+        on first use and kept in FRECHET_CACHE_DIR (see `frechet.search`).
+
+        Args:
+            text: words to search for, e.g. "median household income"
+            concept: only return variables with a concept containing this text
+            years: only return variables available in every one of these years
+            limit: maximum number of results, all if None
+
+        Returns:
+            pd.DataFrame: indexed by code, the label, concept, and years of each match, best matches first
+        """
+        from frechet.search import variable_index
+
+        return variable_index(self.name).search(text, concept=concept, years=years, limit=limit)
+
     def variables(self, year: int) -> pd.DataFrame:
-        self._validate_year(year=year)
-        rsp = requests.get(f"{CENSUS_API_BASE}data/{year}/{self.name}/variables.json")
         df = pd.DataFrame.from_dict(
-            json.loads(rsp.content)["variables"], orient="index"
+            self._load_variables(year=year), orient="index"
         )[["label", "concept"]].sort_index()
-        df = df.loc[~df.index.isin(["for", "in", "ucgid"])]
+        df = df.loc[~df.index.isin(NON_VARIABLES)]
         df = df.loc[df["concept"].notna()]
         df = df.loc[df["label"] != "Geography"]
         return df
 
+    def _load_variables(self, year: int) -> Dict[str, Dict[str, Any]]:
+        self._validate_year(year=year)
+        return get_metadata(f"data/{year}/{self.name}/variables.json")["variables"]
+
+    @instrument.timed("census.validate")
     def _validate_vars(self, year: int, vars: List[str]):
-        var_df = self.variables(year=year)
-        valid_opts = var_df.index.tolist()
-        invalid_vars = [x for x in vars if x not in valid_opts]
+        # checked against the cached metadata directly, equivalent to membership in `self.variables(year).index`
+        var_meta = self._load_variables(year=year)
+        invalid_vars = [x for x in vars if not _is_queryable(x, var_meta.get(x))]
         if len(invalid_vars) > 0:
             raise LookupError(
                 f"The following vars were not found in valid variable list for {self.name}-{year}: {' ,'.join(invalid_vars)}"
@@ -157,3 +552,73 @@ class Dataset:
             raise LookupError(
                 f"Year {year} is not valid for {self.name}. Available years are {' ,'.join(self.available_years)}"
             )
+
+
+def _is_queryable(var: str, meta: Optional[Dict[str, Any]]) -> bool:
+    return (
+        meta is not None
+        and var not in NON_VARIABLES
+        and meta.get("concept") is not None
+        and meta.get("label") != "Geography"
+    )
+
+
+def _raise_for_status(rsp: "requests.Response"):
+    if rsp.status_code != 200:
+        raise QueryError(f"Census api returned status {rsp.status_code}: {rsp.text[:200]}")
+
+
+def _counted(chunks: Iterable[bytes], source: str) -> Iterator[bytes]:
+    """`chunks`, reporting their total size to `instrument` once consumed"""
+    nbytes = 0
+    try:
+        for chunk in chunks:
+            nbytes += len(chunk)
+            yield chunk
+    finally:
+        instrument.count("bytes", nbytes, source=source)
+
+
+def _arrow_backed(df: pd.DataFrame) -> pd.DataFrame:
+    """`df` with arrow backed columns, as returned by `query(..., arrow=True)`"""
+    import pyarrow as pa
+    from frechet.arrow import to_pandas
+
+    out = to_pandas(pa.Table.from_pandas(df, preserve_index=False))
+    out.attrs = df.attrs
+    return out
+
+
+def _coerce_column(values: pd.Series, predicate_type: Optional[str]) -> pd.Series:
+    """cast a column of api strings to the dtype of its predicateType, mapping CENSUS_SENTINELS to NA"""
+    if predicate_type not in NUMERIC_TYPES:
+        return values
+    numbers = pd.to_numeric(values, errors="coerce")
+    numbers = numbers.mask(numbers.isin(CENSUS_SENTINELS))
+    return numbers.astype(NUMERIC_TYPES[predicate_type])
+
+
+def _join_chunks(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Join the responses to chunked requests on their shared (geography) columns. Columns of chunks whose rows are
+    already aligned with the first chunk are reused as is, so in the common case no data is copied.
+    """
+    if len(frames) == 1:
+        return frames[0]
+    base = frames[0]
+    keys = [c for c in base.columns if all(c in frame.columns for frame in frames[1:])]
+    base_index = pd.MultiIndex.from_frame(base[keys])
+    columns = {c: base[c] for c in base.columns if c not in keys}
+    for frame in frames[1:]:
+        indexer = pd.MultiIndex.from_frame(frame[keys]).get_indexer(base_index)
+        aligned = (indexer == np.arange(len(indexer))).all() and len(frame) == len(base)
+        for c in frame.columns:
+            if c in keys:
+                continue
+            values = frame[c].array  # arrow backed columns stay arrow backed
+            if not aligned:
+                values = values.take(indexer, allow_fill=True)
+            columns[c] = pd.Series(values, index=base.index, name=c, copy=False)
+    for c in keys:
+        columns[c] = base[c]
+    return pd.DataFrame(columns, copy=False)
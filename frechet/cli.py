@@ -0,0 +1,350 @@
+"""
+command line interface, installed as the `frechet` console script
+
+    frechet prefetch --states MD VA --years 2019-2021 --geoms tracts block_groups --workers 8
+    frechet prefetch --datasets acs/acs5 dec/pl --years 2020
+    frechet prefetch --manifest prefetch.yaml --metrics /var/lib/node_exporter/frechet.prom
+    frechet search acs/acs5 median household income --years 2015 2020
+    frechet reference refresh
+
+`prefetch` downloads boundary files and census api metadata into FRECHET_CACHE_DIR, e.g. to bake a warm cache into a
+container image. Entries that are already cached are skipped, so an interrupted prefetch resumes where it stopped
+when run again. A manifest is a JSON (or, with pyyaml installed, YAML) file holding one prefetch spec or a list of
+them, with the same keys as the command line options:
+
+    - states: [MD, VA]
+      years: [2020, 2021]
+      geoms: [tracts, block_groups]
+      cb: true
+      cache_format: parquet
+    - datasets: [acs/acs5]
+      years: ["2015-2020"]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import itertools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import *
+
+import pandas as pd
+
+from frechet import instrument, metadata, reference, scheduler, settings, tiger
+from frechet.geom import GEOGRAPHY
+
+SPEC_KEYS = ["states", "years", "geoms", "cb", "cache_format", "datasets"]
+
+
+@dataclass
+class PrefetchTask:
+    """
+    One cache entry to prefetch.
+
+    Args:
+        kind (str): "shp" for a boundary file, "metadata" for a census api metadata document
+        key (str): the entry's description, for boundary files, or path relative to CENSUS_API_BASE, for metadata
+        kwargs (dict): arguments to `frechet.tiger.prefetch_shp`, for boundary files
+    """
+
+    kind: Literal["shp", "metadata"]
+    key: str
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+
+    def run(self) -> int:
+        """
+        Returns:
+            int: number of bytes downloaded, 0 if the entry was already cached
+        """
+        if self.kind == "shp":
+            return tiger.prefetch_shp(**self.kwargs)
+        return metadata.METADATA_CACHE.prefetch(self.key)
+
+
+@dataclass
+class PrefetchResult:
+    """
+    Args:
+        task (PrefetchTask): the task
+        status (str): "fetched", "cached" (skipped), or "failed"
+        nbytes (int): number of bytes downloaded
+        seconds (float): wall time spent on the task
+        error (str): the error, for failed tasks
+    """
+
+    task: PrefetchTask
+    status: Literal["fetched", "cached", "failed"]
+    nbytes: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+def plan_prefetch(specs: Iterable[Dict[str, Any]]) -> List[PrefetchTask]:
+    """
+    Expand prefetch specs into tasks, one per cache entry. Boundary files are planned for every combination of
+    states, years, and geoms, and metadata documents for every combination of datasets and years. Tasks shared by
+    several specs are planned once.
+
+    Args:
+        specs: dicts with keys in SPEC_KEYS. "years" is required, and "states" defaults to "all".
+
+    Returns:
+        list: the tasks, in order
+    """
+    tasks: Dict[Tuple[str, str], PrefetchTask] = {}
+    for spec in specs:
+        unknown = set(spec) - set(SPEC_KEYS)
+        if unknown:
+            raise ValueError(f"Unrecognized prefetch keys {sorted(unknown)}. Valid keys are {SPEC_KEYS}.")
+        years = parse_years(_as_list(spec.get("years")))
+        if not years:
+            raise ValueError("Each prefetch spec requires `years`.")
+        geoms = _as_list(spec.get("geoms"))
+        datasets = _as_list(spec.get("datasets"))
+        if not geoms and not datasets:
+            raise ValueError("Each prefetch spec requires `geoms` and/or `datasets`.")
+        cb = bool(spec.get("cb", False))
+        cache_format = spec.get("cache_format")
+        for geom in geoms:
+            if geom not in get_args(GEOGRAPHY):
+                raise ValueError(f"Unrecognized geom {geom}. Valid geoms are {get_args(GEOGRAPHY)}.")
+            tiger._validate_cb(geom=geom, cb=cb)
+        if cache_format is not None:
+            tiger._validate_cache_format(cache_format=cache_format)
+        states = _resolve_states(spec.get("states", "all")) if geoms else []
+        for year, geom, st_fips in itertools.product(years, geoms, states):
+            kwargs = dict(year=year, st_fips=st_fips, geom=geom, cb=cb, cache_format=cache_format)
+            key = f"{'cb ' if cb else ''}{geom} {year} {st_fips}"
+            tasks.setdefault(("shp", key), PrefetchTask(kind="shp", key=key, kwargs=kwargs))
+        paths = ["data.json"] if datasets else []
+        for year, dataset in itertools.product(years, datasets):
+            paths += [f"data/{year}/{dataset}/geography.json", f"data/{year}/{dataset}/variables.json"]
+        for path in paths:
+            tasks.setdefault(("metadata", path), PrefetchTask(kind="metadata", key=path))
+    return list(tasks.values())
+
+
+def prefetch(
+    tasks: Sequence[PrefetchTask],
+    max_workers: int = 8,
+    progress: Optional[Callable[[PrefetchResult, int, int], None]] = None,
+) -> List[PrefetchResult]:
+    """
+    Run prefetch tasks in a thread pool, at bulk priority (see `frechet.scheduler`). Failed tasks are reported, not
+    raised.
+
+    Args:
+        tasks: as returned by `plan_prefetch`
+        max_workers: size of the worker pool
+        progress: called as progress(result, n_done, n_total) as each task completes
+
+    Returns:
+        list: one result per task, in order of completion
+    """
+    results = []
+    ex = ThreadPoolExecutor(max_workers=max_workers)
+    with scheduler.priority("bulk"):
+        run = scheduler.bind(_timed_run)
+    futures = [ex.submit(run, task) for task in tasks]
+    try:
+        for future in as_completed(futures):
+            results.append(future.result())
+            if progress is not None:
+                progress(results[-1], len(results), len(tasks))
+    finally:
+        # on interruption, drop queued tasks and let running ones finish, so no partial entries are left behind
+        for future in futures:
+            future.cancel()
+        ex.shutdown(wait=True)
+    return results
+
+
+def _timed_run(task: PrefetchTask) -> PrefetchResult:
+    start = time.perf_counter()
+    try:
+        nbytes = task.run()
+    except Exception as e:
+        logging.warning(f"Failed to prefetch {task.key}: {e}")
+        return PrefetchResult(task=task, status="failed", seconds=time.perf_counter() - start, error=str(e))
+    status = "fetched" if nbytes > 0 else "cached"
+    return PrefetchResult(task=task, status=status, nbytes=nbytes, seconds=time.perf_counter() - start)
+
+
+def parse_years(values: Iterable[Union[int, str]]) -> List[int]:
+    """
+    Args:
+        values: years, or inclusive ranges of years such as "2014-2021"
+
+    Returns:
+        list: the years, deduplicated, in order
+    """
+    years = []
+    for value in values:
+        if isinstance(value, str) and "-" in value:
+            start, end = value.split("-", 1)
+            years += range(int(start), int(end) + 1)
+        else:
+            years.append(int(value))
+    return list(dict.fromkeys(years))
+
+
+def load_manifest(path: Union[str, Path]) -> List[Dict[str, Any]]:
+    """
+    Args:
+        path: location of a JSON or YAML (.yaml, .yml) manifest holding a prefetch spec or a list of them
+
+    Returns:
+        list: the prefetch specs
+    """
+    path = Path(path)
+    with open(path) as f:
+        if path.suffix in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("YAML manifests require pyyaml. Install it, or use a JSON manifest.")
+            specs = yaml.safe_load(f)
+        else:
+            specs = json.load(f)
+    if isinstance(specs, dict):
+        specs = [specs]
+    if not isinstance(specs, list) or not all(isinstance(x, dict) for x in specs):
+        raise ValueError(f"Manifest {path} must hold a prefetch spec or a list of them.")
+    return specs
+
+
+def _as_list(value: Any) -> List[Any]:
+    if value is None:
+        return []
+    if isinstance(value, (str, int)):
+        return [value]
+    return list(value)
+
+
+def _resolve_states(states: Union[str, Sequence[str]]) -> List[str]:
+    from frechet.fips import _load_states, resolve_states
+
+    states = _as_list(states)
+    if states == ["all"]:
+        return _load_states()["STATE"].tolist()
+    return resolve_states(pd.Series(states, dtype=object), errors="raise")["fips"].tolist()
+
+
+def _fmt_bytes(nbytes: float) -> str:
+    for unit in ["B", "KB", "MB"]:
+        if nbytes < 1024:
+            return f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+    return f"{nbytes:.1f} GB"
+
+
+def _summary(results: List[PrefetchResult], n_total: int, seconds: float) -> str:
+    counts = {status: sum(r.status == status for r in results) for status in ["fetched", "cached", "failed"]}
+    nbytes = sum(r.nbytes for r in results)
+    rate = nbytes / seconds if seconds > 0 else 0.0
+    return (
+        f"{len(results)}/{n_total} entries: {counts['fetched']} fetched, {counts['cached']} already cached, "
+        f"{counts['failed']} failed. {_fmt_bytes(nbytes)} transferred in {seconds:.1f}s ({_fmt_bytes(rate)}/s)"
+    )
+
+
+def _prefetch_main(args: argparse.Namespace, parser: argparse.ArgumentParser) -> int:
+    specs = load_manifest(args.manifest) if args.manifest else []
+    cli_spec = {k: getattr(args, k) for k in SPEC_KEYS if getattr(args, k) not in (None, False)}
+    if cli_spec:
+        specs.append(cli_spec)
+    if not specs:
+        parser.error("prefetch requires a --manifest or --years with --geoms and/or --datasets")
+    try:
+        tasks = plan_prefetch(specs)
+    except Exception as e:
+        parser.error(str(e))
+    if any(t.kind == "shp" for t in tasks) and settings.FRECHET_CACHE_DIR is None:
+        parser.error("FRECHET_CACHE_DIR is not set. Please add to .env.")
+    if any(t.kind == "metadata" for t in tasks) and metadata.METADATA_CACHE.cache_dir is None:
+        parser.error("FRECHET_CACHE_DIR is not set. Please add to .env.")
+
+    results: List[PrefetchResult] = []
+
+    def progress(result: PrefetchResult, n_done: int, n_total: int):
+        results.append(result)
+        if args.quiet and result.status != "failed":
+            return
+        detail = result.error if result.status == "failed" else f"{_fmt_bytes(result.nbytes)}, {result.seconds:.1f}s"
+        print(f"[{n_done}/{n_total}] {result.status:<7} {result.task.key} ({detail})", flush=True)
+
+    if args.metrics:
+        instrument.enable()
+    start = time.perf_counter()
+    try:
+        prefetch(tasks, max_workers=args.workers, progress=progress)
+    except KeyboardInterrupt:
+        print(f"Interrupted. {_summary(results, len(tasks), time.perf_counter() - start)}")
+        print("Run the same command again to resume.")
+        return 130
+    finally:
+        if args.metrics:
+            instrument.disable()
+            _write_metrics(args.metrics)
+    print(_summary(results, len(tasks), time.perf_counter() - start))
+    return 1 if any(r.status == "failed" for r in results) else 0
+
+
+def _search_main(args: argparse.Namespace) -> int:
+    from frechet.search import variable_index
+
+    years = None if args.years is None else parse_years(args.years)
+    results = variable_index(args.dataset).search(" ".join(args.text), concept=args.concept, years=years, limit=args.limit)
+    if len(results) == 0:
+        print("No matching variables.")
+        return 1
+    with pd.option_context("display.max_colwidth", 80, "display.width", 200):
+        print(results.drop(columns="score").to_string())
+    return 0
+
+
+def _write_metrics(path: str):
+    # written to a temporary file and renamed, so a textfile collector never reads a partial file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(instrument.prometheus_text())
+    os.replace(tmp_path, path)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="frechet", description="census data and boundary file utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    pf = sub.add_parser("prefetch", help="download boundary files and api metadata into FRECHET_CACHE_DIR")
+    pf.add_argument("--manifest", help="JSON or YAML file holding a prefetch spec or a list of them")
+    pf.add_argument("--states", nargs="+", help="state abbreviations, fips codes, or names, or 'all' (the default)")
+    pf.add_argument("--years", nargs="+", help="years, or inclusive ranges such as 2014-2021")
+    pf.add_argument("--geoms", nargs="+", choices=get_args(GEOGRAPHY), help="boundary files to prefetch")
+    pf.add_argument("--cb", action="store_true", help="prefetch cartographic boundary files")
+    pf.add_argument("--cache-format", choices=get_args(tiger.CACHE_FORMAT), help="defaults to FRECHET_CACHE_FORMAT")
+    pf.add_argument("--datasets", nargs="+", help="datasets whose api metadata to prefetch, e.g. acs/acs5")
+    pf.add_argument("--workers", type=int, default=8, help="number of concurrent downloads")
+    pf.add_argument("--quiet", action="store_true", help="only report failures and the summary")
+    pf.add_argument("--metrics", help="write stage timings, bytes, and cache counters here, in Prometheus text format")
+    se = sub.add_parser("search", help="search the variables of a dataset across years (see frechet.search)")
+    se.add_argument("dataset", help="dataset name, e.g. acs/acs5")
+    se.add_argument("text", nargs="+", help="words to search for")
+    se.add_argument("--concept", help="only variables with a concept containing this text")
+    se.add_argument("--years", nargs="+", help="only variables available in all of these years (or ranges)")
+    se.add_argument("--limit", type=int, default=20, help="maximum number of results")
+    ref = sub.add_parser("reference", help="manage the bundled reference snapshot (see python -m frechet.reference)")
+    ref.add_argument("args", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+    if args.command == "reference":
+        reference.main(args.args)
+        return 0
+    if args.command == "search":
+        return _search_main(args)
+    return _prefetch_main(args, parser)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
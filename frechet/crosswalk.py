@@ -0,0 +1,298 @@
+"""
+area-weighted interpolation of data between boundary layers, e.g. from 2015 to 2021 tracts
+
+Tract and block boundaries are redrawn between the 2010 and 2020 based vintages (see `frechet.tiger._fpath`). A
+`Crosswalk` holds the area of every intersection between the units of a source and a target layer as a sparse
+(target x source) matrix. Intersecting pairs are found with an STRtree over the target layer, and their intersections
+are computed and measured in one vectorized shapely call, in an equal-area projection. Data are then moved between
+the layers as sparse matrix products, all columns at once:
+
+- extensive variables (counts, e.g. population) are split in proportion to the share of each source unit's area that
+  falls in each target unit, and summed
+- intensive variables (rates, medians, densities) are averaged over the source units covering each target unit,
+  weighted by the area of their intersection
+
+    xwalk = crosswalk(st_fips="24", geom="tracts", source_year=2015, target_year=2021, cache=True)
+    df_2021 = xwalk.apply(df_2015, extensive=["B01001_001E"], intensive=["B19013_001E"])
+
+Crosswalks built with cache=True are saved under FRECHET_CACHE_DIR/crosswalks and registered with the cache manifest
+(`frechet.cache`).
+"""
+import os
+import logging
+from pathlib import Path
+from typing import *
+
+import numpy as np
+import pandas as pd
+import shapely
+
+try:
+    from scipy import sparse
+except ImportError:
+    raise ImportError("Crosswalks require scipy. Install frechet[crosswalk].")
+
+from frechet import instrument, settings
+from frechet.cache import manager as cache_manager
+from frechet.geom import GEOGRAPHY, require_shapely2
+from frechet.tiger import load_shp
+from frechet.util import file_lock
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+
+EQUAL_AREA_CRS = "EPSG:5070"  # conus albers
+CROSSWALK_SUBDIR = "crosswalks"
+WEIGHTS = Literal["extensive", "intensive"]
+
+
+class Crosswalk:
+    """
+    Areas of intersection between the units of a source and a target layer.
+
+    Args:
+        source_ids (np.ndarray): ids of the source units, e.g. GEOIDs
+        target_ids (np.ndarray): ids of the target units
+        areas (scipy.sparse.csr_matrix): (target x source) areas of intersection
+        source_areas (np.ndarray): area of each source unit
+    """
+
+    def __init__(
+        self, source_ids: np.ndarray, target_ids: np.ndarray, areas: sparse.csr_matrix, source_areas: np.ndarray
+    ):
+        if areas.shape != (len(target_ids), len(source_ids)) or len(source_areas) != len(source_ids):
+            raise ValueError("Crosswalk areas do not match the source and target ids.")
+        self.source_ids = np.asarray(source_ids)
+        self.target_ids = np.asarray(target_ids)
+        self.areas = sparse.csr_matrix(areas)
+        self.source_areas = np.asarray(source_areas, dtype=float)
+
+    @classmethod
+    @instrument.timed("crosswalk.build")
+    def from_layers(
+        cls, source: "gpd.GeoDataFrame", target: "gpd.GeoDataFrame", id_col: str = "GEOID", crs: str = EQUAL_AREA_CRS
+    ) -> "Crosswalk":
+        """
+        Args:
+            source: polygons to interpolate from
+            target: polygons to interpolate to
+            id_col: column identifying the units of both layers
+            crs: projection in which areas are measured, should preserve area
+
+        Returns:
+            Crosswalk: areas of intersection between the units of `source` and `target`
+        """
+        require_shapely2("Crosswalks")
+        src = source.geometry.to_crs(crs).to_numpy()
+        tgt = target.geometry.to_crs(crs).to_numpy()
+        tgt_idx, src_idx = shapely.STRtree(tgt).query(src, predicate="intersects")[::-1]
+        shapely.prepare(src)
+        shapely.prepare(tgt)
+        # units entirely within a unit of the other layer (e.g. unchanged boundaries) need no intersection
+        within = shapely.contains(tgt[tgt_idx], src[src_idx]) | shapely.contains(src[src_idx], tgt[tgt_idx])
+        pieces = np.empty(len(src_idx), dtype=object)
+        pieces[within] = np.where(
+            shapely.area(src[src_idx[within]]) <= shapely.area(tgt[tgt_idx[within]]),
+            src[src_idx[within]],
+            tgt[tgt_idx[within]],
+        )
+        pieces[~within] = shapely.intersection(src[src_idx[~within]], tgt[tgt_idx[~within]])
+        areas = shapely.area(pieces)
+        keep = areas > 0  # units that only share a border
+        matrix = sparse.csr_matrix((areas[keep], (tgt_idx[keep], src_idx[keep])), shape=(len(tgt), len(src)))
+        return cls(
+            source_ids=source[id_col].to_numpy(dtype=str),
+            target_ids=target[id_col].to_numpy(dtype=str),
+            areas=matrix,
+            source_areas=shapely.area(src),
+        )
+
+    def weights(self, kind: WEIGHTS = "extensive") -> sparse.csr_matrix:
+        """
+        Args:
+            kind: "extensive" for the share of each source unit in each target unit, "intensive" for the share of
+                each target unit (covered by the source layer) in each source unit
+
+        Returns:
+            scipy.sparse.csr_matrix: (target x source) weights
+        """
+        areas = self.areas.tocoo()
+        return sparse.csr_matrix((self._weights(kind, areas), (areas.row, areas.col)), shape=areas.shape)
+
+    def apply(
+        self,
+        df: pd.DataFrame,
+        extensive: Sequence[str] = (),
+        intensive: Sequence[str] = (),
+        on: str = "GEOID",
+    ) -> pd.DataFrame:
+        """
+        Interpolate columns of `df` from the source to the target units.
+
+        Args:
+            df: data for the source units, identified by column `on`
+            extensive: columns of counts, split and summed
+            intensive: columns of rates, averaged by area
+            on: column of `df` holding source unit ids
+
+        Returns:
+            pd.DataFrame: column `on` with every target unit id, followed by `extensive` and `intensive` as floats.
+                Target units overlapping a source unit that is missing from `df` (or NA) are NA, as are target units
+                outside the source layer.
+        """
+        if df[on].duplicated().any():
+            raise ValueError(f"Column {on} has duplicate ids.")
+        rows = pd.Index(df[on].astype(str)).get_indexer(self.source_ids)
+        out = {on: self.target_ids}
+        for kind, columns in [("extensive", list(extensive)), ("intensive", list(intensive))]:
+            if len(columns) == 0:
+                continue
+            values = np.full((len(self.source_ids), len(columns)), np.nan)
+            found = rows >= 0
+            values[found] = df[columns].iloc[rows[found]].to_numpy(dtype=float, na_value=np.nan)
+            missing = np.isnan(values)
+            weights = self.weights(kind)
+            result = weights @ np.where(missing, 0, values)
+            # NA wherever a missing source unit contributes, or no source unit does
+            result[(weights @ missing.astype(float)) > 0] = np.nan
+            result[np.asarray(weights.sum(axis=1)).ravel() == 0] = np.nan
+            out.update({c: result[:, i] for i, c in enumerate(columns)})
+        return pd.DataFrame(out)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame: one row per intersecting pair, with the source and target ids, the area of intersection, and
+                the extensive and intensive weights
+        """
+        areas = self.areas.tocoo()
+        return pd.DataFrame(
+            {
+                "source": self.source_ids[areas.col],
+                "target": self.target_ids[areas.row],
+                "area": areas.data,
+                "extensive": self._weights("extensive", areas),
+                "intensive": self._weights("intensive", areas),
+            }
+        )
+
+    def _weights(self, kind: WEIGHTS, areas: sparse.coo_matrix) -> np.ndarray:
+        # stored areas are positive, so every source unit and every covered target unit has a positive area
+        if kind == "extensive":
+            return areas.data / self.source_areas[areas.col]
+        if kind == "intensive":
+            return areas.data / np.asarray(self.areas.sum(axis=1)).ravel()[areas.row]
+        raise ValueError(f"Unrecognized weights {kind}. Options are {', '.join(get_args(WEIGHTS))}.")
+
+    def save(self, path: Union[str, Path]):
+        """write the crosswalk to an .npz file at `path`, replacing it atomically"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    source_ids=self.source_ids.astype(str),
+                    target_ids=self.target_ids.astype(str),
+                    data=self.areas.data,
+                    indices=self.areas.indices,
+                    indptr=self.areas.indptr,
+                    source_areas=self.source_areas,
+                )
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "Crosswalk":
+        """read a crosswalk written by `save`"""
+        with np.load(path, allow_pickle=False) as f:
+            shape = (len(f["target_ids"]), len(f["source_ids"]))
+            return cls(
+                source_ids=f["source_ids"],
+                target_ids=f["target_ids"],
+                areas=sparse.csr_matrix((f["data"], f["indices"], f["indptr"]), shape=shape),
+                source_areas=f["source_areas"],
+            )
+
+
+def crosswalk(
+    st_fips: str,
+    geom: GEOGRAPHY,
+    source_year: int,
+    target_year: int,
+    target_geom: Optional[GEOGRAPHY] = None,
+    cb: bool = False,
+    cache: bool = False,
+    crs: str = EQUAL_AREA_CRS,
+) -> Crosswalk:
+    """
+    Crosswalk between the boundary files (see `frechet.tiger.load_shp`) of a state in two years.
+
+    Args:
+        st_fips: state fips code
+        geom: geography of the source layer
+        source_year: year of the source layer
+        target_year: year of the target layer
+        target_geom: geography of the target layer, defaults to `geom`
+        cb: if True, use cartographic boundary files (clipped to the shoreline)
+        cache: if True, cache the boundary files and the crosswalk to FRECHET_CACHE_DIR
+        crs: projection in which areas are measured
+
+    Returns:
+        Crosswalk: from the `geom` units of `source_year` to the `target_geom` units of `target_year`
+    """
+    if cache and settings.FRECHET_CACHE_DIR is None:
+        raise ValueError("Attempting to cache download without setting FRECHET_CACHE_DIR. Please add to .env.")
+    target_geom = geom if target_geom is None else target_geom
+
+    def build() -> Crosswalk:
+        kwargs = dict(st_fips=st_fips, cb=cb, cache=cache, columns=["GEOID", "geometry"])
+        source = load_shp(year=source_year, geom=geom, **kwargs)
+        target = load_shp(year=target_year, geom=target_geom, **kwargs)
+        return Crosswalk.from_layers(source, target, crs=crs)
+
+    key = _cache_key(st_fips, geom, source_year, target_year, target_geom=target_geom, cb=cb, crs=crs)
+    if settings.FRECHET_CACHE_DIR is not None:
+        xwalk = _load_cached(key)
+        instrument.cache("crosswalk", hit=xwalk is not None)
+        if xwalk is not None:
+            return xwalk
+    if not cache:
+        return build()
+    path = _cache_path(key)
+    with file_lock(f"{path}.lock"):
+        xwalk = _load_cached(key)
+        if xwalk is not None:
+            return xwalk
+        xwalk = build()
+        logging.info(f"Caching crosswalk to {path}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        xwalk.save(path)
+        cache_manager(settings.FRECHET_CACHE_DIR).register(key)
+    return xwalk
+
+
+def _cache_key(
+    st_fips: str, geom: GEOGRAPHY, source_year: int, target_year: int, target_geom: GEOGRAPHY, cb: bool, crs: str
+) -> str:
+    # e.g. crosswalks/tracts_2015_tracts_2021_24_EPSG5070.npz
+    prefix = "cb_" if cb else ""
+    crs_name = "".join(x for x in crs if x.isalnum())
+    return f"{CROSSWALK_SUBDIR}/{prefix}{geom}_{source_year}_{target_geom}_{target_year}_{st_fips}_{crs_name}.npz"
+
+
+def _cache_path(key: str) -> str:
+    return os.path.join(os.path.expanduser(settings.FRECHET_CACHE_DIR), key)
+
+
+def _load_cached(key: str) -> Optional[Crosswalk]:
+    manager = cache_manager(settings.FRECHET_CACHE_DIR)
+    if not manager.lookup(key):
+        return None
+    try:
+        return Crosswalk.load(_cache_path(key))
+    except Exception as e:
+        logging.warning(f"Discarding unreadable cache entry {key}: {e}")
+        manager.remove(key)
+        return None
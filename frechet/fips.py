@@ -1,16 +1,17 @@
+from bisect import bisect_left, bisect_right
 from functools import lru_cache
-from re import sub
 from typing import *
 from dataclasses import dataclass
-from urllib import request
+from io import StringIO
 import pandas as pd
-import geopandas as gpd
-import requests
 
-from frechet.url import STATES
-from frechet.tiger import load_shp
+from frechet import transport
+from frechet.url import STATES, COUNTIES
+from frechet.reference import COUNTY_COLUMNS, snapshot_states, snapshot_counties
 from frechet.geom import GEOGRAPHY, PARENT
-from frechet.settings import CENSUS_API_KEY
+
+if TYPE_CHECKING:
+    import geopandas as gpd
 
 QUERY_MODE = Literal["name", "abbr", "fips"]
 
@@ -29,35 +30,194 @@ class MultipleCountiesError(Exception):
 
 @lru_cache()
 def _load_states() -> pd.DataFrame:
-    return pd.read_csv(STATES, delimiter="|", dtype={"STATE": str})
+    st_df = snapshot_states()
+    if st_df is not None:
+        return st_df
+    return pd.read_csv(StringIO(transport.get_text(STATES)), delimiter="|", dtype={"STATE": str})
 
 
 @lru_cache()
 def _load_counties(st_fips: str, st_abbr: str) -> pd.DataFrame:
+    co_df = snapshot_counties(st_fips=st_fips)
+    if co_df is not None:
+        return co_df
     co_df = pd.read_csv(
-        f"https://www2.census.gov/geo/docs/reference/codes/files/st{st_fips}_{st_abbr.lower()}_cou.txt",
+        StringIO(transport.get_text(COUNTIES.format(st_fips=st_fips, st_abbr=st_abbr.lower()))),
         header=None,
         dtype=str,
     )
-    co_df.columns = ["state_abbr", "state_fips", "co_fips", "co_name", "co_type"]
+    co_df.columns = COUNTY_COLUMNS
     return co_df
 
 
+class _PrefixIndex:
+    """
+    Case-insensitive exact and prefix lookups of (fips, name) pairs by name, backed by a sorted array of normalized
+    keys. Prefix lookups are a binary search for the range of keys sharing the prefix. Also indexes pairs by fips.
+    """
+
+    def __init__(self, names: Sequence[str], values: Sequence[Tuple[str, str]]):
+        order = sorted(range(len(names)), key=lambda i: _normalize(names[i]))
+        self._keys = [_normalize(names[i]) for i in order]
+        self._values = [values[i] for i in order]
+        self._by_fips = {x[0]: [x] for x in values}
+
+    def fips(self, fips: str) -> List[Tuple[str, str]]:
+        return self._by_fips.get(fips, [])
+
+    def exact(self, name: str) -> List[Tuple[str, str]]:
+        key = _normalize(name)
+        lo = bisect_left(self._keys, key)
+        hi = bisect_right(self._keys, key)
+        return self._values[lo:hi]
+
+    def prefix(self, name: str) -> List[Tuple[str, str]]:
+        key = _normalize(name)
+        lo = bisect_left(self._keys, key)
+        hi = bisect_left(self._keys, key + "\U0010ffff")
+        return self._values[lo:hi]
+
+
+def _normalize(name: str) -> str:
+    return " ".join(name.split()).casefold()
+
+
+@lru_cache()
+def _state_index(mode: QUERY_MODE) -> Dict[str, List[Tuple[str, str, str]]]:
+    """exact-match hash index from a state's fips, abbr, or name to its (fips, abbr, name) rows"""
+    st_df = _load_states()
+    col = "STATE_NAME" if mode == "name" else "STUSAB" if mode == "abbr" else "STATE"
+    index: Dict[str, List[Tuple[str, str, str]]] = {}
+    for row in zip(st_df[col], st_df["STATE"], st_df["STUSAB"], st_df["STATE_NAME"]):
+        index.setdefault(row[0], []).append(row[1:])
+    return index
+
+
+@lru_cache()
+def _state_lookup() -> Dict[str, str]:
+    """normalized fips, abbr, and name of each state to its fips code"""
+    st_df = _load_states()
+    lookup = {}
+    for col in ["STATE", "STUSAB", "STATE_NAME"]:
+        lookup.update({_normalize(k): v for k, v in zip(st_df[col], st_df["STATE"])})
+    return lookup
+
+
+@lru_cache()
+def _county_index(st_fips: str, st_abbr: str) -> _PrefixIndex:
+    co_df = _load_counties(st_fips=st_fips, st_abbr=st_abbr)
+    return _PrefixIndex(co_df["co_name"].tolist(), list(zip(co_df["co_fips"], co_df["co_name"])))
+
+
 def _build_state(mode: QUERY_MODE, name: str):
     if type(name) != str:
         raise ValueError(f"Argument {mode} must be of type `str`.")
-    st_df = _load_states()
-    col = "STATE_NAME" if mode == "name" else "STUSAB" if mode == "abbr" else "STATE"
-    st_row = st_df.loc[st_df[col] == name]
-    if len(st_row) == 0:
+    st_rows = _state_index(mode).get(name, [])
+    if len(st_rows) == 0:
         raise StateNotFound(
             f"State with {mode} {name} not found. Check {STATES} for available states."
         )
-    elif len(st_row) > 1:
+    elif len(st_rows) > 1:
         raise ValueError(f"Multiple states with {mode} {name} found.")
     else:
-        st_srs = st_row.iloc[0]
-        return State(fips=st_srs.STATE, abbr=st_srs.STUSAB, name=st_srs.STATE_NAME)
+        fips, abbr, st_name = st_rows[0]
+        return State(fips=fips, abbr=abbr, name=st_name)
+
+
+def resolve_states(values: pd.Series, errors: Literal["coerce", "raise"] = "coerce") -> pd.DataFrame:
+    """
+    Resolve a series of state fips codes, abbreviations, and/or names (in any case) to fips codes, abbreviations, and
+    names in one vectorized pass.
+
+    Args:
+        values: state identifiers, e.g. pd.Series(["AL", "alabama", "01", 1])
+        errors: if "coerce", unmatched values resolve to NA. If "raise", unmatched values raise `StateNotFound`.
+
+    Returns:
+        pd.DataFrame: columns fips, abbr, and name, aligned with `values`
+    """
+    keys = values.astype("string").str.split().str.join(" ").astype("string").str.casefold()
+    keys = keys.where(~keys.str.isdigit().fillna(False).astype(bool), keys.str.zfill(2))
+    fips = keys.map(_state_lookup())
+    missing = values.notna() & fips.isna()
+    if errors == "raise" and missing.any():
+        raise StateNotFound(
+            f"States not found: {', '.join(values[missing].astype(str).unique())}. Check {STATES} for available states."
+        )
+    st_df = _load_states().set_index("STATE")
+    out = st_df.reindex(fips.to_numpy())[["STUSAB", "STATE_NAME"]]
+    return pd.DataFrame(
+        {"fips": fips.astype("string").to_numpy(), "abbr": out["STUSAB"].to_numpy(), "name": out["STATE_NAME"].to_numpy()},
+        index=values.index,
+    )
+
+
+def resolve_counties(
+    states: pd.Series,
+    names: pd.Series,
+    ambiguous: Literal["na", "first", "raise"] = "na",
+    errors: Literal["coerce", "raise"] = "coerce",
+) -> pd.DataFrame:
+    """
+    Resolve county names (or the beginning of their names, in any case) or county fips codes within states to fips
+    codes and names. Each distinct (state, county) pair is resolved once and the results are broadcast back to the
+    input rows.
+
+    Args:
+        states: state identifiers, as in `resolve_states`
+        names: county names, name prefixes (e.g. "Montgomery"), or three digit county fips codes
+        ambiguous: how to resolve names matching more than one county (and none exactly). "na" leaves them
+            unresolved, "first" takes the alphabetically first match, "raise" raises `MultipleCountiesError`.
+        errors: if "raise", unmatched names raise `CountyNotFound`
+
+    Returns:
+        pd.DataFrame: columns state_fips, co_fips, co_name, and match ("exact", "prefix", "ambiguous", or "missing"),
+            aligned with `names`
+    """
+    st_fips = resolve_states(states, errors=errors)["fips"]
+    keys = pd.DataFrame({"state_fips": st_fips.to_numpy(), "name": names.astype("string").str.strip().to_numpy()})
+    uniques = keys.drop_duplicates()
+    resolved = [
+        _resolve_county(st, name, ambiguous=ambiguous, errors=errors)
+        for st, name in zip(uniques["state_fips"], uniques["name"])
+    ]
+    table = pd.concat(
+        [uniques.reset_index(drop=True), pd.DataFrame(resolved, columns=["co_fips", "co_name", "match"])], axis=1
+    )
+    out = keys.merge(table, on=["state_fips", "name"], how="left").drop(columns="name")
+    out.index = names.index
+    return out.astype({"co_fips": "string", "co_name": "string"})
+
+
+def _resolve_county(
+    st_fips: Optional[str], name: Optional[str], ambiguous: str, errors: str
+) -> Tuple[Optional[str], Optional[str], str]:
+    if pd.isna(st_fips) or pd.isna(name):
+        return None, None, "missing"
+    st_abbr = _state_index("fips")[st_fips][0][1]
+    index = _county_index(st_fips=st_fips, st_abbr=st_abbr)
+    if name.isdigit():
+        matches = index.fips(name.zfill(3))
+        match = "exact"
+    else:
+        matches = index.exact(name)
+        match = "exact"
+        if len(matches) == 0:
+            matches = index.prefix(name)
+            match = "prefix"
+    if len(matches) == 1:
+        return matches[0][0], matches[0][1], match
+    if len(matches) == 0:
+        if errors == "raise":
+            raise CountyNotFound(f"County {name} not found in state {st_fips}.")
+        return None, None, "missing"
+    if ambiguous == "raise":
+        raise MultipleCountiesError(
+            f"Multiple counties matching {name} found in state {st_fips}: {', '.join(x[1] for x in matches)}"
+        )
+    if ambiguous == "first":
+        return matches[0][0], matches[0][1], "ambiguous"
+    return None, None, "ambiguous"
 
 
 @dataclass
@@ -133,8 +293,14 @@ class State:
         return self.county_df["co_name"].tolist()
 
     def shp(
-        self, geom: GEOGRAPHY, year: int, cache: bool = False, cb: bool = False
-    ) -> gpd.GeoDataFrame:
+        self,
+        geom: GEOGRAPHY,
+        year: int,
+        cache: bool = False,
+        cb: bool = False,
+        tolerance: Optional[float] = None,
+        zoom: Optional[int] = None,
+    ) -> "gpd.GeoDataFrame":
         """
         returns the state's cartographic boundary files for the geom-year
 
@@ -143,11 +309,16 @@ class State:
             year (int): the year for which to return the geographies
             cache (bool): if True, cache the result
             cb (bool): if True, return the cartographic boundary (less detailed, more efficient) shps
+            tolerance (float): if given, simplify geometries to within this distance (degrees), preserving shared
+                borders (see `frechet.tiger.load_shp`)
+            zoom (int): alternatively to `tolerance`, the web map zoom level to simplify for
 
         Returns:
             geopandas.GeoDataFrame: A cartographic boundary geo data frame for the state
         """
-        return load_shp(st_fips=self.fips, geom=geom, year=year, cache=cache, cb=cb)
+        from frechet.tiger import load_shp  # defers the geopandas import to the first geometry load
+
+        return load_shp(st_fips=self.fips, geom=geom, year=year, cache=cache, cb=cb, tolerance=tolerance, zoom=zoom)
 
 
 @dataclass
@@ -178,26 +349,30 @@ class County:
             County
         """
         state = State.from_abbr(state_abbr)
-        matches = [x for x in state.counties if x.lower().startswith(name.lower())]
+        matches = _county_index(st_fips=state.fips, st_abbr=state.abbr).prefix(name)
         if len(matches) > 1:
             raise MultipleCountiesError(
-                f"Multiple counties matching {name} found in {state.name}: {', '.join(matches)}"
+                f"Multiple counties matching {name} found in {state.name}: {', '.join(x[1] for x in matches)}"
             )
         elif len(matches) == 0:
             raise CountyNotFound(f"County {name} not found in {state.name}.")
         else:
-            co_srs = state.county_df.loc[
-                state.county_df["co_name"].str.startswith(name)
-            ].iloc[0]
+            co_fips, co_name = matches[0]
             return cls(
-                fips=co_srs.co_fips,
-                name=co_srs.co_name,
+                fips=co_fips,
+                name=co_name,
                 state=state,
             )
 
     def shp(
-        self, geom: GEOGRAPHY, year: int, cache: bool = False, cb: bool = False
-    ) -> gpd.GeoDataFrame:
+        self,
+        geom: GEOGRAPHY,
+        year: int,
+        cache: bool = False,
+        cb: bool = False,
+        tolerance: Optional[float] = None,
+        zoom: Optional[int] = None,
+    ) -> "gpd.GeoDataFrame":
         """
         returns the county's cartographic boundary files for the geom-year
 
@@ -206,9 +381,22 @@ class County:
             year (int): the year for which to return the geographies
             cache (bool): if True, cache the result
             cb (bool): if True, return the cartographic boundary (less detailed, more efficient) shps
+            tolerance (float): if given, simplify geometries to within this distance (degrees), preserving shared
+                borders (see `frechet.tiger.load_shp`)
+            zoom (int): alternatively to `tolerance`, the web map zoom level to simplify for
 
         Returns:
             geopandas.GeoDataFrame: A cartographic boundary geo data frame for the state
         """
-        st_gdf = self.state.shp(geom=geom, year=year, cache=cache, cb=cb)
-        return st_gdf.loc[st_gdf["COUNTYFP"] == self.fips]
+        from frechet.tiger import load_shp
+
+        return load_shp(
+            st_fips=self.state.fips,
+            geom=geom,
+            year=year,
+            cache=cache,
+            cb=cb,
+            county_fips=self.fips,
+            tolerance=tolerance,
+            zoom=zoom,
+        )
@@ -0,0 +1,127 @@
+"""
+vectorized point-in-polygon assignment of coordinates to census geographies
+"""
+from functools import lru_cache
+from typing import *
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from frechet.geom import GEOGRAPHY, require_shapely2
+from frechet.tiger import CACHE_FORMAT, load_shp, load_states_shp
+
+ArrayLike = Union[np.ndarray, Sequence[float]]
+
+
+class Geocoder:
+    """
+    Assigns GEOIDs of `geom` units to longitude/latitude coordinates. Points are first routed to a state with a
+    spatial index over state boundaries, then matched against an STRtree over the state's `geom` boundaries. Indexes
+    are built on first use and shared between Geocoders.
+
+    Coordinates are compared to tiger geometries directly (NAD83, EPSG:4269), which is within a meter or two of WGS84
+    in the continental U.S.
+
+    Args:
+        geom (frechet.tiger.GEOM): geographies to assign, e.g. "tracts"
+        year (int): year of boundary files
+        cb (bool): if True, use cartographic boundary files (smaller, but clipped to the shoreline)
+        cache (bool): if True, cache downloaded boundary files to FRECHET_CACHE_DIR
+        cache_format (frechet.tiger.CACHE_FORMAT): see `load_shp`
+    """
+
+    def __init__(
+        self,
+        geom: GEOGRAPHY,
+        year: int,
+        cb: bool = False,
+        cache: bool = False,
+        cache_format: Optional[CACHE_FORMAT] = None,
+    ):
+        require_shapely2("Geocoder")
+        self.geom = geom
+        self.year = year
+        self.cb = cb
+        self.cache = cache
+        self.cache_format = cache_format
+
+    def assign(self, lon: ArrayLike, lat: ArrayLike, chunksize: int = 1_000_000) -> np.ndarray:
+        """
+        Args:
+            lon: longitudes
+            lat: latitudes
+            chunksize: number of points matched at a time, bounds peak memory
+
+        Returns:
+            np.ndarray: GEOID of the unit containing each point, None for points outside of every unit
+        """
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        if lon.shape != lat.shape:
+            raise ValueError("lon and lat must have the same shape.")
+        out = np.empty(len(lon), dtype=object)
+        for i in range(0, len(lon), chunksize):
+            out[i : i + chunksize] = self._assign_chunk(lon[i : i + chunksize], lat[i : i + chunksize])
+        return out
+
+    def assign_iter(self, chunks: Iterable[Tuple[ArrayLike, ArrayLike]]) -> Iterator[np.ndarray]:
+        """
+        Stream (lon, lat) chunks through the geocoder, e.g. from `pd.read_csv(..., chunksize=...)`.
+
+        Args:
+            chunks: iterable of (lon, lat) arrays
+
+        Yields:
+            np.ndarray: GEOIDs for each chunk, as in `assign`
+        """
+        for lon, lat in chunks:
+            yield self.assign(lon, lat)
+
+    def assign_states(self, lon: ArrayLike, lat: ArrayLike) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: fips code of the state containing each point, None for points outside of every state
+        """
+        tree, fips = _states_index(year=self.year, cb=self.cb, cache=self.cache, cache_format=self.cache_format)
+        return _match(tree, fips, shapely.points(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)))
+
+    def _assign_chunk(self, lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+        points = shapely.points(lon, lat)
+        st_tree, st_fips = _states_index(year=self.year, cb=self.cb, cache=self.cache, cache_format=self.cache_format)
+        states = _match(st_tree, st_fips, points)
+        out = np.full(len(points), None, dtype=object)
+        for st in pd.unique(states[pd.notna(states)]):
+            mask = states == st
+            tree, geoids = _geom_index(
+                st_fips=st, geom=self.geom, year=self.year, cb=self.cb, cache=self.cache, cache_format=self.cache_format
+            )
+            out[mask] = _match(tree, geoids, points[mask])
+        return out
+
+
+def _match(tree: "shapely.STRtree", labels: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """label of the first tree geometry intersecting each point (points on shared borders take either side)"""
+    out = np.full(len(points), None, dtype=object)
+    pt_idx, geom_idx = tree.query(points, predicate="intersects")
+    pt_idx, first = np.unique(pt_idx, return_index=True)
+    out[pt_idx] = labels[geom_idx[first]]
+    return out
+
+
+@lru_cache(maxsize=64)
+def _geom_index(
+    st_fips: str, geom: GEOGRAPHY, year: int, cb: bool, cache: bool, cache_format: Optional[CACHE_FORMAT]
+) -> Tuple["shapely.STRtree", np.ndarray]:
+    gdf = load_shp(
+        year=year, st_fips=st_fips, geom=geom, cb=cb, cache=cache, cache_format=cache_format, columns=["GEOID", "geometry"]
+    )
+    return shapely.STRtree(gdf.geometry.values), gdf["GEOID"].to_numpy(dtype=object)
+
+
+@lru_cache(maxsize=8)
+def _states_index(
+    year: int, cb: bool, cache: bool, cache_format: Optional[CACHE_FORMAT]
+) -> Tuple["shapely.STRtree", np.ndarray]:
+    gdf = load_states_shp(year=year, cb=cb, cache=cache, cache_format=cache_format, columns=["STATEFP", "geometry"])
+    return shapely.STRtree(gdf.geometry.values), gdf["STATEFP"].to_numpy(dtype=object)
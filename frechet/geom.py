@@ -1,4 +1,12 @@
 from typing import *
 
 PARENT = Literal["state", "county"]
-GEOGRAPHY = Literal['tracts', 'block_groups', 'county_sub', "blocks"]
\ No newline at end of file
+GEOGRAPHY = Literal['tracts', 'block_groups', 'county_sub', "blocks"]
+
+
+def require_shapely2(feature: str):
+    """raises ImportError unless the vectorized shapely>=2.0 api (module level STRtree, prepare, union_all) exists"""
+    import shapely
+
+    if not all(hasattr(shapely, x) for x in ("STRtree", "prepare", "union_all")):
+        raise ImportError(f"{feature} requires shapely>=2.0, found {shapely.__version__}.")
@@ -0,0 +1,336 @@
+"""
+opt-in instrumentation of frechet's loaders: per-stage timings, byte counts, and cache hits and misses
+
+Instrumentation is off by default and costs one global lookup per instrumented call site while off. Enable it with one
+or more sinks, each called with every `Event`:
+
+    from frechet import instrument
+
+    instrument.enable(instrument.LogSink())           # one json log line per event
+    instrument.enable(lambda event: print(event))     # any callable
+    with instrument.capture() as events:              # scoped, e.g. around one slow call
+        load_shp(year=2021, st_fips="24", geom="tracts")
+
+Every event is also aggregated in `REGISTRY` while instrumentation is on, which `snapshot` summarizes and
+`prometheus_text` renders in the Prometheus text exposition format (e.g. for the node exporter textfile collector).
+
+Stages are named "<area>.<stage>":
+
+    zip.download, zip.unzip             downloading and extracting boundary file zips
+    tiger.parse, tiger.rename           reading shapefiles, normalizing their columns
+    tiger.cache_read, tiger.cache_write reading and writing cached boundary files
+    simplify.topology                   topology-preserving simplification
+    crosswalk.build                     intersecting boundary layers for a crosswalk
+    census.validate, census.request,    checking variables against metadata, api requests, parsing responses, and
+    census.parse, census.coerce         coercing dtypes (typed=True)
+    metadata.fetch                      fetching metadata documents
+    search.build, search.query          indexing dataset variables, and searching them
+    join.geoid, join.take               matching api results to boundaries, and assembling the joined frame
+    http.queue                          waiting for the scheduler to admit a request (labelled by priority)
+
+Counters are "bytes" (labelled by source: zip, census, metadata), "http.requests" (labelled by status),
+"scheduler.congestion" (throttled or failed requests, labelled by host), and "cache" (see `cache`; caches are tiger,
+tiger.simplified, crosswalk, query, and metadata). Events raised in worker processes (e.g. `load_shp_many(...,
+executor="process")`) are not seen by sinks in the parent.
+"""
+import json
+import time
+import functools
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field, asdict
+from typing import *
+
+
+@dataclass(frozen=True)
+class Event:
+    """
+    Args:
+        kind (str): "timer" for a completed stage, "counter" for a count (bytes, requests, cache lookups)
+        name (str): stage or counter name, e.g. "zip.download" or "bytes"
+        value (float): seconds spent in the stage, or the amount counted
+        labels (dict): additional dimensions, e.g. {"source": "tiger"}
+    """
+
+    kind: Literal["timer", "counter"]
+    name: str
+    value: float
+    labels: Dict[str, str] = field(default_factory=dict)
+
+
+Sink = Callable[[Event], None]
+
+
+class Registry:
+    """
+    Thread-safe aggregate of events: call count, total and maximum seconds per stage, and totals per counter.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timers: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = defaultdict(float)
+
+    def __call__(self, event: Event):
+        key = (event.name, tuple(sorted(event.labels.items())))
+        with self._lock:
+            if event.kind == "timer":
+                timer = self._timers[key]
+                timer[0] += 1
+                timer[1] += event.value
+                timer[2] = max(timer[2], event.value)
+            else:
+                self._counters[key] += event.value
+
+    def reset(self):
+        with self._lock:
+            self._timers.clear()
+            self._counters.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns:
+            dict: "stages" (calls, seconds, max_seconds by stage), "counters" (totals by counter), and "caches"
+                (hits, misses, hit_ratio by cache). Labelled entries are keyed as `name{key=value,...}`.
+        """
+        with self._lock:
+            timers = {k: list(v) for k, v in self._timers.items()}
+            counters = dict(self._counters)
+        stages = {
+            _key(name, labels): {"calls": calls, "seconds": seconds, "max_seconds": max_seconds}
+            for (name, labels), (calls, seconds, max_seconds) in sorted(timers.items())
+        }
+        caches: Dict[str, Dict[str, float]] = {}
+        for (name, labels), value in sorted(counters.items()):
+            if name != "cache":
+                continue
+            labels = dict(labels)
+            cache = caches.setdefault(labels.pop("cache"), {"hits": 0, "misses": 0})
+            cache["hits" if labels.pop("result") == "hit" else "misses"] += value
+        for cache in caches.values():
+            cache["hit_ratio"] = cache["hits"] / (cache["hits"] + cache["misses"])
+        return {
+            "stages": stages,
+            "counters": {_key(name, labels): value for (name, labels), value in sorted(counters.items())},
+            "caches": caches,
+        }
+
+    def prometheus_text(self, prefix: str = "frechet") -> str:
+        """
+        Args:
+            prefix: prepended to every metric name
+
+        Returns:
+            str: the aggregates in the Prometheus text exposition format. Stages are a summary,
+                `<prefix>_stage_seconds{stage=...}`, and counters are `<prefix>_<name>_total`.
+        """
+        with self._lock:
+            timers = {k: list(v) for k, v in self._timers.items()}
+            counters = dict(self._counters)
+        lines = []
+        if len(timers) > 0:
+            metric = f"{prefix}_stage_seconds"
+            lines += [f"# HELP {metric} time spent in each stage", f"# TYPE {metric} summary"]
+            for (name, labels), (calls, seconds, _) in sorted(timers.items()):
+                labels = _labels((("stage", name),) + labels)
+                lines += [f"{metric}_count{labels} {calls}", f"{metric}_sum{labels} {_number(seconds)}"]
+        for name in sorted({name for name, _ in counters}):
+            metric = f"{prefix}_{name.replace('.', '_')}_total"
+            lines += [f"# TYPE {metric} counter"]
+            values = sorted((labels, value) for (n, labels), value in counters.items() if n == name)
+            lines += [f"{metric}{_labels(labels)} {_number(value)}" for labels, value in values]
+        return "".join(f"{line}\n" for line in lines)
+
+
+REGISTRY = Registry()
+_sinks: Tuple[Sink, ...] = ()  # empty while instrumentation is off
+
+
+class LogSink:
+    """
+    Logs each event as a single line of json, e.g.
+    `{"kind": "timer", "name": "zip.download", "value": 1.52, "labels": {}}`.
+
+    Args:
+        logger (str): name of the logger to write to
+        level (int): level to log at
+    """
+
+    def __init__(self, logger: str = "frechet.instrument", level: int = logging.INFO):
+        self.logger = logging.getLogger(logger)
+        self.level = level
+
+    def __call__(self, event: Event):
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, json.dumps(asdict(event)))
+
+
+def enable(*sinks: Sink):
+    """
+    Turn instrumentation on, sending events to `sinks` (and aggregating them in `REGISTRY`). Replaces any sinks
+    passed to an earlier call.
+
+    Args:
+        sinks: callables receiving each `Event`
+    """
+    global _sinks
+    _sinks = (REGISTRY,) + sinks
+
+
+def disable():
+    """
+    Turn instrumentation off. `REGISTRY` keeps the aggregates recorded so far.
+    """
+    global _sinks
+    _sinks = ()
+
+
+def enabled() -> bool:
+    return len(_sinks) > 0
+
+
+@contextmanager
+def capture(*sinks: Sink) -> Iterator[List[Event]]:
+    """
+    Instrument the body of the with statement, restoring the previous sinks on exit.
+
+    Args:
+        sinks: additional sinks for the duration of the block
+
+    Yields:
+        list: the events raised within the block, appended as they occur
+    """
+    global _sinks
+    events: List[Event] = []
+    previous = _sinks
+    _sinks = tuple(dict.fromkeys((previous or (REGISTRY,)) + sinks + (events.append,)))
+    try:
+        yield events
+    finally:
+        _sinks = previous
+
+
+def stage(name: str, **labels: str) -> ContextManager:
+    """
+    Time the body of the with statement as stage `name`. Stages that raise are reported with label error="1".
+
+    Args:
+        name: stage name, e.g. "tiger.parse"
+        labels: additional dimensions of the event
+    """
+    if not _sinks:
+        return _NOOP
+    return _Stage(name, labels)
+
+
+def timed(name: str) -> Callable[[Callable], Callable]:
+    """
+    Decorator timing each call of the decorated function as stage `name`.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _sinks:
+                return func(*args, **kwargs)
+            with _Stage(name, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, value: float = 1, **labels: str):
+    """
+    Args:
+        name: counter name, e.g. "bytes"
+        value: amount to add to the counter
+        labels: additional dimensions of the event
+    """
+    if _sinks:
+        _emit(Event(kind="counter", name=name, value=value, labels=labels))
+
+
+def cache(name: str, hit: bool, value: float = 1):
+    """
+    Count lookups in the cache `name`, as counter "cache" with labels cache=name and result=hit/miss.
+
+    Args:
+        name: which cache, e.g. "tiger", "query", "metadata"
+        hit: whether the lookups were served from the cache
+        value: number of lookups
+    """
+    if _sinks:
+        labels = {"cache": name, "result": "hit" if hit else "miss"}
+        _emit(Event(kind="counter", name="cache", value=value, labels=labels))
+
+
+def snapshot() -> Dict[str, Any]:
+    """
+    Returns:
+        dict: see `Registry.snapshot`
+    """
+    return REGISTRY.snapshot()
+
+
+def prometheus_text(prefix: str = "frechet") -> str:
+    """
+    Returns:
+        str: see `Registry.prometheus_text`
+    """
+    return REGISTRY.prometheus_text(prefix=prefix)
+
+
+def reset():
+    """
+    Clear the aggregates in `REGISTRY`.
+    """
+    REGISTRY.reset()
+
+
+_NOOP = nullcontext()
+
+
+class _Stage:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name: str, labels: Dict[str, str]):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        labels = self.labels if exc_type is None else {**self.labels, "error": "1"}
+        _emit(Event(kind="timer", name=self.name, value=time.perf_counter() - self.start, labels=labels))
+        return False
+
+
+def _emit(event: Event):
+    for sink in _sinks:
+        try:
+            sink(event)
+        except Exception as e:  # a broken sink must not break the load it is observing
+            logging.warning(f"Instrumentation sink {sink!r} failed: {e}")
+
+
+def _key(name: str, labels: Tuple[Tuple[str, str], ...]) -> str:
+    if len(labels) == 0:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if len(labels) == 0:
+        return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels) + "}"
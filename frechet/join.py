@@ -0,0 +1,156 @@
+"""
+joins of census api results to boundary files on GEOID
+
+The api reports each unit's geography as separate code columns (state, county, tract, ...), while boundary files
+carry the concatenated GEOID. `build_geoid` concatenates the code columns with fixed-width byte operations on whole
+arrays (categorical columns are encoded once per category), and `join_geoid` matches rows through a hash index on the
+integer value of the GEOID, rather than merging on strings.
+"""
+import logging
+from typing import *
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+from frechet import instrument
+from frechet.geom import GEOGRAPHY
+
+# api geography columns making up the GEOID of each geography, with their widths
+GEOID_PARTS: Dict[GEOGRAPHY, List[Tuple[str, int]]] = {
+    "tracts": [("state", 2), ("county", 3), ("tract", 6)],
+    "block_groups": [("state", 2), ("county", 3), ("tract", 6), ("block group", 1)],
+    "county_sub": [("state", 2), ("county", 3), ("county subdivision", 5)],
+    "blocks": [("state", 2), ("county", 3), ("tract", 6), ("block", 4)],
+}
+SHP_SUFFIX = "_shp"  # appended to boundary file columns that clash with data columns, e.g. NAME
+
+
+def build_geoid(df: pd.DataFrame, geom: GEOGRAPHY) -> np.ndarray:
+    """
+    Args:
+        df: api results, with the geography columns of `geom` (strings, categoricals, or integers)
+        geom: the geography of the results
+
+    Returns:
+        np.ndarray: fixed-width bytes GEOIDs, e.g. b"24031700101" for a tract
+    """
+    codes = _geoid_codes(df, geom)
+    return np.ascontiguousarray(codes).view(f"S{codes.shape[1]}").ravel()
+
+
+def join_geoid(
+    data: pd.DataFrame,
+    gdf: gpd.GeoDataFrame,
+    geom: GEOGRAPHY,
+    how: Literal["left", "inner"] = "left",
+) -> gpd.GeoDataFrame:
+    """
+    Join api results to boundaries on GEOID.
+
+    Args:
+        data: api results, one row per unit of `geom`
+        gdf: boundaries of `geom`, with a GEOID column
+        geom: the geography of both
+        how: "left" keeps every boundary, with missing data as NA, "inner" only boundaries with data
+
+    Returns:
+        geopandas.GeoDataFrame: the boundary columns, in the order of `gdf`, followed by the data columns other than
+            the api geography columns. Boundary columns that clash with data columns are suffixed with SHP_SUFFIX.
+            Data rows without a boundary are counted in `gdf.attrs["unmatched"]`.
+    """
+    with instrument.stage("join.geoid"):
+        index = pd.Index(_int_keys(_geoid_codes(data, geom)))
+        if not index.is_unique:
+            raise ValueError(f"Data has more than one row for some {geom}, cannot join on GEOID.")
+        width = sum(w for _, w in GEOID_PARTS[geom])
+        indexer = index.get_indexer(_int_keys(_digits(gdf["GEOID"], width, pad=False)))
+    with instrument.stage("join.take"):
+        matched = indexer >= 0
+        if how == "inner":
+            gdf = gdf.loc[matched]
+            indexer = indexer[matched]
+        elif how != "left":
+            raise ValueError(f"Unrecognized join {how}. Options are left, inner.")
+        geo_columns = [c for c, _ in GEOID_PARTS[geom]]
+        data_columns = [c for c in data.columns if c not in geo_columns]
+        columns = {f"{c}{SHP_SUFFIX}" if c in data_columns else c: gdf[c].array for c in gdf.columns}
+        for c in data_columns:
+            columns[c] = pd.api.extensions.take(data[c].array, indexer, allow_fill=True)
+        geometry = gdf.geometry.name
+        out = gpd.GeoDataFrame(
+            pd.DataFrame(columns, copy=False),
+            geometry=f"{geometry}{SHP_SUFFIX}" if geometry in data_columns else geometry,
+            crs=gdf.crs,
+        )
+    out.attrs = dict(data.attrs)
+    out.attrs["unmatched"] = int(len(data) - matched.sum())
+    if out.attrs["unmatched"] > 0:
+        logging.warning(f"{out.attrs['unmatched']} of {len(data)} {geom} in the data have no boundary")
+    return out
+
+
+def _geoid_codes(df: pd.DataFrame, geom: GEOGRAPHY) -> np.ndarray:
+    """the GEOIDs of the rows of `df`, as an (n, width) array of ascii digits"""
+    parts = GEOID_PARTS[geom]
+    out = np.empty((len(df), sum(w for _, w in parts)), dtype=np.uint8)
+    start = 0
+    for column, w in parts:
+        out[:, start : start + w] = _digits(df[column], w)
+        start += w
+    return out
+
+
+def _digits(values: pd.Series, width: int, pad: bool = True) -> np.ndarray:
+    """
+    codes as an (n, width) array of ascii digits. With pad=True, shorter codes are zero padded on the left, otherwise
+    every code must have `width` digits.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # each category is converted once
+        codes = values.cat.codes.to_numpy()
+        if (codes < 0).any():
+            raise ValueError(f"Column {values.name} has missing values.")
+        return _digits(pd.Series(values.cat.categories, name=values.name), width, pad=pad)[codes]
+    digits = _arrow_digits(values, width)
+    if digits is not None:
+        return digits
+    if values.isna().any():
+        raise ValueError(f"Column {values.name} has missing values.")
+    # one extra character, so codes that are too long are not silently truncated
+    strings = np.asarray(values.to_numpy(dtype=object if values.dtype == object else str), dtype=f"U{width + 1}")
+    if pad:
+        strings = np.char.zfill(strings, width).astype(f"U{width + 1}")
+    points = strings.view(np.uint32).reshape(len(values), width + 1)
+    digits = points[:, :width]
+    if not ((points[:, width] == 0) & ((digits >= 48) & (digits <= 57)).all(axis=1)).all():
+        raise ValueError(f"Column {values.name} has values that are not {width} digit codes.")
+    return digits.astype(np.uint8)
+
+
+def _arrow_digits(values: pd.Series, width: int) -> Optional[np.ndarray]:
+    """
+    zero-copy view of arrow backed strings as an (n, width) array, if every string has `width` ascii digits. Arrow
+    stores strings back to back in one buffer, so fixed-width codes already are the (n, width) array.
+    """
+    if not hasattr(values.array, "__arrow_array__"):
+        return None
+    import pyarrow as pa
+
+    array = pa.chunked_array(values.array.__arrow_array__()).combine_chunks()
+    if array.null_count > 0 or array.type not in (pa.string(), pa.large_string(), pa.binary(), pa.large_binary()):
+        return None
+    offset_type = np.int64 if array.type in (pa.large_string(), pa.large_binary()) else np.int32
+    _, offsets, data = array.buffers()
+    offsets = np.frombuffer(offsets, dtype=offset_type)[array.offset : array.offset + len(array) + 1]
+    if len(array) == 0 or not (np.diff(offsets) == width).all():
+        return None
+    digits = np.frombuffer(data, dtype=np.uint8)[offsets[0] : offsets[-1]].reshape(len(array), width)
+    if not ((digits >= 48) & (digits <= 57)).all():
+        return None
+    return digits
+
+
+def _int_keys(codes: np.ndarray) -> np.ndarray:
+    """the integer value of each row of ascii digits (at most 18), a cheaper hash key than the string"""
+    return (codes - 48).astype(np.int64) @ (10 ** np.arange(codes.shape[1] - 1, -1, -1, dtype=np.int64))
@@ -0,0 +1,291 @@
+"""
+caching layer for census api metadata (data.json, geography.json, variables.json)
+
+Parsed metadata documents are held in an in-memory LRU and, when FRECHET_CACHE_DIR is set, persisted as pickles under
+`FRECHET_CACHE_DIR/metadata`. Entries older than FRECHET_METADATA_TTL seconds are revalidated against the api with
+ETag/If-Modified-Since headers before being reused.
+"""
+import os
+import time
+import pickle
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import *
+
+from frechet import instrument, settings, transport
+from frechet.url import CENSUS_API_BASE
+
+if TYPE_CHECKING:
+    import requests
+    from frechet.aio import AsyncClient
+
+METADATA_SUBDIR = "metadata"
+_FORMAT_VERSION = 1
+
+
+@dataclass
+class MetadataEntry:
+    """
+    A parsed metadata document and the validators needed to revalidate it.
+
+    Args:
+        payload (dict): the parsed json document
+        fetched (float): unix time at which the document was last fetched or revalidated
+        etag (str): ETag header returned with the document, if any
+        last_modified (str): Last-Modified header returned with the document, if any
+    """
+
+    payload: Dict[str, Any]
+    fetched: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    def expired(self, ttl: float) -> bool:
+        return time.time() - self.fetched > ttl
+
+
+class MetadataCache:
+    """
+    Two level (memory, disk) cache of census api metadata documents keyed on their path relative to CENSUS_API_BASE,
+    e.g. "data.json" or "data/2020/dec/pl/variables.json".
+
+    Args:
+        cache_dir (str): root directory for persisted entries, disk caching is disabled if None
+        ttl (float): seconds after which an entry is revalidated against the api, defaults to FRECHET_METADATA_TTL
+        maxsize (int): maximum number of documents held in memory
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, ttl: Optional[float] = None, maxsize: int = 32):
+        self.cache_dir = cache_dir
+        self.ttl = settings.FRECHET_METADATA_TTL if ttl is None else ttl
+        self.maxsize = maxsize
+        self._memory: "OrderedDict[str, MetadataEntry]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, path: str) -> Dict[str, Any]:
+        """
+        Args:
+            path: location of the json document relative to CENSUS_API_BASE
+
+        Returns:
+            dict: the parsed document
+        """
+        with self._lock:
+            entry = self._memory.get(path)
+            if entry is not None:
+                self._memory.move_to_end(path)
+        if entry is None:
+            entry = self._read_disk(path)
+        hit = entry is not None and not entry.expired(self.ttl)
+        instrument.cache("metadata", hit=hit)
+        if not hit:
+            entry, _ = self._fetch(path, stale=entry)
+            self._write_disk(path, entry)
+        self._remember(path, entry)
+        return entry.payload
+
+    async def get_async(self, path: str, client: "AsyncClient") -> Dict[str, Any]:
+        """
+        As `get`, fetching through `client`. Disk reads and writes, and parsing, run in the client's executor.
+
+        Args:
+            path: location of the json document relative to CENSUS_API_BASE
+            client: the async client to fetch (and run blocking work) with
+
+        Returns:
+            dict: the parsed document
+        """
+        with self._lock:
+            entry = self._memory.get(path)
+            if entry is not None:
+                self._memory.move_to_end(path)
+        if entry is None:
+            entry = await client.run(self._read_disk, path)
+        hit = entry is not None and not entry.expired(self.ttl)
+        instrument.cache("metadata", hit=hit)
+        if not hit:
+            with instrument.stage("metadata.fetch"):
+                rsp = await client.get(f"{CENSUS_API_BASE}{path}", headers=self._validators(entry))
+            entry, _ = await client.run(self._from_response, path, rsp, entry)
+            await client.run(self._write_disk, path, entry)
+        self._remember(path, entry)
+        return entry.payload
+
+    def prefetch(self, path: str) -> int:
+        """
+        Fetch the document at `path` into the cache unless a fresh copy is already cached.
+
+        Args:
+            path: location of the json document relative to CENSUS_API_BASE
+
+        Returns:
+            int: number of bytes downloaded, 0 if the cached copy was fresh (or revalidated)
+        """
+        with self._lock:
+            entry = self._memory.get(path)
+        if entry is None:
+            entry = self._read_disk(path)
+        if entry is not None and not entry.expired(self.ttl):
+            return 0
+        entry, nbytes = self._fetch(path, stale=entry)
+        self._write_disk(path, entry)
+        self._remember(path, entry)
+        return nbytes
+
+    def invalidate(self, dataset: Optional[str] = None, year: Optional[int] = None):
+        """
+        Drop cached documents from memory and disk. With no arguments, everything is dropped.
+
+        Args:
+            dataset: only drop documents for this dataset, e.g. "acs/acs5"
+            year: only drop documents for this year (requires `dataset`)
+        """
+        if year is not None and dataset is None:
+            raise ValueError("Invalidating by `year` requires a `dataset`.")
+        if dataset is None:
+            prefix = ""
+        elif year is None:
+            prefix = None
+        else:
+            prefix = f"data/{year}/{dataset}/"
+        with self._lock:
+            for path in list(self._memory.keys()):
+                if self._matches(path, prefix, dataset):
+                    del self._memory[path]
+        root = self._root()
+        if root is None or not root.exists():
+            return
+        for fpath in root.rglob("*.pkl"):
+            rel = fpath.relative_to(root).with_suffix(".json").as_posix()
+            if self._matches(rel, prefix, dataset):
+                fpath.unlink(missing_ok=True)
+
+    @staticmethod
+    def _matches(path: str, prefix: Optional[str], dataset: Optional[str]) -> bool:
+        if prefix is not None:
+            return path.startswith(prefix)
+        parts = path.split("/")
+        return len(parts) > 2 and "/".join(parts[2:-1]) == dataset
+
+    def _remember(self, path: str, entry: MetadataEntry):
+        with self._lock:
+            self._memory[path] = entry
+            self._memory.move_to_end(path)
+            while len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
+
+    def _fetch(self, path: str, stale: Optional[MetadataEntry] = None) -> Tuple[MetadataEntry, int]:
+        with instrument.stage("metadata.fetch"):
+            rsp = transport.get(f"{CENSUS_API_BASE}{path}", headers=self._validators(stale))
+        return self._from_response(path, rsp, stale=stale)
+
+    @staticmethod
+    def _validators(stale: Optional[MetadataEntry]) -> Dict[str, str]:
+        headers = {}
+        if stale is not None:
+            if stale.etag is not None:
+                headers["If-None-Match"] = stale.etag
+            if stale.last_modified is not None:
+                headers["If-Modified-Since"] = stale.last_modified
+        return headers
+
+    @staticmethod
+    def _from_response(
+        path: str, rsp: "requests.Response", stale: Optional[MetadataEntry] = None
+    ) -> Tuple[MetadataEntry, int]:
+        """the entry for the api response `rsp` (or an async response with the same interface, see `frechet.aio`)"""
+        if stale is not None and rsp.status_code == 304:
+            logging.info(f"Revalidated cached metadata for {path}")
+            entry = MetadataEntry(
+                payload=stale.payload, fetched=time.time(), etag=stale.etag, last_modified=stale.last_modified
+            )
+            return entry, 0
+        rsp.raise_for_status()
+        logging.info(f"Fetched metadata from {CENSUS_API_BASE}{path}")
+        instrument.count("bytes", len(rsp.content), source="metadata")
+        entry = MetadataEntry(
+            payload=rsp.json(),
+            fetched=time.time(),
+            etag=rsp.headers.get("ETag"),
+            last_modified=rsp.headers.get("Last-Modified"),
+        )
+        return entry, len(rsp.content)
+
+    def _root(self) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        return Path(os.path.expanduser(self.cache_dir)) / METADATA_SUBDIR
+
+    def _disk_path(self, path: str) -> Optional[Path]:
+        root = self._root()
+        if root is None:
+            return None
+        return root / Path(path).with_suffix(".pkl")
+
+    def _read_disk(self, path: str) -> Optional[MetadataEntry]:
+        fpath = self._disk_path(path)
+        if fpath is None or not fpath.is_file():
+            return None
+        try:
+            with open(fpath, "rb") as f:
+                version, entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+            logging.warning(f"Discarding unreadable metadata cache entry at {fpath}")
+            return None
+        if version != _FORMAT_VERSION:
+            return None
+        logging.info(f"Loading metadata from local cache at {fpath}")
+        return entry
+
+    def _write_disk(self, path: str, entry: MetadataEntry):
+        fpath = self._disk_path(path)
+        if fpath is None:
+            return
+        os.makedirs(fpath.parent, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=fpath.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((_FORMAT_VERSION, entry), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, fpath)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def _metadata_cache() -> MetadataCache:
+    # the shared METADATA_CACHE is created on first use, so importing this module does not resolve settings
+    if "METADATA_CACHE" not in globals():
+        globals()["METADATA_CACHE"] = MetadataCache(cache_dir=settings.FRECHET_CACHE_DIR)
+    return globals()["METADATA_CACHE"]
+
+
+def __getattr__(name: str) -> Any:
+    if name == "METADATA_CACHE":
+        return _metadata_cache()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_metadata(path: str) -> Dict[str, Any]:
+    """
+    Args:
+        path: location of the json document relative to CENSUS_API_BASE, e.g. "data/2020/dec/pl/geography.json"
+
+    Returns:
+        dict: the parsed document, served from cache when fresh
+    """
+    return _metadata_cache().get(path)
+
+
+def invalidate_metadata(dataset: Optional[str] = None, year: Optional[int] = None):
+    """
+    Drop cached metadata. With no arguments, all cached metadata is dropped.
+
+    Args:
+        dataset: only drop documents for this dataset, e.g. "acs/acs5"
+        year: only drop documents for this year (requires `dataset`)
+    """
+    _metadata_cache().invalidate(dataset=dataset, year=year)
@@ -0,0 +1,170 @@
+"""
+content-addressed cache of census api query results
+
+Results of `Dataset.query(..., cache=True)` are stored as parquet files under `FRECHET_CACHE_DIR/queries`, named by
+the sha256 of the normalized request (dataset, year, geography, and fips_map, never the api key). One file holds
+every variable fetched so far for a request, each with the time it was fetched, so a query for a superset of cached
+variables only fetches the missing ones. Variables older than FRECHET_QUERY_TTL seconds are fetched again. Files are
+registered with the cache manifest (`frechet.cache`) and evicted with the rest of the cache.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+from pathlib import Path
+from typing import *
+
+import pandas as pd
+
+from frechet import instrument, settings
+from frechet.cache import manager as cache_manager
+from frechet.util import file_lock
+
+QUERY_SUBDIR = "queries"
+_METADATA_KEY = b"frechet"
+_FORMAT_VERSION = 1
+
+
+class QueryCache:
+    """
+    Args:
+        cache_dir (str): the cache directory
+        ttl (float): seconds after which cached variables are fetched again, defaults to FRECHET_QUERY_TTL
+    """
+
+    def __init__(self, cache_dir: str, ttl: Optional[float] = None):
+        self.cache_dir = cache_dir
+        self.ttl = settings.FRECHET_QUERY_TTL if ttl is None else ttl
+
+    @staticmethod
+    def request_key(dataset: str, year: int, geography: str, fips_map: Dict[str, str]) -> str:
+        """
+        Returns:
+            str: the content address of the request, independent of fips_map order and of the api key
+        """
+        request = {
+            "dataset": dataset,
+            "year": int(year),
+            "geography": geography,
+            "fips_map": sorted((str(k), str(v)) for k, v in fips_map.items()),
+        }
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+    def query(
+        self,
+        key: str,
+        vars: List[str],
+        fetch: Callable[[List[str]], pd.DataFrame],
+        refresh: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Serve `vars` from the entry at `key`, fetching (and caching) only variables that are missing or expired.
+
+        Args:
+            key: as returned by `request_key`
+            vars: variables to return, NAME and geography columns are always included
+            fetch: called with the variables to fetch, returns the api response as in `Dataset.query`
+            refresh: if True, fetch every variable in `vars` regardless of the cache
+
+        Returns:
+            pd.DataFrame: NAME, `vars`, and geography columns. `df.attrs["cache"]` lists the variables served from
+                the cache ("hits") and fetched from the api ("fetched").
+        """
+        vars = [x for x in dict.fromkeys(vars) if x != "NAME"]
+        path = self._path(key)
+        manager = cache_manager(self.cache_dir)
+        # serialize readers and writers of the entry so concurrent partial hits do not drop each other's variables
+        with file_lock(f"{path}.lock"):
+            cached, meta = (None, None) if not manager.lookup(self._manager_key(key)) else self._read(path)
+            fresh = [] if meta is None or refresh else self._fresh(meta, vars)
+            missing = [x for x in vars if x not in fresh]
+            instrument.cache("query", hit=True, value=len(vars) - len(missing))
+            instrument.cache("query", hit=False, value=len(missing))
+            if len(missing) == 0:
+                logging.info(f"Loading query results from local cache at {path}")
+                return self._select(cached, meta["geo"], vars, hits=vars, fetched=[])
+            fetched = fetch(missing)
+            geo = [c for c in fetched.columns if c != "NAME" and c not in missing]
+            now = time.time()
+            if cached is None or meta["geo"] != geo:
+                merged, fetched_at = fetched, {}
+            else:
+                # keep every other cached variable, refetched ones are replaced
+                from frechet.census import _join_chunks
+
+                merged = _join_chunks([cached.drop(columns=[c for c in missing if c in cached.columns]), fetched])
+                fetched_at = {k: v for k, v in meta["fetched"].items() if k not in missing}
+            fetched_at.update({x: now for x in missing})
+            self._write(path, merged, meta={"version": _FORMAT_VERSION, "geo": geo, "fetched": fetched_at})
+            manager.register(self._manager_key(key))
+            hits = [x for x in vars if x not in missing]
+            return self._select(merged, geo, vars, hits=hits, fetched=missing, attrs=fetched.attrs)
+
+    def _fresh(self, meta: Dict[str, Any], vars: List[str]) -> List[str]:
+        cutoff = time.time() - self.ttl
+        return [x for x in vars if meta["fetched"].get(x, -1) > cutoff]
+
+    @staticmethod
+    def _select(
+        df: pd.DataFrame,
+        geo: List[str],
+        vars: List[str],
+        hits: List[str],
+        fetched: List[str],
+        attrs: Optional[Dict[str, Any]] = None,
+    ) -> pd.DataFrame:
+        out = df[["NAME"] + vars + geo]
+        out.attrs = dict(attrs or {})
+        out.attrs["cache"] = {"hits": hits, "fetched": fetched}
+        return out
+
+    def _path(self, key: str) -> Path:
+        return Path(os.path.expanduser(self.cache_dir)) / QUERY_SUBDIR / f"{key}.parquet"
+
+    @staticmethod
+    def _manager_key(key: str) -> str:
+        return f"{QUERY_SUBDIR}/{key}.parquet"
+
+    @staticmethod
+    def _read(path: Path) -> Tuple[Optional[pd.DataFrame], Optional[Dict[str, Any]]]:
+        import pyarrow.parquet as pq
+
+        try:
+            table = pq.read_table(path)
+            meta = json.loads(table.schema.metadata[_METADATA_KEY])
+        except (OSError, KeyError, ValueError) as e:
+            logging.warning(f"Discarding unreadable query cache entry at {path}: {e}")
+            return None, None
+        if meta.get("version") != _FORMAT_VERSION:
+            return None, None
+        return table.to_pandas(), meta
+
+    @staticmethod
+    def _write(path: Path, df: pd.DataFrame, meta: Dict[str, Any]):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Caching query results requires pyarrow. Install frechet[parquet].")
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), _METADATA_KEY: json.dumps(meta)})
+        os.makedirs(path.parent, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            pq.write_table(table, tmp_path, compression="zstd")
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def query_cache() -> QueryCache:
+    """
+    Returns:
+        QueryCache: the query cache under FRECHET_CACHE_DIR, expiring variables after FRECHET_QUERY_TTL seconds
+    """
+    if settings.FRECHET_CACHE_DIR is None:
+        raise ValueError("Attempting to cache query results without setting FRECHET_CACHE_DIR. Please add to .env.")
+    return QueryCache(cache_dir=settings.FRECHET_CACHE_DIR, ttl=settings.FRECHET_QUERY_TTL)
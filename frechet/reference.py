@@ -0,0 +1,161 @@
+"""
+versioned offline snapshot of the state and county reference tables
+
+`State` and `County` construction reads the census state (frechet.url.STATES) and county (frechet.url.COUNTIES)
+reference files. When a snapshot of those files is bundled with the package (frechet/data/reference.pkl.gz), lookups
+are served from it without any network access. Rebuild the snapshot from the live files with
+
+    python -m frechet.reference refresh
+
+and describe a snapshot, including the files it was built from, with
+
+    python -m frechet.reference info
+
+Set FRECHET_REFERENCE=live to ignore the snapshot.
+"""
+import os
+import sys
+import gzip
+import pickle
+import logging
+import argparse
+import datetime
+import tempfile
+from functools import lru_cache
+from io import StringIO
+from pathlib import Path
+from typing import *
+
+import pandas as pd
+
+from frechet import settings, transport
+from frechet.url import STATES, COUNTIES
+
+SNAPSHOT_PATH = Path(__file__).parent / "data" / "reference.pkl.gz"
+SNAPSHOT_FORMAT = 1
+STATE_COLUMNS = ["STATE", "STUSAB", "STATE_NAME", "STATENS"]
+COUNTY_COLUMNS = ["state_abbr", "state_fips", "co_fips", "co_name", "co_type"]
+
+
+@lru_cache()
+def load_snapshot(path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Args:
+        path: location of the snapshot, defaults to the bundled SNAPSHOT_PATH
+
+    Returns:
+        dict: the snapshot, or None if it is missing, unreadable, of another format version, or disabled by
+            FRECHET_REFERENCE=live
+    """
+    if settings.FRECHET_REFERENCE == "live":
+        return None
+    path = SNAPSHOT_PATH if path is None else Path(path)
+    if not path.is_file():
+        return None
+    try:
+        with gzip.open(path, "rb") as f:
+            snapshot = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        logging.warning(f"Ignoring unreadable reference snapshot at {path}")
+        return None
+    if snapshot.get("format") != SNAPSHOT_FORMAT:
+        logging.warning(f"Ignoring reference snapshot at {path} with format {snapshot.get('format')}")
+        return None
+    return snapshot
+
+
+def snapshot_states() -> Optional[pd.DataFrame]:
+    """
+    Returns:
+        pd.DataFrame: the states table, as read from frechet.url.STATES, or None if no snapshot is available
+    """
+    snapshot = load_snapshot()
+    if snapshot is None:
+        return None
+    return pd.DataFrame(snapshot["states"], columns=STATE_COLUMNS).astype({"STATENS": int})
+
+
+def snapshot_counties(st_fips: str) -> Optional[pd.DataFrame]:
+    """
+    Returns:
+        pd.DataFrame: the state's county table, as read from frechet.url.COUNTIES, or None if the snapshot is not
+            available or does not include the state
+    """
+    snapshot = load_snapshot()
+    if snapshot is None or st_fips not in snapshot["counties"]:
+        return None
+    return pd.DataFrame(snapshot["counties"][st_fips], columns=COUNTY_COLUMNS)
+
+
+def build_snapshot(path: Union[str, Path] = SNAPSHOT_PATH) -> Dict[str, Any]:
+    """
+    Rebuild the snapshot from the live reference files and write it to `path`.
+
+    Args:
+        path: destination of the snapshot
+
+    Returns:
+        dict: the snapshot's metadata (everything but the tables)
+    """
+    st_df = pd.read_csv(StringIO(transport.get_text(STATES)), delimiter="|", dtype=str)
+    counties = {}
+    for st_fips, st_abbr in zip(st_df["STATE"], st_df["STUSAB"]):
+        rsp = transport.get(COUNTIES.format(st_fips=st_fips, st_abbr=st_abbr.lower()))
+        if rsp.status_code == 404:
+            logging.warning(f"No county reference file for state {st_fips}")
+            continue
+        rsp.raise_for_status()
+        co_df = pd.read_csv(StringIO(rsp.text), header=None, dtype=str)
+        counties[st_fips] = [tuple(x) for x in co_df.itertuples(index=False)]
+    snapshot = {
+        "format": SNAPSHOT_FORMAT,
+        "built": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "sources": {"states": STATES, "counties": COUNTIES},
+        "states": [tuple(x) for x in st_df[STATE_COLUMNS].itertuples(index=False)],
+        "counties": counties,
+    }
+    path = Path(path)
+    os.makedirs(path.parent, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+            pickle.dump(snapshot, f, protocol=4)
+        os.chmod(tmp_path, 0o644)  # mkstemp creates files readable by their owner only
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    load_snapshot.cache_clear()
+    return _info(snapshot)
+
+
+def _info(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "format": snapshot["format"],
+        "built": snapshot["built"],
+        "sources": snapshot["sources"],
+        "states": len(snapshot["states"]),
+        "counties": sum(len(x) for x in snapshot["counties"].values()),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m frechet.reference", description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    refresh = sub.add_parser("refresh", help="rebuild the snapshot from the live reference files")
+    refresh.add_argument("--output", default=str(SNAPSHOT_PATH), help="destination of the snapshot")
+    info = sub.add_parser("info", help="describe the bundled snapshot")
+    info.add_argument("--path", default=str(SNAPSHOT_PATH), help="location of the snapshot")
+    args = parser.parse_args(argv)
+    if args.command == "refresh":
+        print(build_snapshot(path=args.output))
+    else:
+        snapshot = load_snapshot(args.path)
+        if snapshot is None:
+            print(f"No usable reference snapshot at {args.path}")
+            sys.exit(1)
+        print(_info(snapshot))
+
+
+if __name__ == "__main__":
+    main()
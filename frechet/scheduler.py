@@ -0,0 +1,396 @@
+"""
+client-side scheduling of frechet's http requests: rate limits per api key, adaptive concurrency, and priorities
+
+The census api throttles each api key, answering bursts with 429s (or slow and empty responses). Every request made
+through `frechet.transport` (and `frechet.aio`) first acquires a permit from the shared `Scheduler`
+(`frechet.transport.scheduler()`), which
+
+- spaces requests with a token bucket per api key and host, at most `rate_limit` per second in bursts of `rate_burst`,
+  and holds back every request with the same key and host for the duration of a Retry-After header
+- bounds the requests in flight to each host by an AIMD limit: the limit grows by one for every limit's worth of
+  successful responses, and is halved when a response is throttled (429, 502, 503, 504), comes back empty (204, or
+  no body), a request fails to connect or times out, or a response is much slower than the smoothed latency of the
+  host. Streamed responses (e.g. boundary file downloads) hold their slot until they are closed, but their latency
+  is the time to the response headers, since reading the body takes as long as the file is large.
+- admits waiting requests in priority order, "interactive" before "normal" before "bulk", and in arrival order within a
+  priority
+
+Requests run at the priority of the context they are made in:
+
+    from frechet import scheduler
+
+    with scheduler.priority("bulk"):   # e.g. around a backfill, so interactive queries are served first
+        ds.query_many(year=2020, geography="tract", vars=vars, fips_maps="states")
+
+Context variables are not passed on to thread pools, use `bind` for work submitted to one.
+"""
+import time
+import heapq
+import asyncio
+import functools
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlsplit
+from typing import *
+
+from frechet import instrument
+
+PRIORITY = Literal["interactive", "normal", "bulk"]
+PRIORITIES: Dict[str, int] = {"interactive": 0, "normal": 1, "bulk": 2}
+CONGESTION_STATUSES = frozenset([204, 429, 502, 503, 504])
+LATENCY_FLOOR = 0.25  # seconds, responses faster than this never count as slow
+
+T = TypeVar("T")
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("frechet_priority", default="normal")
+
+
+@contextmanager
+def priority(level: PRIORITY) -> Iterator[None]:
+    """
+    Run requests made in the body of the with statement (in this thread or task) at priority `level`.
+
+    Args:
+        level: "interactive", "normal" (the default), or "bulk"
+    """
+    if level not in PRIORITIES:
+        raise ValueError(f"Unrecognized priority {level}. Options are {', '.join(PRIORITIES)}.")
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> PRIORITY:
+    return _priority.get()
+
+
+def bind(func: Callable[..., T]) -> Callable[..., T]:
+    """
+    Returns:
+        `func`, run in a copy of the caller's context (and so at the caller's priority) wherever it is called, e.g.
+            on the threads of a pool
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs) -> T:
+        return context.copy().run(func, *args, **kwargs)
+
+    return wrapper
+
+
+class TokenBucket:
+    """
+    Args:
+        rate (float): tokens added per second, None for no limit (the bucket then only enforces `pause`)
+        burst (int): maximum number of tokens held
+    """
+
+    def __init__(self, rate: Optional[float], burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take a token. Tokens are handed out in the order of the calls, going into debt if none are left, so waiting
+        for a token never reorders requests.
+
+        Returns:
+            float: seconds to wait before using the token
+        """
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self._paused_until - now)
+            if self.rate is None:
+                return delay
+            self._refill(now)
+            self._tokens -= 1
+            return max(delay, -self._tokens / self.rate)
+
+    def pause(self, seconds: float):
+        """
+        Hand out no tokens for `seconds`, e.g. as asked by a Retry-After header.
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class AdaptiveLimit:
+    """
+    Additive increase, multiplicative decrease (AIMD) concurrency limit. Not thread-safe, `Scheduler` guards it.
+
+    Args:
+        initial (int): starting limit
+        minimum (int): lowest limit
+        maximum (int): highest limit
+        decrease (float): factor applied to the limit on congestion
+        latency_factor (float): responses slower than this multiple of the smoothed latency count as congestion
+    """
+
+    def __init__(
+        self,
+        initial: int = 8,
+        minimum: int = 1,
+        maximum: int = 32,
+        decrease: float = 0.5,
+        latency_factor: float = 3.0,
+    ):
+        self.value = float(min(max(initial, minimum), maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.latency: Optional[float] = None  # exponentially smoothed latency of successful responses
+        self._decreased_at = float("-inf")
+
+    def __int__(self) -> int:
+        return int(self.value)
+
+    def on_success(self, latency: float):
+        if self.latency is not None and latency > max(LATENCY_FLOOR, self.latency_factor * self.latency):
+            self.on_congestion()
+        else:
+            self.value = min(self.maximum, self.value + 1 / self.value)
+        self.latency = latency if self.latency is None else 0.9 * self.latency + 0.1 * latency
+
+    def on_congestion(self):
+        # at most once per smoothed latency, so the failures of requests sent at the old limit only count once
+        now = time.monotonic()
+        if now - self._decreased_at < (self.latency or 0.0):
+            return
+        self.value = max(self.minimum, self.value * self.decrease)
+        self._decreased_at = now
+
+
+class Permit:
+    """
+    A request's slot in its host's concurrency limit, returned by `Scheduler.acquire`. One of `release` or `discard`
+    must be called when the request completes, later calls are ignored.
+    """
+
+    __slots__ = ("_scheduler", "_host", "_bucket", "_start", "_done")
+
+    def __init__(self, scheduler: "Scheduler", host: "_Host", bucket: TokenBucket):
+        self._scheduler = scheduler
+        self._host = host
+        self._bucket = bucket
+        self._start = time.monotonic()
+        self._done = False
+
+    def elapsed(self) -> float:
+        """
+        Returns:
+            float: seconds since the permit was granted
+        """
+        return time.monotonic() - self._start
+
+    def release(
+        self,
+        status: Optional[int],
+        retry_after: Optional[float] = None,
+        latency: Optional[float] = None,
+        empty: bool = False,
+    ):
+        """
+        Args:
+            status: response status, None if the request failed to connect or timed out
+            retry_after: seconds the server asked to wait before the next request
+            latency: seconds the request took, defaults to `elapsed()`
+            empty: whether a successful (200) response had no body, as the census api sends when silently throttling
+        """
+        if self._done:
+            return
+        self._done = True
+        if retry_after is not None:
+            self._bucket.pause(retry_after)
+        congested = status is None or status in CONGESTION_STATUSES or (empty and status == 200)
+        if congested:
+            instrument.count("scheduler.congestion", host=self._host.name)
+        latency = self.elapsed() if latency is None else latency
+        self._scheduler._release(self._host, congested=congested, latency=latency)
+
+    def discard(self):
+        """release the slot without adjusting the limit, e.g. when the request raised an unrelated error"""
+        if self._done:
+            return
+        self._done = True
+        self._scheduler._release(self._host, congested=None, latency=0.0)
+
+
+class Scheduler:
+    """
+    Admits requests under per host concurrency limits and per api key and host rate limits, in priority order.
+
+    Args:
+        rate_limit (float): requests per second per api key and host, None for no limit
+        rate_burst (int): requests that may be sent at once before `rate_limit` applies
+        max_concurrency (int): highest concurrency limit per host
+        initial_concurrency (int): concurrency limit per host before any responses are seen
+    """
+
+    def __init__(
+        self,
+        rate_limit: Optional[float] = None,
+        rate_burst: int = 10,
+        max_concurrency: int = 32,
+        initial_concurrency: int = 8,
+    ):
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.max_concurrency = max_concurrency
+        self.initial_concurrency = initial_concurrency
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, _Host] = {}
+        self._buckets: Dict[Tuple[str, Optional[str]], TokenBucket] = {}
+        self._seq = itertools.count()
+
+    def acquire(self, url: str, priority: Optional[PRIORITY] = None) -> Permit:
+        """
+        Block until a request to `url` may be sent.
+
+        Args:
+            url: the request url, whose host and `key` query parameter select the limits that apply
+            priority: defaults to the priority of the current context (see `priority`)
+
+        Returns:
+            Permit: to be released with the outcome of the request
+        """
+        host, bucket = self._lookup(url)
+        event = threading.Event()
+        with instrument.stage("http.queue", priority=priority or current_priority()):
+            ticket = self._enqueue(host, priority, wake=event.set)
+            try:
+                event.wait()
+                permit = Permit(self, host, bucket)
+                delay = bucket.reserve()
+                if delay > 0:
+                    time.sleep(delay)
+            except BaseException:  # e.g. KeyboardInterrupt, give the slot back
+                self._cancel(host, ticket)
+                raise
+        permit._start = time.monotonic()
+        return permit
+
+    async def acquire_async(self, url: str, priority: Optional[PRIORITY] = None) -> Permit:
+        """
+        As `acquire`, waiting without blocking the event loop.
+        """
+        host, bucket = self._lookup(url)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        with instrument.stage("http.queue", priority=priority or current_priority()):
+            ticket = self._enqueue(host, priority, wake=wake)
+            try:
+                await future
+                permit = Permit(self, host, bucket)
+                delay = bucket.reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            except BaseException:  # including cancellation
+                self._cancel(host, ticket)
+                raise
+        permit._start = time.monotonic()
+        return permit
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns:
+            dict: by host, the current concurrency "limit", requests "in_flight", requests "waiting", and smoothed
+                "latency" (seconds)
+        """
+        with self._lock:
+            return {
+                name: {
+                    "limit": host.limit.value,
+                    "in_flight": host.in_flight,
+                    "waiting": sum(not t.cancelled for t in host.waiting),
+                    "latency": host.limit.latency,
+                }
+                for name, host in self._hosts.items()
+            }
+
+    def _lookup(self, url: str) -> Tuple["_Host", TokenBucket]:
+        parts = urlsplit(url)
+        key = parse_qs(parts.query).get("key", [None])[0]
+        with self._lock:
+            if parts.netloc not in self._hosts:
+                limit = AdaptiveLimit(initial=self.initial_concurrency, maximum=self.max_concurrency)
+                self._hosts[parts.netloc] = _Host(parts.netloc, limit)
+            if (parts.netloc, key) not in self._buckets:
+                self._buckets[(parts.netloc, key)] = TokenBucket(self.rate_limit, burst=self.rate_burst)
+            return self._hosts[parts.netloc], self._buckets[(parts.netloc, key)]
+
+    def _enqueue(self, host: "_Host", priority: Optional[PRIORITY], wake: Callable[[], None]) -> "_Ticket":
+        level = current_priority() if priority is None else priority
+        if level not in PRIORITIES:
+            raise ValueError(f"Unrecognized priority {level}. Options are {', '.join(PRIORITIES)}.")
+        ticket = _Ticket((PRIORITIES[level], next(self._seq)), wake)
+        with self._lock:
+            heapq.heappush(host.waiting, ticket)
+            self._dispatch(host)
+        return ticket
+
+    def _cancel(self, host: "_Host", ticket: "_Ticket"):
+        with self._lock:
+            if ticket.granted:
+                host.in_flight -= 1
+            ticket.cancelled = True
+            self._dispatch(host)
+
+    def _release(self, host: "_Host", congested: Optional[bool], latency: float):
+        with self._lock:
+            host.in_flight -= 1
+            if congested:
+                host.limit.on_congestion()
+            elif congested is not None:
+                host.limit.on_success(latency)
+            self._dispatch(host)
+
+    def _dispatch(self, host: "_Host"):
+        # called holding the lock
+        while host.waiting and host.in_flight < max(1, int(host.limit)):
+            ticket = heapq.heappop(host.waiting)
+            if ticket.cancelled:
+                continue
+            ticket.granted = True
+            host.in_flight += 1
+            ticket.wake()
+
+
+class _Host:
+    __slots__ = ("name", "limit", "in_flight", "waiting")
+
+    def __init__(self, name: str, limit: AdaptiveLimit):
+        self.name = name
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting: List[_Ticket] = []  # heap, by priority then arrival
+
+
+class _Ticket:
+    __slots__ = ("rank", "wake", "granted", "cancelled")
+
+    def __init__(self, rank: Tuple[int, int], wake: Callable[[], None]):
+        self.rank = rank
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        return self.rank < other.rank
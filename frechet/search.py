@@ -0,0 +1,274 @@
+"""
+full-text search over the variables of a dataset, across years
+
+`VariableIndex` keeps an sqlite FTS5 (full-text) index of the code, labels, and concepts of every variable of a
+dataset in every year it is available, one document per variable code. Each year's variables.json is read once,
+through the metadata cache (`frechet.metadata`), and years already indexed are never read again, so after the first
+build searches answer from the index alone. Variables whose codes are reused across years with other labels are
+found under any of their labels, and `availability` shows the years in which each code exists.
+
+    index = variable_index("acs/acs5")
+    index.search("median household income", concept="MEDIAN HOUSEHOLD INCOME")
+    index.availability(["B19013_001E"])
+
+Indexes are stored at FRECHET_CACHE_DIR/search/<dataset>.sqlite (in memory if FRECHET_CACHE_DIR is not set).
+"""
+import os
+import re
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import *
+
+import pandas as pd
+
+from frechet import instrument, scheduler, settings
+from frechet.metadata import get_metadata
+
+SEARCH_SUBDIR = "search"
+_FORMAT_VERSION = 1
+_TOKEN = re.compile(r"[\w*]+")
+# bm25 weights of the code, label, and concept columns
+_BM25_WEIGHTS = (10.0, 2.0, 1.0)
+
+
+class VariableIndex:
+    """
+    Args:
+        dataset (str): dataset name, e.g. "acs/acs5"
+        path (str): location of the index database, in memory if None
+    """
+
+    def __init__(self, dataset: str, path: Optional[Union[str, Path]] = None):
+        self.dataset = dataset
+        self.path = None if path is None else Path(os.path.expanduser(path))
+        self._local = threading.local()
+        self._memory: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        if self.path is not None:
+            os.makedirs(self.path.parent, exist_ok=True)
+        with self._lock, self._db() as db:
+            version = db.execute("PRAGMA user_version").fetchone()[0]
+            if version not in (0, _FORMAT_VERSION):
+                db.executescript(
+                    "DROP TABLE IF EXISTS variables; DROP TABLE IF EXISTS years; DROP TABLE IF EXISTS docs;"
+                )
+            try:
+                db.executescript(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS years (year INTEGER PRIMARY KEY);
+                    CREATE TABLE IF NOT EXISTS variables (
+                        code TEXT NOT NULL,
+                        year INTEGER NOT NULL,
+                        label TEXT,
+                        concept TEXT,
+                        predicate_type TEXT,
+                        PRIMARY KEY (code, year)
+                    );
+                    CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5(
+                        code, label, concept, tokenize="unicode61 tokenchars '_'"
+                    );
+                    PRAGMA user_version = {_FORMAT_VERSION};
+                    """
+                )
+            except sqlite3.OperationalError as e:
+                raise RuntimeError(f"Variable search requires sqlite with FTS5 support: {e}")
+
+    def years(self) -> List[int]:
+        """
+        Returns:
+            list: years indexed so far
+        """
+        return [x[0] for x in self._db().execute("SELECT year FROM years ORDER BY year")]
+
+    @instrument.timed("search.build")
+    def build(self, years: Iterable[int], refresh: bool = False, max_workers: int = 8) -> List[int]:
+        """
+        Index the variables of `years`, reading their variables.json (concurrently) from the metadata cache.
+
+        Args:
+            years: years to index
+            refresh: if True, index years again even if they are already indexed
+            max_workers: maximum number of metadata documents fetched at once
+
+        Returns:
+            list: the years indexed by this call. Years whose metadata cannot be fetched are skipped with a warning.
+        """
+        indexed = set(self.years())
+        years = sorted({int(y) for y in years if refresh or int(y) not in indexed})
+        if len(years) == 0:
+            return []
+        from frechet.census import _is_queryable
+
+        def fetch(year: int) -> Optional[List[Tuple[Any, ...]]]:
+            try:
+                variables = get_metadata(f"data/{year}/{self.dataset}/variables.json")["variables"]
+            except Exception as e:
+                logging.warning(f"Could not index variables of {self.dataset}-{year}: {e}")
+                return None
+            return [
+                (code, year, meta.get("label"), meta.get("concept"), meta.get("predicateType"))
+                for code, meta in variables.items()
+                if _is_queryable(code, meta)
+            ]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(scheduler.bind(fetch), years))
+        done = [year for year, rows in zip(years, results) if rows is not None]
+        with self._lock, self._db() as db:
+            db.execute("BEGIN")
+            for year, rows in zip(years, results):
+                if rows is None:
+                    continue
+                db.execute("DELETE FROM variables WHERE year = ?", (year,))
+                db.executemany("INSERT INTO variables VALUES (?, ?, ?, ?, ?)", rows)
+                db.execute("INSERT OR REPLACE INTO years VALUES (?)", (year,))
+            # one document per code, holding its distinct labels and concepts across years
+            db.execute("DELETE FROM docs")
+            db.execute(
+                """
+                INSERT INTO docs (rowid, code, label, concept)
+                SELECT v.rowid, v.code, l.labels, c.concepts
+                FROM (SELECT MIN(rowid) AS rowid, code FROM variables GROUP BY code) v
+                LEFT JOIN (SELECT code, group_concat(DISTINCT label) AS labels FROM variables GROUP BY code) l
+                    ON l.code = v.code
+                LEFT JOIN (SELECT code, group_concat(DISTINCT concept) AS concepts FROM variables GROUP BY code) c
+                    ON c.code = v.code
+                """
+            )
+        return done
+
+    @instrument.timed("search.query")
+    def search(
+        self,
+        text: str,
+        concept: Optional[str] = None,
+        years: Optional[Iterable[int]] = None,
+        limit: Optional[int] = 20,
+    ) -> pd.DataFrame:
+        """
+        Ranked (bm25) search of variable codes, labels, and concepts. Every word of `text` must match; a word ending
+        in "*" matches any word it prefixes, e.g. "B19013*". Matches in codes rank above matches in labels, and those
+        above matches in concepts.
+
+        Args:
+            text: words to search for
+            concept: only return variables with a concept containing this text (case-insensitive) in some year
+            years: only return variables available in every one of these years
+            limit: maximum number of results, all if None
+
+        Returns:
+            pd.DataFrame: indexed by code, the label and concept in the latest year the variable is available, the
+                years it is available, and its score (lower is better), best matches first
+        """
+        query = _fts_query(text)
+        if query is None:
+            raise ValueError("Search text has no words.")
+        clauses, params = ["docs MATCH ?"], [query]
+        if concept is not None:
+            clauses.append("docs.code IN (SELECT code FROM variables WHERE concept LIKE ?)")
+            params.append(f"%{concept}%")
+        for year in [] if years is None else sorted(set(years)):
+            clauses.append("docs.code IN (SELECT code FROM variables WHERE year = ?)")
+            params.append(int(year))
+        rows = self._db().execute(
+            f"""
+            SELECT docs.code, bm25(docs, {', '.join(map(str, _BM25_WEIGHTS))}) AS score
+            FROM docs WHERE {' AND '.join(clauses)}
+            ORDER BY score LIMIT ?
+            """,
+            params + [-1 if limit is None else limit],
+        ).fetchall()
+        codes = [x[0] for x in rows]
+        details = self._details(codes)
+        out = pd.DataFrame({"code": codes, "score": [x[1] for x in rows]}).set_index("code")
+        return details.join(out)[["label", "concept", "years", "score"]]
+
+    def availability(self, codes: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """
+        Args:
+            codes: variables to report, every indexed variable if None
+
+        Returns:
+            pd.DataFrame: bool matrix with one row per variable code and one column per indexed year, True where the
+                variable is available
+        """
+        sql, params = "SELECT code, year FROM variables", []
+        if codes is not None:
+            codes = list(codes)
+            sql += f" WHERE code IN ({', '.join('?' * len(codes))})"
+            params = codes
+        df = pd.DataFrame(self._db().execute(sql, params).fetchall(), columns=["code", "year"])
+        matrix = pd.crosstab(df["code"], df["year"]).astype(bool).reindex(columns=self.years(), fill_value=False)
+        if codes is not None:
+            matrix = matrix.reindex(codes, fill_value=False)
+        matrix.columns.name = None
+        return matrix
+
+    def _details(self, codes: List[str]) -> pd.DataFrame:
+        if len(codes) == 0:
+            return pd.DataFrame({"label": [], "concept": [], "years": []}, index=pd.Index([], name="code"))
+        rows = self._db().execute(
+            f"SELECT code, year, label, concept FROM variables WHERE code IN ({', '.join('?' * len(codes))}) "
+            "ORDER BY code, year",
+            codes,
+        ).fetchall()
+        df = pd.DataFrame(rows, columns=["code", "year", "label", "concept"])
+        grouped = df.groupby("code", sort=False)
+        out = grouped[["label", "concept"]].last()
+        out["years"] = grouped["year"].agg(list)
+        return out.reindex(codes)
+
+    def _db(self) -> sqlite3.Connection:
+        if self.path is None:
+            # a single in-memory database, shared by threads
+            if self._memory is None:
+                self._memory = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+            return self._memory
+        # one connection per thread (and process), as in `frechet.cache.CacheManager`
+        conn, pid = getattr(self._local, "conn", (None, None))
+        if conn is None or pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = (conn, os.getpid())
+        return conn
+
+
+_indexes: Dict[str, VariableIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def variable_index(dataset: str, refresh: bool = False) -> VariableIndex:
+    """
+    Args:
+        dataset: dataset name, e.g. "acs/acs5"
+        refresh: if True, index every year again
+
+    Returns:
+        VariableIndex: the shared index of `dataset`, with every available year indexed
+    """
+    from frechet.census import Dataset
+
+    years = Dataset(dataset).available_years
+    with _indexes_lock:
+        if dataset not in _indexes:
+            path = None
+            if settings.FRECHET_CACHE_DIR is not None:
+                path = Path(settings.FRECHET_CACHE_DIR) / SEARCH_SUBDIR / f"{dataset.replace('/', '_')}.sqlite"
+            _indexes[dataset] = VariableIndex(dataset, path=path)
+        index = _indexes[dataset]
+    index.build(years, refresh=refresh)
+    return index
+
+
+def _fts_query(text: str) -> Optional[str]:
+    # every word as a quoted fts5 string, so words like AND, NOT, or "-" are never read as query syntax
+    terms = []
+    for word in _TOKEN.findall(text):
+        prefix = word.endswith("*")
+        word = word.strip("*")
+        if word:
+            terms.append(f'"{word}"*' if prefix else f'"{word}"')
+    return " ".join(terms) if terms else None
@@ -1,7 +1,48 @@
+"""
+settings read from the environment, and from a .env file
+
+Settings are resolved on first access (loading .env at that point), not when frechet is imported, so modules that
+only need some of them, or none, do not pay for finding and parsing .env.
+"""
 import os
-from dotenv import load_dotenv
+from typing import *
+
+_SETTINGS: Dict[str, Callable[[], Any]] = {
+    "FRECHET_CACHE_DIR": lambda: os.getenv("FRECHET_CACHE_DIR"),
+    "FRECHET_CACHE_FORMAT": lambda: os.getenv("FRECHET_CACHE_FORMAT", "shp"),  # shp, parquet, or feather
+    "FRECHET_CACHE_MAX_BYTES": lambda: (
+        int(os.environ["FRECHET_CACHE_MAX_BYTES"]) if "FRECHET_CACHE_MAX_BYTES" in os.environ else None
+    ),
+    "FRECHET_METADATA_TTL": lambda: float(os.getenv("FRECHET_METADATA_TTL", 60 * 60 * 24)),  # seconds
+    "FRECHET_QUERY_TTL": lambda: float(os.getenv("FRECHET_QUERY_TTL", 60 * 60 * 24 * 30)),  # seconds
+    "FRECHET_HTTP_TIMEOUT": lambda: float(os.getenv("FRECHET_HTTP_TIMEOUT", 60)),  # seconds
+    "FRECHET_HTTP_RETRIES": lambda: int(os.getenv("FRECHET_HTTP_RETRIES", 5)),
+    "FRECHET_RATE_LIMIT": lambda: (  # requests per second per api key and host
+        float(os.environ["FRECHET_RATE_LIMIT"]) if "FRECHET_RATE_LIMIT" in os.environ else None
+    ),
+    "FRECHET_REFERENCE": lambda: os.getenv("FRECHET_REFERENCE", "snapshot"),  # snapshot or live
+    "CENSUS_API_KEY": lambda: os.getenv("CENSUS_API_KEY"),
+}
+_dotenv_loaded = False
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _SETTINGS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    _load_dotenv()
+    value = _SETTINGS[name]()
+    globals()[name] = value  # later lookups bypass __getattr__
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(list(globals()) + list(_SETTINGS))
+
 
-load_dotenv()  # TODO: test .env finding outside context of frechet module
+def _load_dotenv():
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        from dotenv import load_dotenv
 
-FRECHET_CACHE_DIR = os.getenv("FRECHET_CACHE_DIR")
-CENSUS_API_KEY = os.getenv("CENSUS_API_KEY")
\ No newline at end of file
+        load_dotenv()  # TODO: test .env finding outside context of frechet module
+        _dotenv_loaded = True
@@ -0,0 +1,75 @@
+"""
+topology-preserving simplification of boundary files
+
+Simplifying each polygon on its own moves shared borders differently on either side, opening slivers and overlaps
+between neighbors. Here the boundaries of all polygons are instead noded into arcs, each shared border becoming a
+single arc between junctions, the arcs are simplified together (keeping their endpoints and never crossing), and the
+polygons are rebuilt from the simplified arcs. Neighbors therefore still share exactly the same border.
+"""
+from typing import *
+
+import numpy as np
+import geopandas as gpd
+import shapely
+
+from frechet import instrument
+from frechet.geom import require_shapely2
+
+
+def zoom_tolerance(zoom: int) -> float:
+    """
+    Args:
+        zoom: web map zoom level
+
+    Returns:
+        float: simplification tolerance (degrees) of one pixel of a 256px tile at `zoom`, at the equator
+    """
+    return 360 / (256 * 2 ** zoom)
+
+
+@instrument.timed("simplify.topology")
+def simplify_topology(gdf: gpd.GeoDataFrame, tolerance: float) -> gpd.GeoDataFrame:
+    """
+    Simplify the polygons in `gdf` without separating or overlapping shared borders.
+
+    Args:
+        gdf: polygon geometries (e.g. tracts of a state), assumed not to overlap
+        tolerance: maximum distance (in units of the crs) between a simplified and an original border
+
+    Returns:
+        geopandas.GeoDataFrame: a copy of `gdf` with simplified geometries
+    """
+    require_shapely2("Topology-preserving simplification")
+    geoms = gdf.geometry.to_numpy()
+    valid = ~(shapely.is_missing(geoms) | shapely.is_empty(geoms))
+    out = geoms.copy()
+    if valid.any():
+        out[valid] = _simplify(geoms[valid], tolerance=tolerance)
+    result = gdf.copy()
+    result.geometry = gpd.GeoSeries(out, index=gdf.index, crs=gdf.crs)
+    return result
+
+
+def _simplify(geoms: np.ndarray, tolerance: float) -> np.ndarray:
+    # node the borders of all polygons (union_all splits lines wherever they meet) and merge the pieces between
+    # junctions into arcs, so each shared border is one arc
+    arcs = shapely.line_merge(shapely.union_all(shapely.boundary(geoms)))
+    # simplifying all arcs together keeps their endpoints and prevents them from crossing one another
+    arcs = shapely.simplify(arcs, tolerance=tolerance, preserve_topology=True)
+    faces = shapely.get_parts(shapely.polygonize(shapely.get_parts(arcs)))
+
+    # assign each face to the original polygon containing it, holes and gaps between polygons are dropped
+    face_idx, geom_idx = shapely.STRtree(geoms).query(shapely.point_on_surface(faces), predicate="intersects")
+    face_idx, first = np.unique(face_idx, return_index=True)
+    geom_idx = geom_idx[first]
+    order = np.argsort(geom_idx, kind="stable")
+    face_idx, geom_idx = face_idx[order], geom_idx[order]
+
+    out = np.empty(len(geoms), dtype=object)
+    matched, counts = np.unique(geom_idx, return_counts=True)
+    parts = shapely.multipolygons(faces[face_idx], indices=np.repeat(np.arange(len(matched)), counts))
+    out[matched] = np.where(counts == 1, shapely.get_geometry(parts, 0), parts)
+    # polygons smaller than the tolerance can lose every face, fall back to simplifying them on their own
+    lost = np.setdiff1d(np.arange(len(geoms)), matched)
+    out[lost] = shapely.simplify(geoms[lost], tolerance=tolerance, preserve_topology=True)
+    return out
@@ -1,15 +1,22 @@
 import os
+import re
+import time
 import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import *
 import shutil
 
+import pandas as pd
 import geopandas as gpd
 
+from frechet import instrument, settings
+from frechet.cache import manager as cache_manager
 from frechet.geom import GEOGRAPHY
+from frechet.simplify import simplify_topology, zoom_tolerance
 from frechet.url import TIGER_BASE
-from frechet.util import unzip_to_tmp, cache_result_dir, RESULT_DIR
-from frechet.settings import FRECHET_CACHE_DIR
+from frechet.util import unzip_to_tmp, download_zip, cache_result_dir, file_lock
 
 
 GEOM_MAP: Dict[GEOGRAPHY, str] = {
@@ -19,6 +26,8 @@ GEOM_MAP: Dict[GEOGRAPHY, str] = {
     "blocks": "tabblock"
 }
 CB_GEOM = Literal["tracts", "block_groups", "county_sub"]  # geoms for which cartographic boundary files are available
+CACHE_FORMAT = Literal["shp", "parquet", "feather"]
+PARQUET_ROW_GROUP_SIZE = 4096
 
 
 class ShpNotFound(Exception):
@@ -31,7 +40,18 @@ class CBUnavailable(Exception):
 
 # TODO move tiger stuff onto rest API
 # https://github.com/nkrishnaswami/uscensus/blob/master/GetCountyShapes.ipynb
-def load_shp(year: int, st_fips: str, geom: GEOGRAPHY, cache: bool = False, cb: bool = False):
+def load_shp(
+    year: int,
+    st_fips: str,
+    geom: GEOGRAPHY,
+    cache: bool = False,
+    cb: bool = False,
+    cache_format: Optional[CACHE_FORMAT] = None,
+    columns: Optional[List[str]] = None,
+    county_fips: Optional[str] = None,
+    tolerance: Optional[float] = None,
+    zoom: Optional[int] = None,
+) -> Union[gpd.GeoDataFrame, pd.DataFrame]:
     """
     Load cartographic boundary files for st-geom-year. If cache=True, save the results to FRECHET_CACHE_DIR.
 
@@ -41,40 +61,461 @@ def load_shp(year: int, st_fips: str, geom: GEOGRAPHY, cache: bool = False, cb:
         geom (frechet.tiger.GEOM): type of geometries to request, tracts, block_groups, or county subdivisions
         cache (bool): If True, save results to FRECHET_CACHE_DIR
         cb (bool): if True, return the cartographic boundary (less detailed, more efficient) shps
+        cache_format (frechet.tiger.CACHE_FORMAT): how cached results are stored, the raw shapefile ("shp") or the
+            normalized GeoDataFrame as GeoParquet ("parquet") or Feather ("feather"). Columnar formats require pyarrow.
+            Shapefile caches are migrated to a columnar format when first read with one, and stay cached for shp
+            reads. Defaults to FRECHET_CACHE_FORMAT.
+        columns (list): if given, only return these columns. Omit "geometry" to return a plain DataFrame.
+        county_fips (str): if given, only return geometries in this county. The filter is pushed down to the reader
+            (an attribute filter for shapefiles, row group statistics for parquet), so the rest of the state is
+            never materialized.
+        tolerance (float): if given, simplify geometries to within this distance (degrees) of the originals. The whole
+            state is simplified at once, preserving topology, so neighboring geometries keep sharing borders. With
+            cache=True, each tolerance is computed once and cached alongside the original file.
+        zoom (int): alternatively to `tolerance`, the web map zoom level to simplify for (see
+            `frechet.simplify.zoom_tolerance`)
 
     Returns:
         geopandas.DataFrame:
     """
+    subpath, fname, cache_format = _resolve(year=year, st_fips=st_fips, geom=geom, cb=cb, cache_format=cache_format)
+    tolerance = _resolve_tolerance(tolerance=tolerance, zoom=zoom)
+    _validate_county_fips(county_fips=county_fips)
+    kwargs = dict(cache=cache, cache_format=cache_format, columns=columns, county_fips=county_fips)
+    if tolerance is not None:
+        return _load_simplified(subpath=subpath, fname=fname, tolerance=tolerance, **kwargs)
+    return _load(subpath=subpath, fname=fname, **kwargs)
+
+
+def load_states_shp(
+    year: int,
+    cache: bool = False,
+    cb: bool = False,
+    cache_format: Optional[CACHE_FORMAT] = None,
+    columns: Optional[List[str]] = None,
+) -> Union[gpd.GeoDataFrame, pd.DataFrame]:
+    """
+    Load the national state boundary file for `year`. Arguments are as in `load_shp`.
+
+    Returns:
+        geopandas.GeoDataFrame: one row per state (and territory)
+    """
     if year < 2014:
         raise ValueError("Tiger loads for years prior to 2014 not yet implemented.")
-    _validate_cb(geom=geom, cb=cb)
-    subpath, fname = _fpath(year=year, st_fips=st_fips, geom=geom, cb=cb)
-    if FRECHET_CACHE_DIR is not None:
-        local_shp_path = Path(FRECHET_CACHE_DIR) / Path(subpath) / fname
-        if os.path.isfile(os.path.expanduser(local_shp_path)):
-            logging.info(f"Loading shp from local cache at {local_shp_path}")
-            return _load_tiger(local_shp_path)
-    url = TIGER_BASE + subpath + ".zip"
-    zip_found = unzip_to_tmp(url=url)
-    if zip_found:
-        gdf = _load_tiger(RESULT_DIR + f"/{fname}")
+    cache_format = settings.FRECHET_CACHE_FORMAT if cache_format is None else cache_format
+    _validate_cache_format(cache_format=cache_format)
+    if cb:
+        subpath, fname = f"GENZ{year}/shp/cb_{year}_us_state_500k", f"cb_{year}_us_state_500k.shp"
+    else:
+        subpath, fname = f"TIGER{year}/STATE/tl_{year}_us_state", f"tl_{year}_us_state.shp"
+    return _load(subpath=subpath, fname=fname, cache=cache, cache_format=cache_format, columns=columns)
+
+
+def _load(
+    subpath: str,
+    fname: str,
+    cache: bool,
+    cache_format: CACHE_FORMAT,
+    columns: Optional[List[str]] = None,
+    county_fips: Optional[str] = None,
+) -> Union[gpd.GeoDataFrame, pd.DataFrame]:
+    if settings.FRECHET_CACHE_DIR is None:
         if cache:
-            if FRECHET_CACHE_DIR is None:
-                raise ValueError("Attempting to cache download without setting FRECHET_CACHE_DIR. Please add to .env.")
-            logging.info(f"Caching results to {Path(FRECHET_CACHE_DIR) / Path(subpath)}")
-            cache_result_dir(subdir=subpath)
-        shutil.rmtree(RESULT_DIR)
+            raise ValueError("Attempting to cache download without setting FRECHET_CACHE_DIR. Please add to .env.")
+        return _project(
+            _download_tiger(subpath=subpath, fname=fname, cache=False, county_fips=county_fips), columns=columns
+        )
+    read_kwargs = dict(subpath=subpath, fname=fname, cache_format=cache_format, columns=columns, county_fips=county_fips)
+    gdf = _load_cached(**read_kwargs)
+    instrument.cache("tiger", hit=gdf is not None)
+    if gdf is not None:
         return gdf
+    if not cache:
+        return _project(
+            _download_tiger(subpath=subpath, fname=fname, cache=False, county_fips=county_fips), columns=columns
+        )
+    # serialize concurrent loaders of the same file so it is downloaded once, later loaders read the cache
+    with file_lock(_cache_path(subpath) + ".lock"):
+        gdf = _load_cached(**read_kwargs, locked=True)
+        if gdf is not None:
+            return gdf
+        if cache_format == "shp":
+            gdf = _download_tiger(subpath=subpath, fname=fname, cache=True, county_fips=county_fips)
+        else:
+            gdf = _download_tiger(subpath=subpath, fname=fname, cache=False)
+            _write_columnar(gdf, subpath=subpath, cache_format=cache_format)
+            gdf = _filter(gdf, county_fips=county_fips)
+        return _project(gdf, columns=columns)
+
+
+def _load_simplified(
+    subpath: str,
+    fname: str,
+    tolerance: float,
+    cache: bool,
+    cache_format: CACHE_FORMAT,
+    columns: Optional[List[str]] = None,
+    county_fips: Optional[str] = None,
+) -> Union[gpd.GeoDataFrame, pd.DataFrame]:
+    if cache and settings.FRECHET_CACHE_DIR is None:
+        raise ValueError("Attempting to cache download without setting FRECHET_CACHE_DIR. Please add to .env.")
+    # each tolerance is cached as its own entry next to the original, e.g. TIGER2021/TRACT/tl_2021_24_tract_s0.001
+    level = _level(subpath, tolerance)
+    read_kwargs = dict(subpath=level, fname=fname, cache_format=cache_format, columns=columns, county_fips=county_fips)
+    if settings.FRECHET_CACHE_DIR is not None:
+        gdf = _load_cached(**read_kwargs)
+        instrument.cache("tiger.simplified", hit=gdf is not None)
+        if gdf is not None:
+            return gdf
+    # the whole state is simplified (not just county_fips) so results are the same however they are requested
+    if not cache:
+        gdf = simplify_topology(_load(subpath=subpath, fname=fname, cache=False, cache_format=cache_format), tolerance)
+        return _project(_filter(gdf, county_fips=county_fips), columns=columns)
+    with file_lock(_cache_path(level) + ".lock"):
+        gdf = _load_cached(**read_kwargs, locked=True)
+        if gdf is not None:
+            return gdf
+        gdf = simplify_topology(_load(subpath=subpath, fname=fname, cache=True, cache_format=cache_format), tolerance)
+        if cache_format == "shp":
+            _write_shp(gdf, subpath=level, fname=fname)
+        else:
+            _write_columnar(gdf, subpath=level, cache_format=cache_format)
+        return _project(_filter(gdf, county_fips=county_fips), columns=columns)
+
+
+def load_shp_many(
+    year: int,
+    states: Union[Iterable[str], Literal["all"]],
+    geom: GEOGRAPHY,
+    cache: bool = False,
+    cb: bool = False,
+    cache_format: Optional[CACHE_FORMAT] = None,
+    max_workers: Optional[int] = None,
+    executor: Literal["process", "thread"] = "process",
+    progress: Optional[Callable[[int, int, str], None]] = None,
+) -> gpd.GeoDataFrame:
+    """
+    Load boundary files for many states in parallel and concatenate them. Per-state timings are reported in
+    `gdf.attrs["timings"]`. States that fail to load (e.g. territories without a file for `geom`) are skipped with a
+    warning, and reported with their exceptions in `gdf.attrs["failures"]`.
+
+    Args:
+        year (int): year of boundary files
+        states (list): state fips codes, or "all" for every state in frechet.url.STATES. Duplicates are loaded once.
+        geom (frechet.tiger.GEOM): type of geometries to request
+        cache (bool): If True, save results to FRECHET_CACHE_DIR
+        cb (bool): if True, return the cartographic boundary (less detailed, more efficient) shps
+        cache_format (frechet.tiger.CACHE_FORMAT): see `load_shp`
+        max_workers (int): size of the worker pool, defaults to the number of cpus
+        executor (str): run states in a "process" pool (parsing is cpu bound) or a "thread" pool
+        progress (callable): called as progress(n_done, n_total, st_fips) as each state completes or fails
+
+    Returns:
+        geopandas.GeoDataFrame: boundaries for all loaded states, in the order of `states`
+    """
+    if isinstance(states, str):
+        if states != "all":
+            raise ValueError(f"Unrecognized states {states}. Pass a list of state fips codes or 'all'.")
+        from frechet.fips import _load_states
+
+        states = _load_states()["STATE"].tolist()
+    states = list(dict.fromkeys(states))
+    if len(states) == 0:
+        raise ValueError("No states to load.")
+    kwargs = dict(year=year, geom=geom, cache=cache, cb=cb, cache_format=cache_format)
+    pool = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    results: Dict[str, Tuple[gpd.GeoDataFrame, float]] = {}
+    failures: Dict[str, Exception] = {}
+    with pool(max_workers=max_workers) as ex:
+        futures = {ex.submit(_timed_load_shp, st_fips=st_fips, **kwargs): st_fips for st_fips in states}
+        for future in as_completed(futures):
+            st_fips = futures[future]
+            n_done = len(results) + len(failures) + 1
+            try:
+                results[st_fips] = future.result()
+            except Exception as e:
+                logging.warning(f"Loading {geom} for state {st_fips} failed: {e}")
+                failures[st_fips] = e
+            else:
+                seconds = results[st_fips][1]
+                logging.info(f"Loaded {geom} for state {st_fips} in {seconds:.2f}s ({n_done}/{len(states)})")
+            if progress is not None:
+                progress(n_done, len(states), st_fips)
+    loaded = [st_fips for st_fips in states if st_fips in results]
+    gdfs = [results[st_fips][0] for st_fips in loaded]
+    if len(gdfs) > 0:
+        gdf = gpd.GeoDataFrame(pd.concat(gdfs, ignore_index=True), crs=gdfs[0].crs)
     else:
-        raise ShpNotFound(f"No boundary files found at {url}")
+        gdf = gpd.GeoDataFrame()
+    gdf.attrs["timings"] = [
+        {"st_fips": st_fips, "rows": len(results[st_fips][0]), "seconds": results[st_fips][1]} for st_fips in loaded
+    ]
+    gdf.attrs["failures"] = [
+        {"st_fips": st_fips, "error": failures[st_fips]} for st_fips in states if st_fips in failures
+    ]
+    return gdf
+
+
+def prefetch_shp(
+    year: int, st_fips: str, geom: GEOGRAPHY, cb: bool = False, cache_format: Optional[CACHE_FORMAT] = None
+) -> int:
+    """
+    Download the boundary file for st-geom-year into FRECHET_CACHE_DIR without loading it, unless it is already
+    cached. Raw shapefiles are moved into the cache without being parsed. Arguments are as in `load_shp`.
+
+    Returns:
+        int: number of bytes downloaded, 0 if the file was already cached
+    """
+    if settings.FRECHET_CACHE_DIR is None:
+        raise ValueError("Attempting to cache download without setting FRECHET_CACHE_DIR. Please add to .env.")
+    subpath, fname, cache_format = _resolve(year=year, st_fips=st_fips, geom=geom, cb=cb, cache_format=cache_format)
+    if _is_cached(subpath, cache_format=cache_format, migrate=False):
+        return 0
+    with file_lock(_cache_path(subpath) + ".lock"):
+        if _is_cached(subpath, cache_format=cache_format, fname=fname):
+            return 0
+        url = TIGER_BASE + subpath + ".zip"
+        result = download_zip(url=url, stem=Path(fname).stem)
+        if result is None:
+            raise ShpNotFound(f"No boundary files found at {url}")
+        result_dir, nbytes = result
+        try:
+            _install(result_dir, subpath=subpath, fname=fname, cache_format=cache_format)
+        finally:
+            shutil.rmtree(result_dir, ignore_errors=True)
+    return nbytes
+
+
+def _is_cached(subpath: str, cache_format: CACHE_FORMAT, fname: Optional[str] = None, migrate: bool = True) -> bool:
+    """
+    whether the entry for `subpath` is cached in `cache_format`. With migrate=True (which requires `fname`, and
+    holding the entry's lock), a cached shapefile is first migrated to a columnar `cache_format`.
+    """
+    manager = cache_manager(settings.FRECHET_CACHE_DIR)
+    if manager.lookup(subpath if cache_format == "shp" else f"{subpath}.{cache_format}"):
+        return True
+    if not migrate or cache_format == "shp" or not manager.lookup(subpath):
+        return False
+    _migrate(subpath=subpath, fname=fname, cache_format=cache_format)
+    return True
+
+
+def _install(result_dir: str, subpath: str, fname: str, cache_format: CACHE_FORMAT):
+    """moves (shp) or converts (columnar formats) the extracted download in `result_dir` into the cache"""
+    if cache_format == "shp":
+        cache_result_dir(subdir=subpath, result_dir=result_dir)
+        cache_manager(settings.FRECHET_CACHE_DIR).register(subpath)
+    else:
+        _write_columnar(_load_tiger(Path(result_dir) / fname), subpath=subpath, cache_format=cache_format)
+
+
+def _timed_load_shp(**kwargs) -> Tuple[gpd.GeoDataFrame, float]:
+    start = time.perf_counter()
+    gdf = load_shp(**kwargs)
+    return gdf, time.perf_counter() - start
+
+
+def _cache_path(subpath: str, cache_format: CACHE_FORMAT = "shp") -> str:
+    path = os.path.expanduser(Path(settings.FRECHET_CACHE_DIR) / Path(subpath))
+    return path if cache_format == "shp" else f"{path}.{cache_format}"
+
+
+def _load_cached(
+    subpath: str,
+    fname: str,
+    cache_format: CACHE_FORMAT,
+    columns: Optional[List[str]],
+    county_fips: Optional[str] = None,
+    locked: bool = False,
+) -> Optional[Union[gpd.GeoDataFrame, pd.DataFrame]]:
+    manager = cache_manager(settings.FRECHET_CACHE_DIR)
+    if cache_format != "shp":
+        key = f"{subpath}.{cache_format}"
+        if not manager.lookup(key):
+            if not manager.lookup(subpath):
+                return None
+            if locked:
+                _migrate(subpath=subpath, fname=fname, cache_format=cache_format)
+            else:
+                with file_lock(_cache_path(subpath) + ".lock"):
+                    if not manager.lookup(key):
+                        _migrate(subpath=subpath, fname=fname, cache_format=cache_format)
+        local_path = _cache_path(subpath, cache_format)
+        logging.info(f"Loading {cache_format} from local cache at {local_path}")
 
+        def read():
+            if columns is not None:
+                _check_columns(columns, available=_columnar_schema(local_path, cache_format=cache_format))
+            return _read_columnar(local_path, cache_format=cache_format, columns=columns, county_fips=county_fips)
 
-def _load_tiger(path: str) -> gpd.GeoDataFrame:
-    gdf = gpd.read_file(path)
-    gdf.columns = [x[:-2] if x.endswith("10") or x.endswith("20") else x for x in gdf.columns]
+    else:
+        key = subpath
+        if not manager.lookup(key):
+            return None
+        local_path = Path(_cache_path(subpath)) / fname
+        logging.info(f"Loading shp from local cache at {local_path}")
+        read = lambda: _load_tiger(local_path, county_fips=county_fips)
+    # only failures to read the entry discard it, errors in the arguments (e.g. unknown columns) reach the caller
+    try:
+        with instrument.stage("tiger.cache_read", format=cache_format):
+            gdf = read()
+    except _read_errors() as e:
+        logging.warning(f"Discarding unreadable cache entry {key}: {e}")
+        manager.remove(key)
+        return None
+    return gdf if cache_format != "shp" else _project(gdf, columns=columns)
+
+
+def _read_errors() -> Tuple[Type[Exception], ...]:
+    """exceptions raised by the installed io engines for missing, truncated, or corrupt files"""
+    errors: List[Type[Exception]] = [OSError]
+    try:
+        import pyarrow
+
+        errors.append(pyarrow.ArrowInvalid)
+    except ImportError:
+        pass
+    try:
+        from pyogrio.errors import DataLayerError, DataSourceError
+
+        errors.extend([DataSourceError, DataLayerError])
+    except ImportError:
+        pass
+    try:
+        from fiona.errors import FionaError
+
+        errors.append(FionaError)
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+def _columnar_schema(path: str, cache_format: CACHE_FORMAT) -> List[str]:
+    if cache_format == "parquet":
+        import pyarrow.parquet as pq
+
+        return pq.read_schema(path).names
+    import pyarrow.ipc
+
+    with pyarrow.ipc.open_file(path) as reader:
+        return reader.schema.names
+
+
+def _migrate(subpath: str, fname: str, cache_format: CACHE_FORMAT):
+    # the shapefile stays cached (until evicted) for loads in the shp format
+    shp_dir = _cache_path(subpath)
+    logging.info(f"Migrating cached shp at {shp_dir} to {cache_format}")
+    gdf = _load_tiger(Path(shp_dir) / fname)
+    _write_columnar(gdf, subpath=subpath, cache_format=cache_format)
+
+
+@instrument.timed("tiger.cache_write")
+def _write_shp(gdf: gpd.GeoDataFrame, subpath: str, fname: str):
+    logging.info(f"Caching results to {_cache_path(subpath)}")
+    # restore the column name suffixes of the tiger file, so the entry reads back like a downloaded file
+    sfx = Path(fname).stem[-2:] if Path(fname).stem[-2:] in ["10", "20"] else ""
+    gdf = gdf.rename(columns={x: f"{x}{sfx}" for x in gdf.columns if x != gdf.geometry.name})
+    result_dir = tempfile.mkdtemp(prefix="frechet-")
+    try:
+        gdf.to_file(Path(result_dir) / fname)
+        cache_result_dir(subdir=subpath, result_dir=result_dir)
+        cache_manager(settings.FRECHET_CACHE_DIR).register(subpath)
+    finally:
+        shutil.rmtree(result_dir, ignore_errors=True)
+
+
+@instrument.timed("tiger.cache_write")
+def _write_columnar(gdf: gpd.GeoDataFrame, subpath: str, cache_format: CACHE_FORMAT):
+    path = _cache_path(subpath, cache_format)
+    logging.info(f"Caching results to {path}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        if cache_format == "parquet":
+            # small row groups let county filters skip most of a state file using row group statistics
+            gdf.to_parquet(tmp_path, compression="zstd", index=False, row_group_size=PARQUET_ROW_GROUP_SIZE)
+        else:
+            gdf.to_feather(tmp_path, compression="zstd", index=False)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    cache_manager(settings.FRECHET_CACHE_DIR).register(f"{subpath}.{cache_format}")
+
+
+def _read_columnar(
+    path: str, cache_format: CACHE_FORMAT, columns: Optional[List[str]] = None, county_fips: Optional[str] = None
+) -> Union[gpd.GeoDataFrame, pd.DataFrame]:
+    geometry = columns is None or "geometry" in columns
+    if cache_format == "parquet":
+        read = gpd.read_parquet if geometry else pd.read_parquet
+        filters = None if county_fips is None else [("COUNTYFP", "==", county_fips)]
+        return read(path, columns=columns, filters=filters)
+    # feather has no predicate pushdown, filter before projecting away the filter column
+    read = gpd.read_feather if geometry else pd.read_feather
+    read_columns = columns if columns is None or "COUNTYFP" in columns or county_fips is None else columns + ["COUNTYFP"]
+    return _project(_filter(read(path, columns=read_columns), county_fips=county_fips), columns=columns)
+
+
+def _filter(gdf: gpd.GeoDataFrame, county_fips: Optional[str] = None) -> gpd.GeoDataFrame:
+    if county_fips is None:
+        return gdf
+    return gdf.loc[gdf["COUNTYFP"] == county_fips].reset_index(drop=True)
+
+
+def _project(
+    gdf: gpd.GeoDataFrame, columns: Optional[List[str]] = None
+) -> Union[gpd.GeoDataFrame, pd.DataFrame]:
+    if columns is None:
+        return gdf
+    _check_columns(columns, available=gdf.columns)
+    if "geometry" not in columns:
+        return pd.DataFrame(gdf[columns])
+    return gdf[columns]
+
+
+def _check_columns(columns: List[str], available: Iterable[str]):
+    available = [str(x) for x in available]
+    names = set(available)
+    missing = [x for x in columns if x not in names]
+    if len(missing) > 0:
+        raise KeyError(f"Columns not found: {', '.join(missing)}. Available columns are {', '.join(available)}.")
+
+
+def _download_tiger(subpath: str, fname: str, cache: bool, county_fips: Optional[str] = None) -> gpd.GeoDataFrame:
+    url = TIGER_BASE + subpath + ".zip"
+    result_dir = unzip_to_tmp(url=url, stem=Path(fname).stem)
+    if result_dir is None:
+        raise ShpNotFound(f"No boundary files found at {url}")
+    try:
+        gdf = _load_tiger(Path(result_dir) / fname, county_fips=county_fips)
+        if cache:
+            logging.info(f"Caching results to {Path(settings.FRECHET_CACHE_DIR) / Path(subpath)}")
+            cache_result_dir(subdir=subpath, result_dir=result_dir)
+            cache_manager(settings.FRECHET_CACHE_DIR).register(subpath)
+    finally:
+        shutil.rmtree(result_dir, ignore_errors=True)
     return gdf
 
 
+def _load_tiger(path: str, county_fips: Optional[str] = None) -> gpd.GeoDataFrame:
+    with instrument.stage("tiger.parse"):
+        if county_fips is None:
+            gdf = gpd.read_file(path)
+        else:
+            # 2010/2020 block files suffix their column names (and file names) with the decennial year
+            sfx = Path(path).stem[-2:] if Path(path).stem[-2:] in ["10", "20"] else ""
+            _validate_county_fips(county_fips=county_fips)  # interpolated into the OGR SQL filter
+            try:
+                gdf = gpd.read_file(path, where=f"COUNTYFP{sfx} = '{county_fips}'")
+            except (TypeError, ValueError, NotImplementedError):
+                logging.info(f"Attribute filters not supported by the installed io engine, filtering {path} in memory")
+                gdf = gpd.read_file(path)
+    with instrument.stage("tiger.rename"):
+        gdf.columns = [x[:-2] if x.endswith("10") or x.endswith("20") else x for x in gdf.columns]
+        return _filter(gdf, county_fips=county_fips)
+
+
 def _fpath(year: int, st_fips: str, geom: GEOGRAPHY, cb: bool) -> Tuple[str, str]:
     if cb:
         subpath = f"GENZ{year}/shp/cb_{year}_{st_fips}_{GEOM_MAP[geom]}_500k"
@@ -98,4 +539,40 @@ def _validate_cb(geom: GEOGRAPHY, cb: bool):
         if geom in get_args(CB_GEOM):
             return True
         else:
-            raise CBUnavailable(f"Cartographic boundary files unavailable for geom {geom}")
\ No newline at end of file
+            raise CBUnavailable(f"Cartographic boundary files unavailable for geom {geom}")
+
+
+def _level(subpath: str, tolerance: float) -> str:
+    return f"{subpath}_s{tolerance:.6g}"
+
+
+def _resolve(
+    year: int, st_fips: str, geom: GEOGRAPHY, cb: bool, cache_format: Optional[CACHE_FORMAT]
+) -> Tuple[str, str, CACHE_FORMAT]:
+    """validates a boundary file request, returning its subpath, file name, and cache format"""
+    if year < 2014:
+        raise ValueError("Tiger loads for years prior to 2014 not yet implemented.")
+    _validate_cb(geom=geom, cb=cb)
+    cache_format = settings.FRECHET_CACHE_FORMAT if cache_format is None else cache_format
+    _validate_cache_format(cache_format=cache_format)
+    return (*_fpath(year=year, st_fips=st_fips, geom=geom, cb=cb), cache_format)
+
+
+def _resolve_tolerance(tolerance: Optional[float], zoom: Optional[int]) -> Optional[float]:
+    if zoom is not None:
+        if tolerance is not None:
+            raise ValueError("Pass either a simplification tolerance or a zoom level, not both.")
+        tolerance = zoom_tolerance(zoom)
+    if tolerance is not None and tolerance <= 0:
+        raise ValueError(f"Simplification tolerance must be positive, got {tolerance}.")
+    return tolerance
+
+
+def _validate_county_fips(county_fips: Optional[str]):
+    if county_fips is not None and not (isinstance(county_fips, str) and re.fullmatch(r"[0-9]{3}", county_fips)):
+        raise ValueError(f"Unrecognized county_fips {county_fips!r}. Pass a 3-digit county fips code, e.g. '031'.")
+
+
+def _validate_cache_format(cache_format: CACHE_FORMAT):
+    if cache_format not in get_args(CACHE_FORMAT):
+        raise ValueError(f"Unrecognized cache_format {cache_format}. Options are {', '.join(get_args(CACHE_FORMAT))}.")
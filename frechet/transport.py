@@ -0,0 +1,265 @@
+"""
+shared http transport used for all network i/o in frechet
+
+A single pooled `requests.Session` is shared across modules (and threads), so repeated calls to the census api and
+tiger servers reuse keep-alive connections. Requests that fail with a connection error, a timeout, or a retryable
+status (429, 5xx) are retried with jittered exponential backoff. Every attempt first acquires a permit from the shared
+`frechet.scheduler.Scheduler`, which rate limits requests per api key and adapts the requests in flight to each host.
+Base urls can be rewritten with `configure`, e.g. to point frechet at a local stand-in server in tests.
+
+`requests` is imported on first use, so modules that only reach the network on a cache miss do not pay for it.
+"""
+import time
+import random
+import logging
+import weakref
+import functools
+import threading
+from dataclasses import dataclass, field, replace
+from typing import *
+
+from frechet import instrument, settings
+from frechet.scheduler import PRIORITY, Permit, Scheduler
+
+if TYPE_CHECKING:
+    import requests
+
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+@dataclass(frozen=True)
+class TransportConfig:
+    """
+    Args:
+        timeout (float): seconds to wait when connecting and between bytes read
+        retries (int): number of times a failed request is retried
+        backoff (float): base delay (seconds) for exponential backoff between retries
+        backoff_max (float): maximum delay (seconds) between retries
+        pool_maxsize (int): maximum number of pooled connections per host
+        rate_limit (float): requests per second per api key and host, None for no limit
+        rate_burst (int): requests that may be sent at once before `rate_limit` applies
+        max_concurrency (int): highest number of requests in flight per host, see `frechet.scheduler.AdaptiveLimit`
+        initial_concurrency (int): requests in flight per host before the limit has adapted
+        base_urls (dict): map of url prefixes to replacement prefixes, e.g. {CENSUS_API_BASE: "http://127.0.0.1:8000/"}
+    """
+
+    timeout: float = field(default_factory=lambda: settings.FRECHET_HTTP_TIMEOUT)
+    retries: int = field(default_factory=lambda: settings.FRECHET_HTTP_RETRIES)
+    backoff: float = 0.5
+    backoff_max: float = 30.0
+    pool_maxsize: int = 32
+    rate_limit: Optional[float] = field(default_factory=lambda: settings.FRECHET_RATE_LIMIT)
+    rate_burst: int = 10
+    max_concurrency: int = 32
+    initial_concurrency: int = 8
+    base_urls: Dict[str, str] = field(default_factory=dict)
+
+
+_config: Optional[TransportConfig] = None  # created on first use, see `get_config`
+_session: Optional["requests.Session"] = None
+_scheduler: Optional[Scheduler] = None
+_lock = threading.Lock()
+
+
+def configure(**kwargs) -> TransportConfig:
+    """
+    Update the transport configuration. Keyword arguments are fields of `TransportConfig`. The shared session and
+    scheduler are rebuilt on next use.
+
+    Returns:
+        TransportConfig: the previous configuration, which can be passed to `restore`
+    """
+    global _config, _session, _scheduler
+    previous = get_config()
+    with _lock:
+        _config = replace(previous, **kwargs)
+        if _session is not None:
+            _session.close()
+        _session = None
+        _scheduler = None
+    return previous
+
+
+def restore(config: TransportConfig):
+    """
+    Args:
+        config: configuration returned by an earlier call to `configure`
+    """
+    global _config, _session, _scheduler
+    with _lock:
+        _config = config
+        if _session is not None:
+            _session.close()
+        _session = None
+        _scheduler = None
+
+
+def get_config() -> TransportConfig:
+    global _config
+    if _config is None:
+        with _lock:
+            if _config is None:
+                _config = TransportConfig()
+    return _config
+
+
+def session() -> "requests.Session":
+    """
+    Returns:
+        requests.Session: the pooled session shared by all frechet network calls
+    """
+    global _session
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    config = get_config()
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=config.pool_maxsize)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def scheduler() -> Scheduler:
+    """
+    Returns:
+        Scheduler: the scheduler admitting all frechet network calls, synchronous and asynchronous
+    """
+    global _scheduler
+    config = get_config()
+    with _lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(
+                rate_limit=config.rate_limit,
+                rate_burst=config.rate_burst,
+                max_concurrency=config.max_concurrency,
+                initial_concurrency=config.initial_concurrency,
+            )
+        return _scheduler
+
+
+def resolve(url: str) -> str:
+    """
+    Args:
+        url: url as constructed from the constants in `frechet.url`
+
+    Returns:
+        str: the url with any configured base url rewrites applied
+    """
+    for prefix, replacement in get_config().base_urls.items():
+        if url.startswith(prefix):
+            return replacement + url[len(prefix):]
+    return url
+
+
+def get(
+    url: str,
+    headers: Optional[Dict[str, str]] = None,
+    stream: bool = False,
+    timeout: Optional[float] = None,
+    priority: Optional[PRIORITY] = None,
+) -> "requests.Response":
+    """
+    GET `url` through the shared session, retrying transient failures. Each attempt waits for the scheduler.
+
+    Args:
+        url: location to request
+        headers: additional request headers
+        stream: if True, defer downloading the response body (see `requests.Response.iter_content`). The response
+            keeps its slot in the scheduler's concurrency limit until it is closed, e.g. with
+            `with transport.get(url, stream=True) as rsp:`
+        timeout: overrides the configured timeout (seconds)
+        priority: overrides the priority of the current context (see `frechet.scheduler.priority`)
+
+    Returns:
+        requests.Response: the final response. Responses with non-retryable error statuses are returned, not raised.
+    """
+    import requests
+
+    config = get_config()
+    url = resolve(url)
+    timeout = config.timeout if timeout is None else timeout
+    for attempt in range(config.retries + 1):
+        last_attempt = attempt == config.retries
+        permit = scheduler().acquire(url, priority=priority)
+        try:
+            rsp = session().get(url, headers=headers, stream=stream, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            permit.release(None)
+            instrument.count("http.requests", status="error")
+            if last_attempt:
+                raise
+            logging.warning(f"Request to {url} failed ({e}), retrying")
+            time.sleep(_backoff(config, attempt))
+            continue
+        except BaseException:
+            permit.discard()
+            raise
+        delay = _retry_after(rsp)
+        instrument.count("http.requests", status=str(rsp.status_code))
+        if rsp.status_code not in RETRY_STATUSES or last_attempt:
+            if stream:
+                _hold(rsp, permit, retry_after=delay)
+            else:
+                permit.release(rsp.status_code, retry_after=delay, empty=len(rsp.content) == 0)
+            return rsp
+        permit.release(rsp.status_code, retry_after=delay)
+        logging.warning(f"Request to {url} returned {rsp.status_code}, retrying")
+        rsp.close()
+        time.sleep(delay if delay is not None else _backoff(config, attempt))
+    raise AssertionError("unreachable")
+
+
+def get_text(url: str) -> str:
+    """
+    Args:
+        url: location of a text file
+
+    Returns:
+        str: the body of the response, raising `requests.HTTPError` for error statuses
+    """
+    rsp = get(url)
+    rsp.raise_for_status()
+    return rsp.text
+
+
+def _hold(rsp: "requests.Response", permit: Permit, retry_after: Optional[float]):
+    """release `permit` when the streamed `rsp` is closed (or garbage collected), with the latency of its headers"""
+    release = functools.partial(
+        permit.release, rsp.status_code, retry_after=retry_after, latency=permit.elapsed(), empty=_empty(rsp)
+    )
+    close = type(rsp).close
+    ref = weakref.ref(rsp)
+
+    def closing():
+        r = ref()
+        try:
+            if r is not None:
+                close(r)
+        finally:
+            release()
+
+    rsp.close = closing
+    weakref.finalize(rsp, release)
+
+
+def _empty(rsp: Any) -> bool:
+    # requests and aiohttp responses
+    return rsp.headers.get("Content-Length") == "0"
+
+
+def _backoff(config: TransportConfig, attempt: int) -> float:
+    # "full jitter": uniform over [0, capped exponential delay]
+    return random.uniform(0, min(config.backoff_max, config.backoff * 2 ** attempt))
+
+
+def _retry_after(rsp: "requests.Response") -> Optional[float]:
+    value = rsp.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return min(float(value), get_config().backoff_max)
+    except ValueError:
+        return None
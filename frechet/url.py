@@ -2,4 +2,5 @@
 
 CENSUS_API_BASE = "https://api.census.gov/"
 STATES = "https://www2.census.gov/geo/docs/reference/state.txt"
+COUNTIES = "https://www2.census.gov/geo/docs/reference/codes/files/st{st_fips}_{st_abbr}_cou.txt"
 TIGER_BASE = "https://www2.census.gov/geo/tiger/"
\ No newline at end of file
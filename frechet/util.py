@@ -1,55 +1,146 @@
 import os
-import requests
+import shutil
+import tempfile
 import zipfile
+from contextlib import contextmanager
 from pathlib import Path
-from dotenv import load_dotenv
-from urllib3.exceptions import ConnectionError
+from typing import *
 
-from frechet.settings import FRECHET_CACHE_DIR
+from frechet import instrument, settings, transport
 
-RESULT_DIR = '/tmp/results'
+CHUNK_SIZE = 1 << 20  # bytes
 
 
-def unzip_to_tmp(url: str) -> bool:
+def unzip_to_tmp(url: str, stem: Optional[str] = None) -> Optional[str]:
     """
-    extracts contents of zipfile stored at `url` to 'tmp/results'
+    streams the zipfile stored at `url` to disk and extracts its contents to a new temporary directory. The caller
+    owns the directory and is responsible for removing it.
 
     Args:
         url: location of zipfile
+        stem: if given, only extract members named `stem.*` (e.g. the files making up one shapefile)
 
     Returns:
-        bool: True if successfully found and unzipped file
+        str: the temporary directory holding the extracted files, None if no zipfile was found at `url`
     """
+    result = download_zip(url=url, stem=stem)
+    return None if result is None else result[0]
+
+
+def download_zip(url: str, stem: Optional[str] = None) -> Optional[Tuple[str, int]]:
+    """
+    as `unzip_to_tmp`, also reporting the size of the download
+
+    Returns:
+        tuple: the temporary directory holding the extracted files and the number of bytes downloaded, None if no
+            zipfile was found at `url`
+    """
+    results = transport.get(url, stream=True)
+    if results.status_code == 404:
+        results.close()
+        return None
+    if not results.ok:
+        # release the permit now, not when the exception (and its traceback) is collected
+        results.close()
+        results.raise_for_status()
+
+    tmp_dir = tempfile.mkdtemp(prefix="frechet-")
+    zip_path = os.path.join(tmp_dir, "download.zip")
+    nbytes = 0
     try:
-        results = requests.get(url)
-        if results.status_code == 404:
-            return False
+        with instrument.stage("zip.download"), results, open(zip_path, "wb") as f:
+            for chunk in results.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                nbytes += len(chunk)
+        instrument.count("bytes", nbytes, source="zip")
+        extract_zip(zip_path, stem=stem)
     except zipfile.BadZipFile:
-        return False
+        shutil.rmtree(tmp_dir)
+        return None
+    except BaseException:
+        shutil.rmtree(tmp_dir)
+        raise
+    return tmp_dir, nbytes
 
-    with open('/tmp/zip_folder.zip', 'wb') as f:
-        f.write(results.content)
 
-    file = zipfile.ZipFile('/tmp/zip_folder.zip')
-    file.extractall(path=RESULT_DIR)
-    return True
+def extract_zip(zip_path: str, stem: Optional[str] = None):
+    """
+    extracts the zipfile at `zip_path` into its directory, then removes it
+
+    Args:
+        zip_path: location of the zipfile
+        stem: if given, only extract members named `stem.*`
+    """
+    with instrument.stage("zip.unzip"), zipfile.ZipFile(zip_path) as file:
+        members = [x for x in file.namelist() if stem is None or Path(x).name.startswith(f"{stem}.")]
+        file.extractall(path=os.path.dirname(zip_path), members=members)
+    os.remove(zip_path)
 
 
-def cache_result_dir(subdir: str):
+def cache_result_dir(subdir: str, result_dir: str):
     """
+    moves the files in `result_dir` into FRECHET_CACHE_DIR/subdir. The cache directory appears atomically, fully
+    populated, or not at all. If another caller has already populated it, the existing entry is kept.
 
     Args:
-        subdir: local subdirectory for saving cached results (parent directory is
+        subdir: local subdirectory for saving cached results (parent directory is FRECHET_CACHE_DIR)
+        result_dir: directory holding the files to cache, e.g. as returned by `unzip_to_tmp`
+    """
+    # TODO different path structure for windows?
+    output_dir = Path(os.path.expanduser(Path(settings.FRECHET_CACHE_DIR) / Path(subdir)))
+    if output_dir.exists():
+        return
+    os.makedirs(output_dir.parent, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix=f".{output_dir.name}-", dir=output_dir.parent)
+    try:
+        for file in os.listdir(result_dir):
+            shutil.move(os.path.join(result_dir, file), os.path.join(staging_dir, file))
+        os.rename(staging_dir, output_dir)
+    except OSError:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        if not output_dir.exists():
+            raise
 
-    Returns:
 
+@contextmanager
+def file_lock(path: Union[str, Path]) -> Iterator[None]:
     """
-    # TODO different path structure for windows?
-    load_dotenv()
-    cache_dir = FRECHET_CACHE_DIR
-    output_dir = Path(os.path.expanduser(Path(cache_dir) / Path(subdir)))
-    files = os.listdir(RESULT_DIR)
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    for file in files:
-        os.rename(Path(RESULT_DIR) / file, output_dir / file)
\ No newline at end of file
+    exclusive advisory lock on `path`, held across threads and processes. The lock file is created if missing.
+
+    Args:
+        path: location of the lock file
+    """
+    path = Path(os.path.expanduser(path))
+    os.makedirs(path.parent, exist_ok=True)
+    with open(path, "a+b") as f:
+        _lock(f)
+        try:
+            yield
+        finally:
+            _unlock(f)
+
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock(f):
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:  # LK_LOCK gives up after ~10 seconds
+                continue
+
+    def _unlock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _lock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,244 @@
+"""
+shared fixtures, including a local stand-in for the census api and tiger servers
+"""
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import *
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from frechet import transport, metadata, reference
+from frechet.url import CENSUS_API_BASE, TIGER_BASE
+
+DOCS_BASE = "https://www2.census.gov/geo/docs/"
+Response = Tuple[int, bytes, Dict[str, str]]
+
+
+class StandInServer:
+    """
+    Serves canned responses on localhost. Routes map a request path to a response, or to a list of responses that are
+    served in order (the last one repeats), which makes it easy to script transient failures. A path without a query
+    string matches any query string.
+    """
+
+    def __init__(self):
+        self.routes: Dict[str, Union[Response, List[Response]]] = {}
+        self.hits: Counter = Counter()
+        self.requests: List[str] = []
+        self.connections: Set[Tuple[str, int]] = set()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # headers and body are written separately
+
+            def do_GET(self):
+                server.hits[self.path] += 1
+                server.requests.append(self.path)
+                server.connections.add(self.client_address)
+                status, body, headers = server._respond(self.path)
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def add(self, path: str, body: Union[bytes, str, dict, list] = b"", status: int = 200, headers=None):
+        self.routes.setdefault(path, []).append(_response(body, status, headers))
+
+    def add_json(self, path: str, payload: Any):
+        self.add(path, json.dumps(payload), headers={"Content-Type": "application/json"})
+
+    def add_handler(self, path: str, handler: Callable[[str, Dict[str, List[str]]], Response]):
+        """`handler` is called with the request path and parsed query string"""
+        self.routes[path] = handler
+
+    def _respond(self, path: str) -> Response:
+        responses = self.routes.get(path, self.routes.get(path.split("?")[0]))
+        if callable(responses):
+            url = urlparse(path)
+            return responses(url.path, parse_qs(url.query))
+        if not responses:
+            return 404, b"not found", {}
+        return responses.pop(0) if len(responses) > 1 else responses[0]
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def _response(body, status, headers) -> Response:
+    if isinstance(body, (dict, list)):
+        body = json.dumps(body)
+    if isinstance(body, str):
+        body = body.encode()
+    return status, body, headers or {}
+
+
+@pytest.fixture
+def stand_in():
+    """a `StandInServer` with the frechet transport routed to it"""
+    server = StandInServer()
+    previous = transport.configure(
+        base_urls={
+            CENSUS_API_BASE: f"{server.url}/api/",
+            TIGER_BASE: f"{server.url}/tiger/",
+            DOCS_BASE: f"{server.url}/docs/",
+        },
+        backoff=0.01,
+        timeout=5,
+    )
+    yield server
+    transport.restore(previous)
+    server.close()
+
+
+STATES_TXT = "STATE|STUSAB|STATE_NAME|STATENS\n01|AL|Alabama|01779775\n02|AK|Alaska|01785533\n72|PR|Puerto Rico|01779808\n"
+CENSUS_VARIABLES = {
+    **{f"P1_{i:03d}N": {"label": f"!!Total:!!{i}", "concept": "RACE", "predicateType": "int"} for i in range(1, 121)},
+    "NAME": {"label": "Geographic Area Name", "concept": "Geography", "predicateType": "string"},
+    "for": {"label": "Census API FIPS 'for' clause", "concept": "Census API Geography Specification"},
+    "in": {"label": "Census API FIPS 'in' clause", "concept": "Census API Geography Specification"},
+    "state": {"label": "Geography", "concept": None},
+}
+
+
+def _census_query(path: str, query: Dict[str, List[str]]) -> Response:
+    """synthetic api response with two tracts in each requested state (state 72 has no data)"""
+    vars = query["get"][0].split(",")
+    state = [x.split(":")[1] for x in query.get("in", []) if x.startswith("state:")][0]
+    if state == "72":
+        return 204, b"", {}
+    rows = [vars + ["state", "county", "tract"]]
+    for t, tract in enumerate(["000100", "000200"]):
+        rows.append([f"Tract {tract}" if v == "NAME" else str(int(v[3:6]) * 10 + t) for v in vars] + [state, "001", tract])
+    return _response(rows, 200, {"Content-Type": "application/json"})
+
+
+@pytest.fixture
+def census_api(stand_in, monkeypatch):
+    """`stand_in` serving the metadata and data api of a synthetic dec/pl 2020 dataset"""
+    monkeypatch.setattr(metadata, "METADATA_CACHE", metadata.MetadataCache(cache_dir=None))
+    monkeypatch.setattr(reference, "SNAPSHOT_PATH", Path("/nonexistent/reference.pkl.gz"))
+    _clear_fips_caches()
+    stand_in.add_json(
+        "/api/data.json",
+        {"dataset": [{"c_dataset": ["dec", "pl"], "c_vintage": 2020}, {"c_dataset": ["dec", "pl"], "c_vintage": 2010}]},
+    )
+    stand_in.add_json(
+        "/api/data/2020/dec/pl/geography.json",
+        {
+            "fips": [
+                {"name": "state", "geoLevelDisplay": "040"},
+                {"name": "tract", "requires": ["state", "county"], "wildcard": ["county"]},
+            ]
+        },
+    )
+    stand_in.add_json("/api/data/2020/dec/pl/variables.json", {"variables": CENSUS_VARIABLES})
+    stand_in.add_handler("/api/data/2020/dec/pl", _census_query)
+    stand_in.add("/docs/reference/state.txt", STATES_TXT)
+    yield stand_in
+    _clear_fips_caches()
+
+
+MD_STATES_TXT = "STATE|STUSAB|STATE_NAME|STATENS\n11|DC|District of Columbia|01702382\n24|MD|Maryland|01714934\n"
+MD_COUNTIES_TXT = """MD,24,003,Anne Arundel County,H1
+MD,24,005,Baltimore County,H1
+MD,24,031,Montgomery County,H1
+MD,24,033,Prince George's County,H1
+MD,24,510,Baltimore city,C7
+"""
+
+
+def _clear_fips_caches():
+    from frechet import fips
+
+    for f in [fips._load_states, fips._load_counties, fips._state_index, fips._state_lookup, fips._county_index]:
+        f.cache_clear()
+    reference.load_snapshot.cache_clear()
+
+
+@pytest.fixture
+def fips_api(stand_in, monkeypatch):
+    """`stand_in` serving state and county reference files for Maryland and DC (the bundled snapshot is ignored)"""
+    monkeypatch.setattr(reference, "SNAPSHOT_PATH", Path("/nonexistent/reference.pkl.gz"))
+    _clear_fips_caches()
+    stand_in.add("/docs/reference/state.txt", MD_STATES_TXT)
+    stand_in.add("/docs/reference/codes/files/st24_md_cou.txt", MD_COUNTIES_TXT)
+    stand_in.add("/docs/reference/codes/files/st11_dc_cou.txt", "DC,11,001,District of Columbia,H6\n")
+    yield stand_in
+    _clear_fips_caches()
+
+
+def synthetic_tiger(st_fips: str = "24", counties: Sequence[str] = ("031", "033"), n: int = 4, sfx: str = ""):
+    """a grid of `n` square tracts per county, with tiger style columns (optionally suffixed, e.g. "20")"""
+    import geopandas as gpd
+    from shapely.geometry import box
+
+    rows = []
+    for i, county in enumerate(counties):
+        for j in range(n):
+            tract = f"{j + 1:04d}00"
+            rows.append(
+                {
+                    f"STATEFP{sfx}": st_fips,
+                    f"COUNTYFP{sfx}": county,
+                    f"TRACTCE{sfx}": tract,
+                    f"GEOID{sfx}": f"{st_fips}{county}{tract}",
+                    f"ALAND{sfx}": 100,
+                    "geometry": box(-77 + j * 0.1, 39 + i * 0.1, -77 + (j + 1) * 0.1, 39 + (i + 1) * 0.1),
+                }
+            )
+    return gpd.GeoDataFrame(rows, crs="EPSG:4269")
+
+
+def tiger_zip(gdf, stem: str, extra_members: int = 0) -> bytes:
+    """zip archive bytes of `gdf` written as the shapefile `stem`.shp, plus `extra_members` unrelated files"""
+    import io
+    import tempfile
+    import zipfile
+
+    buf = io.BytesIO()
+    with tempfile.TemporaryDirectory() as tmp:
+        gdf.to_file(Path(tmp) / f"{stem}.shp")
+        with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for f in Path(tmp).iterdir():
+                zf.write(f, arcname=f.name)
+            for i in range(extra_members):
+                zf.writestr(f"unrelated_{i}.txt", "x" * 1000)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """a temporary FRECHET_CACHE_DIR"""
+    from frechet import settings
+
+    path = str(tmp_path / "cache")
+    monkeypatch.setattr(settings, "FRECHET_CACHE_DIR", path, raising=False)
+    return path
+
+
+@pytest.fixture
+def tiger_api(stand_in):
+    """`stand_in` serving 2021 tiger and cartographic boundary tracts for Maryland (two counties)"""
+    stand_in.add("/tiger/TIGER2021/TRACT/tl_2021_24_tract.zip", tiger_zip(synthetic_tiger(), "tl_2021_24_tract", 2))
+    stand_in.add("/tiger/GENZ2021/shp/cb_2021_24_tract_500k.zip", tiger_zip(synthetic_tiger(), "cb_2021_24_tract_500k"))
+    stand_in.add(
+        "/tiger/TIGER2021/TABBLOCK20/tl_2021_24_tabblock20.zip",
+        tiger_zip(synthetic_tiger(sfx="20"), "tl_2021_24_tabblock20"),
+    )
+    return stand_in
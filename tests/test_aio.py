@@ -0,0 +1,78 @@
+"""
+tests for the asyncio api
+"""
+import time
+import asyncio
+
+import pytest
+
+from frechet import aio
+from frechet.census import Dataset, QueryError
+from frechet.tiger import load_shp
+
+
+def test_async_query(census_api, cache_dir):
+    async def main():
+        async with aio.AsyncClient(max_concurrency=2) as client:
+            ds = await aio.AsyncDataset.create("dec/pl", client=client)
+            vars = [f"P1_{i:03d}N" for i in range(1, 121)]
+            df = await ds.query(year=2020, geography="tract", vars=vars, fips_map={"state": "01"}, census_api_key="k")
+            batch = await ds.query_many(
+                year=2020, geography="tract", vars=["P1_001N"], fips_maps="states", census_api_key="k", typed=True
+            )
+            arrow_df = await ds.query(
+                year=2020, geography="tract", vars=vars, fips_map={"state": "01"}, census_api_key="k", arrow=True
+            )
+            assert arrow_df.astype(object).equals(df.astype(object))
+            with pytest.raises(LookupError):
+                await ds.query(year=2020, geography="tract", vars=["B01001_001E"], fips_map={"state": "01"})
+            kwargs = dict(year=2020, geography="tract", fips_map={"state": "02"}, census_api_key="k", cache=True)
+            await ds.query(vars=["P1_001N"], **kwargs)
+            cached = await ds.query(vars=["P1_001N", "P1_002N"], **kwargs)
+            assert cached.attrs["cache"] == {"hits": ["P1_001N"], "fetched": ["P1_002N"]}
+            return df, batch
+
+    df, batch = asyncio.run(main())
+    expected = Dataset("dec/pl").query(
+        year=2020, geography="tract", vars=[f"P1_{i:03d}N" for i in range(1, 121)], fips_map={"state": "01"},
+        census_api_key="k",
+    )
+    assert df.equals(expected) and len(df.attrs["chunk_timings"]) == 3
+    assert batch.data["P1_001N"].tolist() == [10, 11, 10, 11]
+    assert [x.fips_map for x in batch.failures] == [{"state": "72"}]
+    assert isinstance(batch.failures[0].error, QueryError)
+    assert census_api.hits["/api/data/2020/dec/pl/variables.json"] == 1
+
+
+def test_async_load_shp(tiger_api, cache_dir):
+    async def main():
+        async with aio.AsyncClient() as client:
+            uncached = await aio.load_shp(year=2021, st_fips="24", geom="tracts", county_fips="031", client=client)
+            loads = [
+                aio.load_shp(year=2021, st_fips="24", geom="tracts", cache=True, cache_format="parquet", client=client)
+                for _ in range(3)
+            ]
+            return uncached, await asyncio.gather(*loads)
+
+    uncached, cached = asyncio.run(main())
+    assert set(uncached["COUNTYFP"]) == {"031"} and len(uncached) == 4
+    expected = load_shp(year=2021, st_fips="24", geom="tracts", cache=True, cache_format="parquet")
+    assert all(gdf.equals(expected) for gdf in cached)
+    # concurrent loads of the same file share one download
+    assert tiger_api.hits["/tiger/TIGER2021/TRACT/tl_2021_24_tract.zip"] == 2
+
+
+def test_async_cancel(stand_in):
+    def slow(path, query):
+        time.sleep(1)
+        return 200, b"", {}
+
+    stand_in.add_handler("/tiger/TIGER2021/TRACT/tl_2021_24_tract.zip", slow)
+
+    async def main():
+        start = time.perf_counter()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(aio.load_shp(year=2021, st_fips="24", geom="tracts"), timeout=0.1)
+        return time.perf_counter() - start
+
+    assert asyncio.run(main()) < 0.5
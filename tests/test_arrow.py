@@ -0,0 +1,43 @@
+"""
+tests for arrow parsing of census api responses
+"""
+import json
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from frechet.arrow import iter_batches, read_table, to_pandas, write_parquet
+
+ROWS = [["NAME", "P1_001N", "state"], ["Tract [1]; \"a\" ü", "10", "01"], ["Tract 2", None, "01"], ["Tract 3", "12", "01"]]
+
+
+def _chunks(body: bytes, size: int):
+    return [body[i : i + size] for i in range(0, len(body), size)]
+
+
+@pytest.mark.parametrize("size", [1, 7, 1 << 20])
+def test_read_table(size):
+    body = ("[" + ",\n".join(json.dumps(row, ensure_ascii=False) for row in ROWS) + "]").encode()
+    table = read_table(_chunks(body, size), batch_size=2)
+    assert table.column_names == ROWS[0]
+    assert [list(x.values()) for x in table.to_pylist()] == ROWS[1:]
+    df = to_pandas(table)
+    assert isinstance(df["P1_001N"].dtype, pd.ArrowDtype) and df["P1_001N"].isna().tolist() == [False, True, False]
+
+
+def test_read_table_edge_cases():
+    assert read_table([b'[["NAME","state"]]']).num_rows == 0
+    assert read_table([b'[["NAME","POP"],["a",1]]']).column("POP").to_pylist() == ["1"]
+    assert [b.num_rows for b in iter_batches([json.dumps(ROWS).encode()], batch_size=3)] == [3]
+    for body in [b"", b'[["a"],["1","2"]]', b'[["a"],["1"]', b'[["a"]] x', b'{"a": 1}']:
+        with pytest.raises(ValueError):
+            read_table([body])
+
+
+def test_write_parquet(tmp_path):
+    path = tmp_path / "out.parquet"
+    assert write_parquet(iter_batches([json.dumps(ROWS).encode()], batch_size=2), path) == 3
+    assert pq.read_table(path).column("NAME").to_pylist() == [row[0] for row in ROWS[1:]]
+    assert pq.ParquetFile(path).num_row_groups == 2
+    assert list(tmp_path.iterdir()) == [path]
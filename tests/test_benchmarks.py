@@ -0,0 +1,14 @@
+"""
+smoke test for the offline benchmark suite
+"""
+import json
+
+from benchmarks.run import main
+
+
+def test_benchmarks_run(tmp_path):
+    output = tmp_path / "results.json"
+    main(["--repeat", "1", "--counties", "2", "--tracts", "3", "--vertices", "8", "--output", str(output)])
+    results = json.loads(output.read_text())["results"]
+    assert {r["name"] for r in results} >= {"query.cold", "load_shp.miss.tiger", "load_shp.hit.parquet", "county.shp"}
+    assert all(r["p50_ms"] > 0 and r["peak_memory_mb"] >= 0 for r in results)
@@ -0,0 +1,56 @@
+"""
+tests for the cache manifest, eviction, and integrity checks
+"""
+import os
+import time
+
+from frechet.cache import CacheManager, MANIFEST
+from frechet.tiger import load_shp
+
+
+def _write(root, key: str, size: int):
+    path = os.path.join(root, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+
+
+def test_lru_eviction(tmp_path):
+    manager = CacheManager(str(tmp_path), max_bytes=250)
+    for key in ["a.parquet", "b.parquet"]:
+        _write(tmp_path, key, 100)
+        manager.register(key)
+        time.sleep(0.01)
+    assert manager.lookup("a.parquet")
+    _write(tmp_path, "c.parquet", 100)
+    manager.register("c.parquet")
+    assert sorted(manager.entries()["key"]) == ["a.parquet", "c.parquet"]
+    assert not os.path.exists(tmp_path / "b.parquet")
+    assert not manager.lookup("b.parquet")
+    assert manager.size() == 200
+
+
+def test_adopt_and_verify(tmp_path):
+    _write(tmp_path, "TIGER2021/TRACT/tl_2021_24_tract/tl_2021_24_tract.shp", 10)
+    _write(tmp_path, "TIGER2021/TRACT/tl_2021_24_tract/tl_2021_24_tract.shx", 10)
+    _write(tmp_path, "TIGER2021/TRACT/tl_2021_24_tract/tl_2021_24_tract.dbf", 10)
+    _write(tmp_path, "TIGER2021/TRACT/tl_2021_10_tract/tl_2021_10_tract.shp", 10)  # incomplete
+    _write(tmp_path, "TIGER2021/TRACT/tl_2021_24_tract.lock", 0)
+    _write(tmp_path, "metadata/data.pkl", 10)
+    manager = CacheManager(str(tmp_path))
+    assert manager.entries()["key"].tolist() == ["TIGER2021/TRACT/tl_2021_24_tract"]
+    assert manager.verify() == []
+    _write(tmp_path, "TIGER2021/TRACT/tl_2021_24_tract/tl_2021_24_tract.dbf", 5)
+    assert manager.verify(repair=True) == ["TIGER2021/TRACT/tl_2021_24_tract"]
+    assert len(manager.entries()) == 0
+    manager.clear()
+    assert os.path.exists(tmp_path / MANIFEST)
+
+
+def test_load_shp_consults_manifest(tiger_api, cache_dir):
+    load_shp(year=2021, st_fips="24", geom="tracts", cache=True, cache_format="parquet")
+    manager = CacheManager(cache_dir)
+    assert manager.entries()["key"].tolist() == ["TIGER2021/TRACT/tl_2021_24_tract.parquet"]
+    manager.clear()
+    load_shp(year=2021, st_fips="24", geom="tracts", cache=True, cache_format="parquet")
+    assert tiger_api.hits["/tiger/TIGER2021/TRACT/tl_2021_24_tract.zip"] == 2
@@ -1,5 +1,7 @@
 import pytest
-from frechet.census import Dataset, GEOM_NAME_MAP
+import pandas as pd
+from frechet import settings
+from frechet.census import Dataset, GEOM_NAME_MAP, QueryError, _coerce_column, _join_chunks
 
 # TODO extend to random selections
 TEST_DS = "dec/pl"
@@ -13,4 +15,113 @@ def test_ds(geography):
         if geography in ds.available_geographies(year=y):
             vars = ds.variables(year=y).index.unique().tolist()[0:5]  #  TODO how are names not harmonized across years???
             df = ds.query(year=y, geography=geography, vars=vars, fips_map=fips_map)
-            assert len(df) > 0
\ No newline at end of file
+            assert len(df) > 0
+
+
+def test_query_offline(census_api):
+    ds = Dataset(TEST_DS)
+    df = ds.query(year=2020, geography="tract", vars=["P1_001N"], fips_map={"state": "01"}, census_api_key="test")
+    assert df.columns.tolist() == ["NAME", "P1_001N", "state", "county", "tract"]
+    assert len(df) == 2
+    with pytest.raises(LookupError):
+        ds.query(year=2020, geography="tract", vars=["B01001_001E"], fips_map={"state": "01"}, census_api_key="test")
+
+
+def test_query_many(census_api):
+    ds = Dataset(TEST_DS)
+    batch = ds.query_many(year=2020, geography="tract", vars=["P1_001N"], fips_maps="states", census_api_key="test")
+    assert batch.data["state"].tolist() == ["01", "01", "02", "02"]
+    assert [x.fips_map for x in batch.failures] == [{"state": "72"}]
+    assert isinstance(batch.failures[0].error, QueryError)
+    assert census_api.hits["/api/data/2020/dec/pl/variables.json"] == 1
+
+
+def test_query_chunked(census_api):
+    ds = Dataset(TEST_DS)
+    vars = [f"P1_{i:03d}N" for i in range(1, 121)]
+    df = ds.query(year=2020, geography="tract", vars=vars, fips_map={"state": "01"}, census_api_key="test")
+    assert df.columns.tolist() == ["NAME"] + vars + ["state", "county", "tract"]
+    assert df["P1_120N"].tolist() == ["1200", "1201"]
+    assert len(df.attrs["chunk_timings"]) == 3
+    assert len([x for x in census_api.requests if x.startswith("/api/data/2020/dec/pl?")]) == 3
+
+
+def test_query_arrow(census_api, tmp_path):
+    ds = Dataset(TEST_DS)
+    vars = [f"P1_{i:03d}N" for i in range(1, 121)]
+    kwargs = dict(year=2020, geography="tract", fips_map={"state": "01"}, census_api_key="test")
+    expected = ds.query(vars=vars, **kwargs)
+    df = ds.query(vars=vars, arrow=True, **kwargs)
+    assert all(isinstance(dtype, pd.ArrowDtype) for dtype in df.dtypes)
+    assert df.astype(object).equals(expected.astype(object))
+    assert ds.query(vars=["P1_001N"], arrow=True, typed=True, **kwargs)["P1_001N"].tolist() == [10, 11]
+    batch = ds.query_many(
+        year=2020, geography="tract", vars=["P1_001N"], fips_maps="states", census_api_key="test", arrow=True
+    )
+    assert batch.data["state"].tolist() == ["01", "01", "02", "02"] and len(batch.failures) == 1
+    # single and chunked requests
+    for v in [["P1_001N"], vars]:
+        assert ds.query_parquet(tmp_path / "out.parquet", vars=v, **kwargs) == 2
+        written = pd.read_parquet(tmp_path / "out.parquet")
+        assert written.astype(object).equals(expected[["NAME"] + v + ["state", "county", "tract"]].astype(object))
+
+
+def test_join_unaligned_chunks():
+    a = pd.DataFrame({"NAME": ["x", "y"], "A": ["1", "2"], "state": ["01", "01"], "tract": ["1", "2"]})
+    b = pd.DataFrame({"B": ["4", "3", "5"], "state": ["01", "01", "01"], "tract": ["2", "1", "3"]})
+    df = _join_chunks([a, b])
+    assert df.columns.tolist() == ["NAME", "A", "B", "state", "tract"]
+    assert df["B"].tolist() == ["3", "4"]
+
+
+def test_query_cache(census_api, cache_dir, monkeypatch):
+    ds = Dataset(TEST_DS)
+    kwargs = dict(year=2020, geography="tract", census_api_key="test", cache=True)
+    n_requests = lambda: len([x for x in census_api.requests if x.startswith("/api/data/2020/dec/pl?")])
+    df = ds.query(vars=["P1_001N", "P1_002N"], fips_map={"state": "01"}, **kwargs)
+    assert df.attrs["cache"] == {"hits": [], "fetched": ["P1_001N", "P1_002N"]}
+    # the api key is not part of the cache key
+    cached = ds.query(vars=["P1_002N"], fips_map={"state": "01"}, **{**kwargs, "census_api_key": "other"})
+    assert cached.columns.tolist() == ["NAME", "P1_002N", "state", "county", "tract"]
+    assert cached["P1_002N"].tolist() == df["P1_002N"].tolist()
+    assert n_requests() == 1
+    # partial hits only fetch the missing variables
+    partial = ds.query(vars=["P1_001N", "P1_003N"], fips_map={"state": "01"}, **kwargs)
+    assert partial.attrs["cache"] == {"hits": ["P1_001N"], "fetched": ["P1_003N"]}
+    assert "get=NAME,P1_003N&" in census_api.requests[-1]
+    assert partial["P1_003N"].tolist() == ["30", "31"]
+    assert ds.query(vars=["P1_001N", "P1_002N", "P1_003N"], fips_map={"state": "01"}, **kwargs).attrs["cache"][
+        "fetched"
+    ] == []
+    assert n_requests() == 2
+    ds.query(vars=["P1_001N"], fips_map={"state": "01"}, refresh=True, **kwargs)
+    ds.query(vars=["P1_001N"], fips_map={"state": "02"}, **kwargs)
+    assert n_requests() == 4
+    # expired variables are fetched again
+    monkeypatch.setattr(settings, "FRECHET_QUERY_TTL", 0, raising=False)
+    ds.query(vars=["P1_002N"], fips_map={"state": "01"}, **kwargs)
+    assert n_requests() == 5
+
+
+def test_query_typed(census_api):
+    ds = Dataset(TEST_DS)
+    df = ds.query(
+        year=2020, geography="tract", vars=["P1_001N"], fips_map={"state": "01"}, census_api_key="test", typed=True
+    )
+    assert str(df["P1_001N"].dtype) == "Int64"
+    assert df["P1_001N"].tolist() == [10, 11]
+    assert all(isinstance(df[c].dtype, pd.CategoricalDtype) for c in ["state", "county", "tract"])
+    batch = ds.query_many(
+        year=2020, geography="tract", vars=["P1_001N"], fips_maps="states", census_api_key="test", typed=True
+    )
+    assert batch.data["state"].cat.categories.tolist() == ["01", "02"]
+
+
+def test_coerce_column():
+    values = pd.Series(["1", None, "-666666666", "4"], dtype=object)
+    ints = _coerce_column(values, predicate_type="int")
+    assert str(ints.dtype) == "Int64"
+    assert ints.isna().tolist() == [False, True, True, False]
+    floats = _coerce_column(pd.Series(["1.5", "-999999999"]), predicate_type="float")
+    assert floats.dtype == "float64" and floats.isna().tolist() == [False, True]
+    assert _coerce_column(values, predicate_type="string") is values
@@ -0,0 +1,69 @@
+"""
+tests for the frechet command line interface
+"""
+import os
+import json
+import pytest
+
+from frechet import cli, metadata
+from frechet.cache import manager
+
+
+def test_prefetch(tiger_api, fips_api, cache_dir, capsys):
+    argv = ["prefetch", "--states", "MD", "--years", "2021", "--geoms", "tracts", "--workers", "2"]
+    assert cli.main(argv) == 0
+    out = capsys.readouterr().out
+    assert "1 fetched, 0 already cached, 0 failed" in out
+    assert manager(cache_dir).lookup("TIGER2021/TRACT/tl_2021_24_tract")
+
+    # already cached entries are skipped, so an interrupted prefetch resumes when rerun
+    assert cli.main(argv + ["--cb"]) == 0
+    assert cli.main(argv) == 0
+    assert "0 fetched, 1 already cached" in capsys.readouterr().out
+    assert tiger_api.hits["/tiger/TIGER2021/TRACT/tl_2021_24_tract.zip"] == 1
+    assert tiger_api.hits["/tiger/GENZ2021/shp/cb_2021_24_tract_500k.zip"] == 1
+
+
+def test_prefetch_metrics(tiger_api, fips_api, cache_dir, tmp_path):
+    metrics = tmp_path / "frechet.prom"
+    argv = ["prefetch", "--states", "MD", "--years", "2021", "--geoms", "tracts", "--metrics", str(metrics)]
+    assert cli.main(argv + ["--cache-format", "parquet"]) == 0
+    text = metrics.read_text()
+    assert 'frechet_stage_seconds_count{stage="tiger.cache_write"} 1\n' in text
+    assert 'frechet_bytes_total{source="zip"}' in text
+
+
+def test_prefetch_failures(tiger_api, fips_api, cache_dir, capsys):
+    assert cli.main(["prefetch", "--states", "MD", "DC", "--years", "2021", "--geoms", "tracts"]) == 1
+    assert "1 fetched, 0 already cached, 1 failed" in capsys.readouterr().out
+    with pytest.raises(SystemExit):
+        cli.main(["prefetch", "--states", "ZZ", "--years", "2021", "--geoms", "tracts"])
+
+
+def test_prefetch_manifest(tiger_api, fips_api, cache_dir, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(metadata, "METADATA_CACHE", metadata.MetadataCache(cache_dir=cache_dir))
+    for path in ["data.json", "data/2020/dec/pl/geography.json", "data/2020/dec/pl/variables.json"]:
+        fips_api.add_json(f"/api/{path}", {"path": path})
+    manifest = tmp_path / "prefetch.json"
+    manifest.write_text(
+        json.dumps(
+            [
+                {"states": ["24"], "years": ["2021"], "geoms": ["tracts"], "cache_format": "feather"},
+                {"datasets": ["dec/pl"], "years": [2020]},
+            ]
+        )
+    )
+    tasks = cli.plan_prefetch(cli.load_manifest(manifest))
+    assert [t.key for t in tasks] == [
+        "tracts 2021 24", "data.json", "data/2020/dec/pl/geography.json", "data/2020/dec/pl/variables.json"
+    ]
+    assert cli.main(["prefetch", "--manifest", str(manifest)]) == 0
+    assert "4 fetched" in capsys.readouterr().out
+    assert os.path.isfile(os.path.join(cache_dir, "TIGER2021/TRACT/tl_2021_24_tract.feather"))
+    assert os.path.isfile(os.path.join(cache_dir, "metadata/data/2020/dec/pl/variables.pkl"))
+    assert cli.main(["prefetch", "--manifest", str(manifest)]) == 0
+    assert "0 fetched, 4 already cached" in capsys.readouterr().out
+
+
+def test_parse_years():
+    assert cli.parse_years(["2019-2021", 2020, "2014"]) == [2019, 2020, 2021, 2014]
@@ -0,0 +1,65 @@
+"""
+tests for area-weighted crosswalks between boundary layers
+"""
+import numpy as np
+import geopandas as gpd
+import pandas as pd
+import pytest
+from shapely.geometry import box
+
+from frechet.cache import manager
+from frechet.crosswalk import Crosswalk, crosswalk
+from tests.conftest import synthetic_tiger, tiger_zip
+
+
+def _layer(ids, boxes) -> gpd.GeoDataFrame:
+    return gpd.GeoDataFrame({"GEOID": ids}, geometry=[box(*b) for b in boxes], crs="EPSG:4269")
+
+
+def test_from_layers():
+    # two source units split into three targets: a is halved, b is kept whole
+    source = _layer(["a", "b"], [(-77, 39, -76.8, 39.1), (-76.8, 39, -76.6, 39.1)])
+    target = _layer(["x", "y", "z"], [(-77, 39, -76.9, 39.1), (-76.9, 39, -76.8, 39.1), (-76.8, 39, -76.6, 39.1)])
+    xwalk = Crosswalk.from_layers(source, target)
+    pairs = xwalk.to_frame().sort_values("target")
+    assert pairs[["source", "target"]].values.tolist() == [["a", "x"], ["a", "y"], ["b", "z"]]
+    assert np.allclose(pairs["extensive"], [0.5, 0.5, 1], atol=1e-3)
+    assert np.allclose(pairs["intensive"], 1)
+    df = pd.DataFrame({"GEOID": ["b", "a"], "pop": pd.array([30, 100], dtype="Int64"), "rate": [0.3, 0.1]})
+    out = xwalk.apply(df, extensive=["pop"], intensive=["rate"])
+    assert out["GEOID"].tolist() == ["x", "y", "z"]
+    assert np.allclose(out["pop"], [50, 50, 30], atol=0.1) and np.allclose(out["rate"], [0.1, 0.1, 0.3])
+    # missing sources propagate to the targets they overlap
+    assert xwalk.apply(df.iloc[:1], extensive=["pop"])["pop"].isna().tolist() == [True, True, False]
+    with pytest.raises(ValueError):
+        xwalk.apply(pd.concat([df, df]), extensive=["pop"])
+
+
+def test_intensive_weights():
+    # target x is covered by two sources of different size
+    source = _layer(["a", "b"], [(-77, 39, -76.7, 39.1), (-76.7, 39, -76.6, 39.1)])
+    target = _layer(["x"], [(-77, 39, -76.6, 39.1)])
+    xwalk = Crosswalk.from_layers(source, target)
+    out = xwalk.apply(pd.DataFrame({"GEOID": ["a", "b"], "pop": [10, 20], "rate": [1.0, 5.0]}), ["pop"], ["rate"])
+    # box edges are not quite straight in the equal-area projection
+    assert np.allclose(out["pop"], [30], atol=0.1) and np.allclose(out["rate"], [2.0], atol=1e-2)
+
+
+def test_crosswalk_cached(tiger_api, cache_dir):
+    # 2015 tracts are pairs of 2021 tracts
+    merged = synthetic_tiger(n=4).dissolve(by=synthetic_tiger(n=4).index // 2).reset_index(drop=True)
+    merged["GEOID"] = ["a", "b", "c", "d"]
+    tiger_api.add("/tiger/TIGER2015/TRACT/tl_2015_24_tract.zip", tiger_zip(merged, "tl_2015_24_tract"))
+    xwalk = crosswalk(st_fips="24", geom="tracts", source_year=2015, target_year=2021, cache=True)
+    assert xwalk.areas.shape == (8, 4) and xwalk.areas.nnz == 8
+    assert np.allclose(xwalk.weights("extensive").sum(axis=0), 1)
+    keys = manager(cache_dir).entries()["key"].tolist()
+    assert "crosswalks/tracts_2015_tracts_2021_24_EPSG5070.npz" in keys
+    cached = crosswalk(st_fips="24", geom="tracts", source_year=2015, target_year=2021)
+    assert (cached.areas != xwalk.areas).nnz == 0 and cached.target_ids.tolist() == xwalk.target_ids.tolist()
+
+
+def test_crosswalk_cache_requires_cache_dir(monkeypatch):
+    monkeypatch.setattr("frechet.settings.FRECHET_CACHE_DIR", None, raising=False)
+    with pytest.raises(ValueError, match="FRECHET_CACHE_DIR"):
+        crosswalk(st_fips="24", geom="tracts", source_year=2015, target_year=2021, cache=True)
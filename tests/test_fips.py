@@ -2,9 +2,21 @@
 tests for initializing `State` and `County` objects and inferring their names, fips codes, and abbreviations
 """
 
+import pandas as pd
 import pytest
 
-from frechet.fips import State, QUERY_MODE, StateNotFound, County, MultipleCountiesError, CountyNotFound
+from frechet import reference, transport
+from tests.conftest import _clear_fips_caches
+from frechet.fips import (
+    State,
+    QUERY_MODE,
+    StateNotFound,
+    County,
+    MultipleCountiesError,
+    CountyNotFound,
+    resolve_states,
+    resolve_counties,
+)
 
 
 def _test_state_init(mode: QUERY_MODE, query: str):
@@ -37,4 +49,60 @@ def test_county_init():
     with pytest.raises(MultipleCountiesError):
         _test_county_init(state_abbr="MD", name="Ba")
     with pytest.raises(CountyNotFound):
-        _test_county_init(state_abbr="MD", name="Loudoun")
\ No newline at end of file
+        _test_county_init(state_abbr="MD", name="Loudoun")
+
+
+def test_state_county_init_offline(fips_api):
+    assert State.from_abbr("MD") == State.from_name("Maryland") == State.from_fips("24")
+    assert County.from_state_abbr_name(state_abbr="MD", name="montgomery").fips == "031"
+    with pytest.raises(MultipleCountiesError):
+        County.from_state_abbr_name(state_abbr="MD", name="Baltimore")
+    with pytest.raises(CountyNotFound):
+        County.from_state_abbr_name(state_abbr="MD", name="Loudoun")
+
+
+def test_resolve_states(fips_api):
+    df = resolve_states(pd.Series(["MD", " maryland ", "24", 11, "District of  Columbia", "China", None]))
+    assert df["fips"].tolist()[:5] == ["24", "24", "24", "11", "11"]
+    assert df["abbr"].isna().tolist() == [False] * 5 + [True] * 2
+    with pytest.raises(StateNotFound):
+        resolve_states(pd.Series(["China"]), errors="raise")
+
+
+def test_resolve_counties(fips_api):
+    states = pd.Series(["MD", "MD", "md", "MD", "MD", "DC", "MD"], index=list("abcdefg"))
+    names = pd.Series(["Montgomery", "baltimore", "Baltimore city", "31", "Loudoun", "District", None], index=list("abcdefg"))
+    df = resolve_counties(states, names)
+    assert df.index.tolist() == list("abcdefg")
+    assert df["co_fips"].fillna("").tolist() == ["031", "", "510", "031", "", "001", ""]
+    assert df["match"].tolist() == ["prefix", "ambiguous", "exact", "exact", "missing", "prefix", "missing"]
+    assert resolve_counties(states, names, ambiguous="first")["co_name"]["b"] == "Baltimore city"
+    with pytest.raises(MultipleCountiesError):
+        resolve_counties(states, names, ambiguous="raise")
+
+
+def test_reference_snapshot(fips_api, tmp_path, monkeypatch):
+    path = tmp_path / "reference.pkl.gz"
+    info = reference.build_snapshot(path=path)
+    assert info["states"] == 2 and info["counties"] == 6
+    monkeypatch.setattr(reference, "SNAPSHOT_PATH", path)
+    _clear_fips_caches()
+    fips_api.routes.clear()
+    co = County.from_state_abbr_name(state_abbr="MD", name="Prince")
+    assert co.fips == "033" and co.state == State(fips="24", abbr="MD", name="Maryland")
+    assert fips_api.hits["/docs/reference/state.txt"] == 1
+
+
+def test_bundled_snapshot(monkeypatch):
+    def blocked(url, **kwargs):
+        raise AssertionError(f"Unexpected request to {url}")
+
+    monkeypatch.setattr(transport, "get", blocked)
+    monkeypatch.setattr(transport, "get_text", blocked)
+    _clear_fips_caches()
+    try:
+        assert State.from_abbr("MD") == State(fips="24", abbr="MD", name="Maryland")
+        assert County.from_state_abbr_name(state_abbr="VA", name="Loudoun").fips == "107"
+        assert resolve_states(pd.Series(["PR", "wyoming"]), errors="raise")["fips"].tolist() == ["72", "56"]
+    finally:
+        _clear_fips_caches()
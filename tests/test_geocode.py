@@ -0,0 +1,43 @@
+"""
+tests for assigning coordinates to census geographies
+"""
+import numpy as np
+import geopandas as gpd
+import pytest
+from shapely.geometry import box
+
+from frechet import geocode
+from frechet.geocode import Geocoder
+from tests.conftest import synthetic_tiger, tiger_zip
+
+
+@pytest.fixture
+def states_api(tiger_api):
+    states = gpd.GeoDataFrame(
+        {"STATEFP": ["24", "10"], "geometry": [box(-77, 39, -76.6, 39.2), box(-76.6, 39, -76.2, 39.2)]}, crs="EPSG:4269"
+    )
+    tiger_api.add("/tiger/TIGER2021/STATE/tl_2021_us_state.zip", tiger_zip(states, "tl_2021_us_state"))
+    tiger_api.add("/tiger/TIGER2021/TRACT/tl_2021_10_tract.zip", tiger_zip(synthetic_tiger("10"), "tl_2021_10_tract"))
+    yield tiger_api
+    geocode._geom_index.cache_clear()
+    geocode._states_index.cache_clear()
+
+
+def test_assign(states_api):
+    geocoder = Geocoder(geom="tracts", year=2021)
+    lon = np.array([-76.95, -76.75, -76.95, -76.4, -80.0])
+    lat = np.array([39.05, 39.15, 39.15, 39.1, 39.1])
+    assert geocoder.assign_states(lon, lat).tolist() == ["24", "24", "24", "10", None]
+    assert geocoder.assign(lon, lat, chunksize=2).tolist() == ["24031000100", "24033000300", "24033000100", None, None]
+    chunks = [(lon[:2], lat[:2]), (lon[2:], lat[2:])]
+    assert np.concatenate(list(geocoder.assign_iter(chunks))).tolist() == geocoder.assign(lon, lat).tolist()
+
+
+def test_requires_shapely2(monkeypatch):
+    import shapely
+
+    monkeypatch.setattr(shapely, "__version__", "10.0")  # compared as a version, not a string
+    Geocoder(geom="tracts", year=2021)
+    monkeypatch.delattr(shapely, "union_all")
+    with pytest.raises(ImportError, match="shapely>=2.0"):
+        Geocoder(geom="tracts", year=2021)
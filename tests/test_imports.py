@@ -0,0 +1,36 @@
+"""
+tests that importing frechet stays cheap: fips lookups and census queries must not import the gis stack
+"""
+import sys
+import subprocess
+from pathlib import Path
+
+import pytest
+
+IMPORT_BUDGET = 2.0  # seconds, for `import frechet.fips, frechet.census` in a fresh interpreter (mostly pandas)
+DEFERRED = ["geopandas", "shapely", "pyproj", "pyogrio", "fiona", "requests", "dotenv"]
+
+
+def _run(code: str) -> str:
+    root = Path(__file__).parents[1]
+    return subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True, cwd=root).stdout
+
+
+def test_heavy_imports_deferred():
+    out = _run(
+        "import sys, frechet.fips, frechet.census, frechet.settings; "
+        f"print([m for m in {DEFERRED!r} if m in sys.modules], frechet.settings._dotenv_loaded)"
+    )
+    assert out.strip() == "[] False"
+
+
+@pytest.mark.parametrize("module", ["frechet.fips", "frechet.census"])
+def test_import_budget(module: str):
+    out = _run(f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)")
+    assert float(out) < IMPORT_BUDGET
+
+
+def test_settings_resolved_on_access(monkeypatch):
+    monkeypatch.setenv("FRECHET_HTTP_RETRIES", "7")
+    out = _run("from frechet import settings, transport; print(settings.FRECHET_HTTP_RETRIES, transport.get_config().retries)")
+    assert out.split() == ["7", "7"]
@@ -0,0 +1,44 @@
+"""
+tests for stage timings, byte counts, and cache counters
+"""
+import json
+import logging
+
+from frechet import instrument
+from frechet.tiger import load_shp
+
+
+def test_instrument_disabled():
+    assert not instrument.enabled()
+    assert instrument.stage("tiger.parse") is instrument.stage("census.parse")
+    instrument.count("bytes", 10, source="zip")
+    with instrument.capture() as events:
+        instrument.count("bytes", 10, source="zip")
+    assert len(events) == 1 and not instrument.enabled()
+
+
+def test_instrument_load_shp(tiger_api, cache_dir, caplog):
+    instrument.reset()
+    with instrument.capture(instrument.LogSink()) as events, caplog.at_level(logging.INFO, "frechet.instrument"):
+        load_shp(year=2021, st_fips="24", geom="tracts", cache=True, cache_format="parquet")
+        load_shp(year=2021, st_fips="24", geom="tracts", cache=True, cache_format="parquet")
+    stages = [e.name for e in events if e.kind == "timer"]
+    assert stages == [
+        "http.queue", "zip.download", "zip.unzip", "tiger.parse", "tiger.rename", "tiger.cache_write",
+        "tiger.cache_read",
+    ]
+    assert len(caplog.records) == len(events)
+    assert json.loads(caplog.records[0].getMessage()) == {
+        "kind": "counter", "name": "cache", "value": 1, "labels": {"cache": "tiger", "result": "miss"}
+    }
+
+    snapshot = instrument.snapshot()
+    assert snapshot["caches"]["tiger"] == {"hits": 1, "misses": 1, "hit_ratio": 0.5}
+    assert snapshot["stages"]["tiger.cache_read{format=parquet}"]["calls"] == 1
+    nbytes = snapshot["counters"]["bytes{source=zip}"]
+    assert nbytes == len(tiger_api.routes["/tiger/TIGER2021/TRACT/tl_2021_24_tract.zip"][0][1])
+    text = instrument.prometheus_text()
+    assert 'frechet_stage_seconds_count{stage="tiger.parse"} 1\n' in text
+    assert 'frechet_cache_total{cache="tiger",result="hit"} 1\n' in text
+    assert f'frechet_bytes_total{{source="zip"}} {int(nbytes)}\n' in text
+    assert 'frechet_http_requests_total{status="200"} 1\n' in text
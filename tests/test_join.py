@@ -0,0 +1,58 @@
+"""
+tests for joining census api results to boundary files
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from frechet.census import Dataset
+from frechet.join import build_geoid, join_geoid
+
+from tests.conftest import synthetic_tiger, tiger_zip
+
+
+def test_build_geoid():
+    df = pd.DataFrame({"state": ["24", "24"], "county": ["031", "033"], "tract": ["700101", "000200"]})
+    expected = [b"24031700101", b"24033000200"]
+    assert build_geoid(df, "tracts").tolist() == expected
+    typed = df.astype("category").assign(county=[31, 33])
+    assert build_geoid(typed, "tracts").tolist() == expected
+    with pytest.raises(ValueError):
+        build_geoid(df.assign(tract=["7001010", "000200"]), "tracts")
+    with pytest.raises(ValueError):
+        build_geoid(df.assign(tract=[None, "000200"]), "tracts")
+
+
+def test_join_geoid():
+    gdf = synthetic_tiger(counties=["031"]).assign(NAME=["a", "b", "c", "d"])
+    data = pd.DataFrame(
+        {
+            "NAME": ["Tract 3", "Tract 1", "Tract 9"],
+            "P1_001N": pd.array([3, 1, 9], dtype="Int64"),
+            "state": "24",
+            "county": "031",
+            "tract": ["000300", "000100", "000900"],
+        }
+    )
+    out = join_geoid(data, gdf, geom="tracts")
+    assert out.columns.tolist() == gdf.columns.drop("NAME").tolist() + ["NAME_shp", "NAME", "P1_001N"]
+    assert out["GEOID"].tolist() == gdf["GEOID"].tolist() and out.crs == gdf.crs
+    assert out["P1_001N"].tolist() == [1, pd.NA, 3, pd.NA]
+    assert out.attrs["unmatched"] == 1
+    inner = join_geoid(data, gdf, geom="tracts", how="inner")
+    assert inner["NAME"].tolist() == ["Tract 1", "Tract 3"]
+    with pytest.raises(ValueError):
+        join_geoid(pd.concat([data, data]), gdf, geom="tracts")
+
+
+def test_query_shp(census_api):
+    census_api.add(
+        "/tiger/TIGER2020/TRACT/tl_2020_01_tract.zip",
+        tiger_zip(synthetic_tiger(st_fips="01", counties=["001"], n=3), "tl_2020_01_tract"),
+    )
+    ds = Dataset("dec/pl")
+    gdf = ds.query_shp(year=2020, geom="tracts", vars=["P1_001N"], st_fips="01", census_api_key="test", typed=True)
+    assert gdf["GEOID"].tolist() == ["01001000100", "01001000200", "01001000300"]
+    assert gdf["P1_001N"].tolist() == [10, 11, pd.NA]
+    assert gdf["NAME"].tolist()[:2] == ["Tract 000100", "Tract 000200"]
+    assert gdf.attrs["unmatched"] == 0 and np.all(gdf.geometry.is_valid)
@@ -0,0 +1,76 @@
+"""
+tests for caching census api metadata in memory and on disk
+"""
+import json
+import pytest
+
+from frechet import metadata
+from frechet.metadata import MetadataCache
+
+VARIABLES_PATH = "data/2020/dec/pl/variables.json"
+
+
+class _Response:
+    def __init__(self, status_code: int, payload=None, headers=None):
+        self.status_code = status_code
+        self._payload = payload
+        self.headers = headers or {}
+        self.content = json.dumps(payload).encode() if payload is not None else b""
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(self.status_code)
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    calls = []
+
+    def _get(url, headers=None):
+        calls.append((url, headers or {}))
+        if headers and headers.get("If-None-Match") == '"v1"':
+            return _Response(304)
+        return _Response(200, payload={"variables": {"P1_001N": {"label": "Total"}}}, headers={"ETag": '"v1"'})
+
+    monkeypatch.setattr(metadata.transport, "get", _get)
+    return calls
+
+
+def test_memory_hit(fake_api):
+    cache = MetadataCache(cache_dir=None)
+    assert cache.get(VARIABLES_PATH) == cache.get(VARIABLES_PATH)
+    assert len(fake_api) == 1
+
+
+def test_disk_hit_across_instances(fake_api, tmp_path):
+    MetadataCache(cache_dir=str(tmp_path)).get(VARIABLES_PATH)
+    payload = MetadataCache(cache_dir=str(tmp_path)).get(VARIABLES_PATH)
+    assert payload["variables"]["P1_001N"]["label"] == "Total"
+    assert len(fake_api) == 1
+    assert (tmp_path / "metadata" / "data/2020/dec/pl/variables.pkl").is_file()
+
+
+def test_revalidation(fake_api, tmp_path):
+    cache = MetadataCache(cache_dir=str(tmp_path), ttl=-1)
+    cache.get(VARIABLES_PATH)
+    cache.get(VARIABLES_PATH)
+    assert len(fake_api) == 2
+    assert fake_api[1][1]["If-None-Match"] == '"v1"'
+
+
+def test_invalidate(fake_api, tmp_path):
+    cache = MetadataCache(cache_dir=str(tmp_path))
+    cache.get(VARIABLES_PATH)
+    cache.get("data.json")
+    cache.invalidate(dataset="dec/pl", year=2021)
+    cache.get(VARIABLES_PATH)
+    assert len(fake_api) == 2
+    cache.invalidate(dataset="dec/pl")
+    cache.get(VARIABLES_PATH)
+    cache.get("data.json")
+    assert len(fake_api) == 3
+    with pytest.raises(ValueError):
+        cache.invalidate(year=2020)
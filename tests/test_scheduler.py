@@ -0,0 +1,163 @@
+"""
+tests for the client-side request scheduler
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+import requests
+
+from frechet import scheduler, transport, util
+from frechet.scheduler import AdaptiveLimit, Scheduler, TokenBucket
+from frechet.url import CENSUS_API_BASE, TIGER_BASE
+
+
+def test_token_bucket_spaces_requests():
+    bucket = TokenBucket(rate=10, burst=2)
+    delays = [bucket.reserve() for _ in range(4)]
+    assert delays[:2] == [0, 0]
+    assert delays[2] == pytest.approx(0.1, abs=0.01)
+    assert delays[3] == pytest.approx(0.2, abs=0.01)
+
+
+def test_token_bucket_pause():
+    bucket = TokenBucket(rate=None)
+    assert bucket.reserve() == 0
+    bucket.pause(5)
+    assert bucket.reserve() == pytest.approx(5, abs=0.1)
+
+
+def test_adaptive_limit():
+    limit = AdaptiveLimit(initial=4, maximum=5)
+    for _ in range(5):  # about one limit's worth of successes per step
+        limit.on_success(0.01)
+    assert limit.value == 5
+    limit.on_congestion()
+    assert limit.value == 2.5
+    limit.on_congestion()  # within one smoothed latency of the last decrease
+    assert limit.value == 2.5
+    for _ in range(100):
+        limit.on_success(0.01)
+    assert limit.value == 5
+
+
+def test_slow_response_is_congestion():
+    limit = AdaptiveLimit(initial=8)
+    for _ in range(10):
+        limit.on_success(0.1)
+    value = limit.value
+    limit.on_success(2.0)
+    assert limit.value == value / 2
+
+
+def test_concurrency_limit():
+    s = Scheduler(initial_concurrency=2)
+    permits = [s.acquire("http://host/a"), s.acquire("http://host/b")]
+    acquired = threading.Event()
+    threading.Thread(target=lambda: s.acquire("http://host/c") and acquired.set(), daemon=True).start()
+    assert not acquired.wait(0.1)
+    assert s.stats()["host"]["waiting"] == 1
+    permits[0].discard()
+    assert acquired.wait(1)
+    assert s.stats()["host"]["in_flight"] == 2
+
+
+def test_priority_order():
+    s = Scheduler(initial_concurrency=1)
+    first = s.acquire("http://host/")
+    order = []
+
+    def request(level):
+        permit = s.acquire("http://host/", priority=level)
+        order.append(level)
+        permit.discard()
+
+    threads = []
+    for level in ["bulk", "normal", "interactive"]:
+        threads.append(threading.Thread(target=request, args=(level,)))
+        threads[-1].start()
+        while s.stats()["host"]["waiting"] < len(threads):
+            time.sleep(0.01)
+    first.discard()
+    for t in threads:
+        t.join()
+    assert order == ["interactive", "normal", "bulk"]
+
+
+def test_priority_context():
+    assert scheduler.current_priority() == "normal"
+    with scheduler.priority("bulk"):
+        bound = scheduler.bind(scheduler.current_priority)
+        assert scheduler.current_priority() == "bulk"
+    assert bound() == "bulk"
+    with pytest.raises(ValueError):
+        with scheduler.priority("urgent"):
+            pass
+
+
+def test_rate_limit_per_key():
+    s = Scheduler(rate_limit=5, rate_burst=1)
+    start = time.monotonic()
+    for key in ["a", "b"]:
+        s.acquire(f"http://host/?key={key}").release(200)
+    assert time.monotonic() - start < 0.1
+    s.acquire("http://host/?key=a").release(200)
+    assert time.monotonic() - start >= 0.15
+
+
+def test_acquire_async():
+    s = Scheduler(initial_concurrency=1)
+
+    async def run():
+        first = await s.acquire_async("http://host/")
+        waiting = asyncio.ensure_future(s.acquire_async("http://host/"))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        first.release(200)
+        (await waiting).release(200)
+
+    asyncio.run(run())
+    assert s.stats()["host"]["in_flight"] == 0
+
+
+def test_transport_backs_off_on_throttling(stand_in):
+    transport.configure(initial_concurrency=4)
+    stand_in.add("/api/throttled", status=429, headers={"Retry-After": "0"})
+    stand_in.add("/api/throttled", "ok")
+    assert transport.get(f"{CENSUS_API_BASE}throttled").status_code == 200
+    (stats,) = transport.scheduler().stats().values()
+    assert stats["limit"] < 4
+    assert stats["in_flight"] == 0
+
+
+def test_stream_holds_permit(stand_in):
+    stand_in.add("/api/download", "x" * 1000)
+    rsp = transport.get(f"{CENSUS_API_BASE}download", stream=True)
+    (stats,) = transport.scheduler().stats().values()
+    assert stats["in_flight"] == 1
+    with rsp:
+        assert len(rsp.content) == 1000
+    (stats,) = transport.scheduler().stats().values()
+    assert stats["in_flight"] == 0 and stats["limit"] > 8  # a success
+    transport.get(f"{CENSUS_API_BASE}download", stream=True)  # never closed, released once collected
+    (stats,) = transport.scheduler().stats().values()
+    assert stats["in_flight"] == 0
+
+
+def test_failed_download_releases_permit(stand_in):
+    stand_in.add("/tiger/forbidden.zip", status=403)
+    with pytest.raises(requests.HTTPError) as excinfo:
+        util.download_zip(f"{TIGER_BASE}forbidden.zip")
+    assert excinfo.value.response.status_code == 403
+    (stats,) = transport.scheduler().stats().values()
+    assert stats["in_flight"] == 0
+
+
+@pytest.mark.parametrize("status,body", [(204, ""), (200, "")])
+def test_empty_response_is_congestion(stand_in, status, body):
+    transport.configure(initial_concurrency=4)
+    stand_in.add("/api/empty", body, status=status)
+    transport.get(f"{CENSUS_API_BASE}empty")
+    (stats,) = transport.scheduler().stats().values()
+    assert stats["limit"] == 2
@@ -0,0 +1,61 @@
+"""
+tests for full-text search over dataset variables
+"""
+import pytest
+
+from frechet import cli, search, settings
+from frechet.census import Dataset
+from frechet.search import VariableIndex, variable_index
+
+VARIABLES_2010 = {
+    "P001001": {"label": "Total", "concept": "RACE", "predicateType": "int"},
+    "P1_001N": {"label": "!!Total population", "concept": "TOTAL POPULATION", "predicateType": "int"},
+    "H1_001N": {"label": "!!Housing units", "concept": "OCCUPANCY STATUS", "predicateType": "int"},
+    "state": {"label": "Geography", "concept": None},
+}
+
+
+@pytest.fixture
+def search_api(census_api, tmp_path, monkeypatch):
+    census_api.add_json("/api/data/2010/dec/pl/variables.json", {"variables": VARIABLES_2010})
+    monkeypatch.setattr(settings, "FRECHET_CACHE_DIR", str(tmp_path / "cache"), raising=False)
+    monkeypatch.setattr(search, "_indexes", {})
+    return census_api
+
+
+def test_search(search_api):
+    index = variable_index("dec/pl")
+    assert index.years() == [2010, 2020]
+    results = index.search("housing units")
+    assert results.index.tolist() == ["H1_001N"] and results.loc["H1_001N", "years"] == [2010]
+    # codes rank above labels, and reused codes are found under any of their labels
+    assert index.search("P1_001N").index[0] == "P1_001N"
+    assert "P1_001N" in index.search("total population").index
+    assert index.search("P1_01*", limit=None).index.tolist() == [f"P1_{i:03d}N" for i in range(10, 20)]
+    assert index.search("total", concept="population").index.tolist() == ["P1_001N"]
+    assert "P001001" not in index.search("total", years=[2010, 2020], limit=None).index
+    assert index.search("AND NOT -").empty  # words, not query syntax
+    with pytest.raises(ValueError):
+        index.search("!!")
+    assert Dataset("dec/pl").search_variables("housing").index.tolist() == ["H1_001N"]
+
+
+def test_availability(search_api):
+    matrix = variable_index("dec/pl").availability(["P1_001N", "P001001", "P1_120N", "missing"])
+    assert matrix.columns.tolist() == [2010, 2020]
+    assert matrix.values.tolist() == [[True, True], [True, False], [False, True], [False, False]]
+
+
+def test_index_persisted(search_api, tmp_path):
+    variable_index("dec/pl")
+    n_requests = len(search_api.requests)
+    index = VariableIndex("dec/pl", path=tmp_path / "cache" / "search" / "dec_pl.sqlite")
+    assert index.years() == [2010, 2020] and index.build([2010, 2020]) == []
+    assert index.search("housing").index.tolist() == ["H1_001N"]
+    assert len(search_api.requests) == n_requests
+
+
+def test_search_cli(search_api, capsys):
+    assert cli.main(["search", "dec/pl", "housing", "--years", "2010"]) == 0
+    assert "H1_001N" in capsys.readouterr().out
+    assert cli.main(["search", "dec/pl", "housing", "--years", "2020"]) == 1
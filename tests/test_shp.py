@@ -1,11 +1,15 @@
 """
 tests for loading cartographic boundary files
 """
+import os
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 from typing import *
 
 from frechet.fips import State, County
-from frechet.tiger import GEOGRAPHY
+from frechet.tiger import GEOGRAPHY, ShpNotFound, load_shp, load_shp_many
+
+from tests.conftest import synthetic_tiger, tiger_zip
 
 GEOGRAPHY_CB = Literal["county_sub", "tracts"]
 
@@ -37,4 +41,112 @@ def test_tl():
     co = County.from_state_abbr_name(state_abbr="MD", name="Montgomery")
     for geom in get_args(GEOGRAPHY):
         _test_shp(unit=co, geom=geom, year=2015)
-        _test_shp(unit=co, geom=geom, year=2021)  # different file structures after 2020
\ No newline at end of file
+        _test_shp(unit=co, geom=geom, year=2021)  # different file structures after 2020
+
+
+def test_load_shp_offline(tiger_api, cache_dir):
+    gdf = load_shp(year=2021, st_fips="24", geom="tracts", cache=True)
+    assert len(gdf) == 8
+    cached = os.listdir(os.path.join(cache_dir, "TIGER2021/TRACT/tl_2021_24_tract"))
+    assert not any(x.startswith("unrelated") for x in cached)
+    assert len(load_shp(year=2021, st_fips="24", geom="tracts", cache=True)) == 8
+    assert tiger_api.hits["/tiger/TIGER2021/TRACT/tl_2021_24_tract.zip"] == 1
+    blocks = load_shp(year=2021, st_fips="24", geom="blocks")
+    assert "COUNTYFP" in blocks.columns
+    with pytest.raises(ShpNotFound):
+        load_shp(year=2021, st_fips="01", geom="tracts")
+
+
+def test_load_shp_concurrent(tiger_api, cache_dir):
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        gdfs = list(executor.map(lambda _: load_shp(year=2021, st_fips="24", geom="tracts", cache=True), range(4)))
+    assert all(len(x) == 8 for x in gdfs)
+    assert tiger_api.hits["/tiger/TIGER2021/TRACT/tl_2021_24_tract.zip"] == 1
+
+
+@pytest.mark.parametrize("cache_format", ["parquet", "feather"])
+def test_load_shp_columnar(tiger_api, cache_dir, cache_format):
+    gdf = load_shp(year=2021, st_fips="24", geom="tracts", cache=True, cache_format=cache_format)
+    assert os.path.isfile(os.path.join(cache_dir, f"TIGER2021/TRACT/tl_2021_24_tract.{cache_format}"))
+    cached = load_shp(year=2021, st_fips="24", geom="tracts", cache=True, cache_format=cache_format)
+    assert cached.equals(gdf)
+    df = load_shp(year=2021, st_fips="24", geom="tracts", cache_format=cache_format, columns=["GEOID", "ALAND"])
+    assert df.columns.tolist() == ["GEOID", "ALAND"] and "geometry" not in df
+    assert tiger_api.hits["/tiger/TIGER2021/TRACT/tl_2021_24_tract.zip"] == 1
+
+
+def test_load_shp_migrates_shp_cache(tiger_api, cache_dir):
+    load_shp(year=2021, st_fips="24", geom="blocks", cache=True)
+    gdf = load_shp(year=2021, st_fips="24", geom="blocks", cache=True, cache_format="parquet")
+    assert "COUNTYFP" in gdf.columns
+    assert os.path.isfile(os.path.join(cache_dir, "TIGER2021/TABBLOCK20/tl_2021_24_tabblock20.parquet"))
+    # the shapefile stays cached, so default (shp) loads do not download it again
+    assert len(load_shp(year=2021, st_fips="24", geom="blocks", cache=True)) == len(gdf)
+    assert tiger_api.hits["/tiger/TIGER2021/TABBLOCK20/tl_2021_24_tabblock20.zip"] == 1
+
+
+@pytest.mark.parametrize("cache_format", ["shp", "parquet", "feather"])
+def test_unknown_columns_keep_cache(tiger_api, cache_dir, cache_format):
+    load_shp(year=2021, st_fips="24", geom="tracts", cache=True, cache_format=cache_format)
+    with pytest.raises(KeyError, match="NOPE"):
+        load_shp(year=2021, st_fips="24", geom="tracts", cache=True, cache_format=cache_format, columns=["NOPE"])
+    assert len(load_shp(year=2021, st_fips="24", geom="tracts", cache=True, cache_format=cache_format)) == 8
+    assert tiger_api.hits["/tiger/TIGER2021/TRACT/tl_2021_24_tract.zip"] == 1
+
+
+@pytest.mark.parametrize("cache_format", ["shp", "parquet", "feather"])
+def test_corrupt_cache_discarded(tiger_api, cache_dir, cache_format):
+    load_shp(year=2021, st_fips="24", geom="tracts", cache=True, cache_format=cache_format)
+    path = os.path.join(cache_dir, "TIGER2021/TRACT/tl_2021_24_tract")
+    path = os.path.join(path, "tl_2021_24_tract.shp") if cache_format == "shp" else f"{path}.{cache_format}"
+    with open(path, "wb") as f:
+        f.write(b"not a boundary file")
+    assert len(load_shp(year=2021, st_fips="24", geom="tracts", cache=True, cache_format=cache_format)) == 8
+    assert tiger_api.hits["/tiger/TIGER2021/TRACT/tl_2021_24_tract.zip"] == 2
+
+
+def test_load_shp_many(tiger_api, cache_dir):
+    tiger_api.add("/tiger/TIGER2021/TRACT/tl_2021_10_tract.zip", tiger_zip(synthetic_tiger(st_fips="10"), "tl_2021_10_tract"))
+    done = []
+    gdf = load_shp_many(
+        year=2021,
+        states=["24", "10"],
+        geom="tracts",
+        cache=True,
+        executor="thread",
+        progress=lambda n, total, st_fips: done.append(st_fips),
+    )
+    assert gdf["STATEFP"].tolist() == ["24"] * 8 + ["10"] * 8
+    assert sorted(done) == ["10", "24"]
+    assert [x["st_fips"] for x in gdf.attrs["timings"]] == ["24", "10"]
+
+
+def test_load_shp_many_failures(tiger_api, cache_dir):
+    done = []
+    gdf = load_shp_many(
+        year=2021,
+        states=["74", "24", "24"],  # no file for 74
+        geom="tracts",
+        executor="thread",
+        progress=lambda n, total, st_fips: done.append((n, total)),
+    )
+    assert gdf["STATEFP"].unique().tolist() == ["24"] and len(gdf) == 8
+    assert sorted(done) == [(1, 2), (2, 2)]
+    (failure,) = gdf.attrs["failures"]
+    assert failure["st_fips"] == "74" and isinstance(failure["error"], ShpNotFound)
+    with pytest.raises(ValueError):
+        load_shp_many(year=2021, states=[], geom="tracts", executor="thread")
+
+
+@pytest.mark.parametrize("cache_format", ["shp", "parquet", "feather"])
+def test_county_pushdown(tiger_api, cache_dir, cache_format):
+    co = County(fips="031", name="Montgomery County", state=State(fips="24", abbr="MD", name="Maryland"))
+    for _ in range(2):  # cache miss, then cache hit
+        gdf = load_shp(year=2021, st_fips="24", geom="blocks", cache=True, cache_format=cache_format, county_fips=co.fips)
+        assert gdf["COUNTYFP"].unique().tolist() == ["031"] and len(gdf) == 4
+    df = load_shp(year=2021, st_fips="24", geom="blocks", cache_format=cache_format, county_fips="033", columns=["GEOID"])
+    assert df["GEOID"].str.startswith("24033").all()
+    assert len(co.shp(geom="tracts", year=2021)) == 4
+    for county_fips in ["031' OR '1' = '1", "31", 31]:
+        with pytest.raises(ValueError):
+            load_shp(year=2021, st_fips="24", geom="blocks", cache_format=cache_format, county_fips=county_fips)
@@ -0,0 +1,79 @@
+"""
+tests for topology-preserving simplification of boundary files
+"""
+import os
+import numpy as np
+import pytest
+import shapely
+import geopandas as gpd
+
+from frechet.cache import manager
+from frechet.simplify import simplify_topology, zoom_tolerance
+from frechet.tiger import load_shp
+
+
+def _jagged_grid(k: int = 3, m: int = 40, seed: int = 0) -> gpd.GeoDataFrame:
+    """a k x k grid of cells on a jittered lattice, whose shared edges are densified with small random wiggles"""
+    rng = np.random.default_rng(seed)
+    lattice = np.stack(np.meshgrid(np.arange(k + 1), np.arange(k + 1), indexing="ij"), -1).astype(float)
+    lattice[1:-1, 1:-1] += rng.uniform(-0.2, 0.2, (k - 1, k - 1, 2))
+    edges = {}
+
+    def edge(a, b):
+        key = min(a, b), max(a, b)
+        if key not in edges:
+            p, q = lattice[key[0]], lattice[key[1]]
+            line = p + np.linspace(0, 1, m)[1:-1, None] * (q - p)
+            normal = np.array([p[1] - q[1], q[0] - p[0]]) / np.linalg.norm(q - p)
+            line += normal * rng.uniform(-0.01, 0.01, (m - 2, 1))
+            edges[key] = [tuple(p)] + [tuple(x) for x in line] + [tuple(q)]
+        return edges[key] if key == (a, b) else edges[key][::-1]
+
+    polys = []
+    for i in range(k):
+        for j in range(k):
+            corners = [(i, j), (i + 1, j), (i + 1, j + 1), (i, j + 1)]
+            ring = [pt for a, b in zip(corners, corners[1:] + corners[:1]) for pt in edge(a, b)[:-1]]
+            polys.append(shapely.Polygon(ring))
+    return gpd.GeoDataFrame({"GEOID": [str(i) for i in range(k * k)]}, geometry=polys, crs="EPSG:4269")
+
+
+def test_simplify_topology():
+    gdf = _jagged_grid()
+    simplified = simplify_topology(gdf, tolerance=0.05)
+    assert simplified["GEOID"].tolist() == gdf["GEOID"].tolist()
+    assert simplified.is_valid.all()
+    n_coords = shapely.get_num_coordinates(simplified.geometry.to_numpy()).sum()
+    assert n_coords < shapely.get_num_coordinates(gdf.geometry.to_numpy()).sum() / 10
+    # neighbors still share their borders exactly: no overlaps, and no slivers between them
+    geoms = simplified.geometry.to_numpy()
+    overlaps = shapely.area(shapely.intersection(geoms[:, None], geoms[None, :]))
+    assert np.allclose(overlaps[~np.eye(len(geoms), dtype=bool)], 0)
+    union = simplified.union_all()
+    assert union.geom_type == "Polygon" and len(union.interiors) == 0
+    assert np.isclose(union.area, shapely.area(geoms).sum())
+
+
+def test_load_shp_simplified(tiger_api, cache_dir):
+    with pytest.raises(ValueError):
+        load_shp(year=2021, st_fips="24", geom="tracts", tolerance=0.01, zoom=8)
+    gdf = load_shp(year=2021, st_fips="24", geom="tracts", cache=True, zoom=8)
+    assert len(gdf) == 8
+    level = f"TIGER2021/TRACT/tl_2021_24_tract_s{zoom_tolerance(8):.6g}"
+    assert manager(cache_dir).lookup(level)
+    county = load_shp(year=2021, st_fips="24", geom="tracts", cache=True, zoom=8, county_fips="031")
+    assert set(county["COUNTYFP"]) == {"031"}
+    assert county.geometry.equals(gdf.loc[gdf["COUNTYFP"] == "031"].geometry.reset_index(drop=True))
+    blocks = load_shp(year=2021, st_fips="24", geom="blocks", cache=True, tolerance=0.01, county_fips="033")
+    assert set(blocks["COUNTYFP"]) == {"033"}
+    assert os.path.isdir(os.path.join(cache_dir, "TIGER2021/TABBLOCK20/tl_2021_24_tabblock20_s0.01"))
+    cached = load_shp(year=2021, st_fips="24", geom="blocks", cache=True, tolerance=0.01, county_fips="033")
+    assert cached.drop(columns="geometry").equals(blocks.drop(columns="geometry"))
+    assert tiger_api.hits["/tiger/TIGER2021/TRACT/tl_2021_24_tract.zip"] == 1
+
+
+def test_load_shp_simplified_without_cache_dir(tiger_api, monkeypatch):
+    monkeypatch.setattr("frechet.settings.FRECHET_CACHE_DIR", None, raising=False)
+    with pytest.raises(ValueError, match="FRECHET_CACHE_DIR"):
+        load_shp(year=2021, st_fips="24", geom="tracts", cache=True, zoom=8)
+    assert len(load_shp(year=2021, st_fips="24", geom="tracts", zoom=8)) == 8
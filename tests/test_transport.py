@@ -0,0 +1,51 @@
+"""
+tests for the shared http transport
+"""
+import pytest
+import requests
+
+from frechet import transport
+from frechet.url import CENSUS_API_BASE
+
+
+def test_base_url_rewrite(stand_in):
+    stand_in.add_json("/api/data.json", {"dataset": []})
+    rsp = transport.get(f"{CENSUS_API_BASE}data.json")
+    assert rsp.json() == {"dataset": []}
+
+
+def test_retry_on_transient_status(stand_in):
+    stand_in.add("/api/flaky", status=503)
+    stand_in.add("/api/flaky", status=429, headers={"Retry-After": "0"})
+    stand_in.add("/api/flaky", "ok")
+    rsp = transport.get(f"{CENSUS_API_BASE}flaky")
+    assert rsp.status_code == 200
+    assert stand_in.hits["/api/flaky"] == 3
+
+
+def test_retries_exhausted(stand_in):
+    transport.configure(retries=1)
+    stand_in.add("/api/down", status=500)
+    assert transport.get(f"{CENSUS_API_BASE}down").status_code == 500
+    assert stand_in.hits["/api/down"] == 2
+
+
+def test_no_retry_on_client_error(stand_in):
+    assert transport.get(f"{CENSUS_API_BASE}missing").status_code == 404
+    assert stand_in.hits["/api/missing"] == 1
+
+
+def test_keep_alive(stand_in):
+    stand_in.add("/api/ping", "pong")
+    for _ in range(5):
+        transport.get(f"{CENSUS_API_BASE}ping")
+    assert len(stand_in.connections) == 1
+
+
+def test_connection_error_raised():
+    previous = transport.configure(base_urls={CENSUS_API_BASE: "http://127.0.0.1:9/"}, retries=1, backoff=0.01)
+    try:
+        with pytest.raises(requests.ConnectionError):
+            transport.get(f"{CENSUS_API_BASE}data.json")
+    finally:
+        transport.restore(previous)